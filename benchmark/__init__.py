@@ -0,0 +1,7 @@
+"""
+Offline benchmarks for the content curation pipeline.
+
+corpus.py builds the three databases at a chosen scale, mock_openrouter.py serves OpenRouter-style
+chat completions locally with configurable latency, errors and rate limits, and run_benchmark.py
+runs every stage against them and reports throughput and p50/p99 latency.
+"""
@@ -0,0 +1,298 @@
+"""
+Synthetic corpus generator.
+
+Builds x_com_posts.db, posts_selected.db and user_feedback.db (plus keywords.txt and a user profile)
+with the same schemas the pipeline creates. Text mixes topic words with common words, usernames and
+topics follow a Zipf-like distribution, and engagement metrics are log-normal, so query selectivity
+and row sizes look like scraped data.
+
+    python -m benchmark.corpus --out bench_data --posts 100000
+"""
+
+import os
+import json
+import math
+import random
+import sqlite3
+import argparse
+from itertools import accumulate
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Iterator, Tuple
+
+import selected_posts_db
+
+TOPICS = {
+    "politics": ["election", "congress", "senate", "policy", "president", "vote", "campaign", "debate"],
+    "technology": ["ai", "startup", "software", "chips", "robotics", "cloud", "privacy", "opensource"],
+    "science": ["space", "nasa", "climate", "research", "physics", "biology", "vaccine", "telescope"],
+    "sports": ["football", "basketball", "playoffs", "transfer", "olympics", "coach", "championship", "goal"],
+    "health": ["fitness", "nutrition", "sleep", "running", "wellness", "diet", "meditation", "hospital"],
+    "finance": ["stocks", "crypto", "bitcoin", "inflation", "markets", "earnings", "rates", "economy"],
+    "entertainment": ["movie", "music", "album", "series", "celebrity", "festival", "trailer", "concert"],
+    "travel": ["hiking", "beach", "flights", "mountains", "roadtrip", "camping", "museum", "island"],
+    "design": ["typography", "architecture", "interior", "branding", "illustration", "ux", "fashion", "photography"],
+    "memes": ["meme", "funny", "viral", "reaction", "trend", "joke", "comments", "cats"],
+}
+
+COMMON_WORDS = (
+    "the a to and of in is for on that this with it just we you they be are was have not at what "
+    "new today people now more about so how time year big great really good think know like one all "
+    "best never again still going right week thread look first last here why make see every"
+).split()
+
+FEEDBACK_TYPES = ["like", "dislike", "text"]
+TEXT_FEEDBACK = [
+    "Exactly what I was looking for.",
+    "Not really my thing.",
+    "Too promotional.",
+    "Great perspective, more like this please.",
+    "Too much celebrity gossip.",
+]
+
+def zipf_weights(n: int, s: float = 1.1) -> List[float]:
+    """Weights proportional to 1/rank^s, so a few items are very common and most are rare."""
+    return [1.0 / math.pow(rank, s) for rank in range(1, n + 1)]
+
+class CorpusGenerator:
+    """Generate posts, selected posts and feedback with realistic distributions."""
+    
+    def __init__(self, seed: int = 42, users: int = 5000, days: int = 90):
+        self.random = random.Random(seed)
+        self.topics = list(TOPICS)
+        # Cumulative weights let random.choices pick in O(log n) instead of summing every call
+        self.topic_weights = list(accumulate(zipf_weights(len(self.topics), 0.8)))
+        self.usernames = [f"user_{i:05d}" for i in range(users)]
+        self.user_weights = list(accumulate(zipf_weights(users)))
+        self.end_time = datetime(2025, 3, 1)
+        self.days = days
+    
+    def post_text(self, topic: str) -> str:
+        length = max(3, int(self.random.lognormvariate(2.8, 0.5)))
+        words = []
+        for _ in range(length):
+            if self.random.random() < 0.3:
+                words.append(self.random.choice(TOPICS[topic]))
+            else:
+                words.append(self.random.choice(COMMON_WORDS))
+        return " ".join(words).capitalize()
+    
+    def metrics(self) -> Tuple[int, int, int, int, int]:
+        views = int(self.random.lognormvariate(8, 2))
+        likes = int(views * self.random.betavariate(1, 40))
+        return (
+            views,
+            int(likes * self.random.betavariate(1, 8)),
+            int(likes * self.random.betavariate(1, 5)),
+            likes,
+            int(likes * self.random.betavariate(1, 10)),
+        )
+    
+    def posts(self, count: int) -> Iterator[Tuple]:
+        """Yield rows for the posts table."""
+        for i in range(1, count + 1):
+            topic = self.random.choices(self.topics, cum_weights=self.topic_weights)[0]
+            username = self.random.choices(self.usernames, cum_weights=self.user_weights)[0]
+            keywords = self.random.sample(TOPICS[topic], self.random.randint(3, 5))
+            scraped_at = self.end_time - timedelta(seconds=self.random.randint(0, self.days * 86400))
+            views, comments, retweets, likes, saves = self.metrics()
+            # About 10% of posts haven't been ranked yet
+            ranking = None if self.random.random() < 0.1 else max(0, min(100, int(self.random.gauss(50, 20))))
+            
+            yield (
+                self.post_text(topic),
+                f"https://x.com/{username}/status/{10**15 + i}",
+                username,
+                None,
+                views, comments, retweets, likes, saves,
+                scraped_at.strftime("%b %d"),
+                scraped_at.strftime("%Y-%m-%d %H:%M:%S"),
+                json.dumps(keywords),
+                ranking,
+            )
+
+def insert_batches(cursor: sqlite3.Cursor, query: str, rows: Iterator[Tuple], batch_size: int = 10000) -> int:
+    """Insert rows in batches so memory stays flat at any scale."""
+    total = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            cursor.executemany(query, batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        cursor.executemany(query, batch)
+        total += len(batch)
+    return total
+
+def build_posts_db(generator: CorpusGenerator, db_file: str, count: int):
+    """Build x_com_posts.db with the posts and keywords tables."""
+    conn = sqlite3.connect(db_file)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    cursor = conn.cursor()
+    
+    cursor.execute('''CREATE TABLE IF NOT EXISTS posts (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        post_text TEXT,
+                        post_url TEXT,
+                        username TEXT,
+                        image_url TEXT,
+                        views INTEGER,
+                        comments INTEGER,
+                        retweets INTEGER,
+                        likes INTEGER,
+                        saves INTEGER,
+                        post_time TEXT,
+                        scraped_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        keywords TEXT,
+                        user_ranking INTEGER)''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS keywords (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        keyword TEXT UNIQUE,
+                        frequency INTEGER DEFAULT 1,
+                        first_seen_at DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+    
+    keyword_counts = Counter()
+    
+    def counted_posts():
+        for row in generator.posts(count):
+            keyword_counts.update(json.loads(row[11]))
+            yield row
+    
+    insert_batches(cursor, '''
+        INSERT INTO posts (post_text, post_url, username, image_url, views, comments, retweets, likes,
+                           saves, post_time, scraped_at, keywords, user_ranking)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', counted_posts())
+    
+    cursor.executemany(
+        "INSERT INTO keywords (keyword, frequency) VALUES (?, ?)",
+        keyword_counts.most_common()
+    )
+    
+    conn.commit()
+    conn.close()
+    return keyword_counts
+
+def build_selected_db(generator: CorpusGenerator, posts_db: str, db_file: str, count: int, queries: int):
+    """Build posts_selected.db by selecting a sample of posts for a few queries."""
+    source = sqlite3.connect(posts_db)
+    source.row_factory = sqlite3.Row
+    total_posts = source.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+    
+    conn = sqlite3.connect(db_file)
+    selected_posts_db.setup_selected_posts(conn)
+    cursor = conn.cursor()
+    
+    query_texts = [f"latest on {topic}" for topic in generator.topics[:max(1, queries)]]
+    query_ids = []
+    for query in query_texts:
+        cursor.execute("INSERT INTO queries (query) VALUES (?)", (query,))
+        query_ids.append(cursor.lastrowid)
+    
+    def result_rows():
+        ranks = Counter()
+        for _ in range(count):
+            post_id = generator.random.randint(1, max(1, total_posts))
+            if source.execute("SELECT 1 FROM posts WHERE id = ?", (post_id,)).fetchone() is None:
+                continue
+            matching_keyword_count = generator.random.randint(1, 3)
+            score = round(generator.random.uniform(0, 100), 2)
+            query_id = generator.random.choice(query_ids)
+            ranks[query_id] += 1
+            yield (query_id, post_id, ranks[query_id], score, matching_keyword_count)
+    
+    insert_batches(cursor, '''
+        INSERT INTO query_results (query_id, post_id, rank, score, matching_keyword_count)
+        VALUES (?, ?, ?, ?, ?)
+    ''', result_rows())
+    
+    # Each selected post is stored once, copied from the posts database
+    source_columns = [column[1] for column in source.execute("PRAGMA table_info(posts)").fetchall()]
+    columns = ", ".join(column for column in selected_posts_db.POST_COLUMNS if column in source_columns)
+    cursor.execute("ATTACH DATABASE ? AS source", (posts_db,))
+    cursor.execute(f'''
+        INSERT OR IGNORE INTO result_posts (id, {columns})
+        SELECT id, {columns} FROM source.posts WHERE id IN (SELECT post_id FROM query_results)
+    ''')
+    conn.commit()
+    cursor.execute("DETACH DATABASE source")
+    
+    conn.close()
+    source.close()
+
+def build_feedback_db(generator: CorpusGenerator, selected_db: str, db_file: str, count: int):
+    """Build user_feedback.db with feedback on selected posts (60% like, 30% dislike, 10% text)."""
+    selected = sqlite3.connect(selected_db)
+    total_selected = selected.execute("SELECT COUNT(*) FROM selected_posts").fetchone()[0]
+    selected.close()
+    
+    conn = sqlite3.connect(db_file)
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_feedback (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            post_id INTEGER,
+            feedback_type TEXT,
+            text_feedback TEXT,
+            feedback_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''')
+    
+    def feedback_rows():
+        for _ in range(count):
+            feedback_type = generator.random.choices(FEEDBACK_TYPES, [0.6, 0.3, 0.1])[0]
+            text = generator.random.choice(TEXT_FEEDBACK) if feedback_type == "text" else None
+            yield (generator.random.randint(1, max(1, total_selected)), feedback_type, text)
+    
+    insert_batches(cursor, "INSERT INTO user_feedback (post_id, feedback_type, text_feedback) VALUES (?, ?, ?)", feedback_rows())
+    
+    conn.commit()
+    conn.close()
+
+def build_corpus(out_dir: str, posts: int = 10000, selected: int = 1000, feedback: int = 200,
+                 queries: int = 5, seed: int = 42) -> Dict[str, Any]:
+    """
+    Build a complete benchmark corpus in out_dir, replacing any previous one.
+    
+    Returns:
+        The sizes of the generated data
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    for name in ("x_com_posts.db", "posts_selected.db", "user_feedback.db"):
+        path = os.path.join(out_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+    
+    generator = CorpusGenerator(seed)
+    posts_db = os.path.join(out_dir, "x_com_posts.db")
+    selected_db = os.path.join(out_dir, "posts_selected.db")
+    
+    keyword_counts = build_posts_db(generator, posts_db, posts)
+    build_selected_db(generator, posts_db, selected_db, selected, queries)
+    build_feedback_db(generator, selected_db, os.path.join(out_dir, "user_feedback.db"), feedback)
+    
+    # keywords.txt as export_keywords.py would write it, most frequent first
+    with open(os.path.join(out_dir, "keywords.txt"), 'w', encoding='utf-8') as f:
+        f.write("\n".join(keyword for keyword, _ in keyword_counts.most_common()) + "\n")
+    
+    with open(os.path.join(out_dir, "user_profile.txt"), 'w', encoding='utf-8') as f:
+        f.write("# User Profile: Benchmark User\n\n## Interests\n- technology\n- science\n- travel\n\n"
+                "## Content Preferences\n### Likes\n- ai\n- space\n- hiking\n\n### Doesn't Like\n- celebrity gossip\n")
+    
+    return {"posts": posts, "selected_posts": selected, "feedback": feedback, "keywords": len(keyword_counts)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a synthetic benchmark corpus.")
+    parser.add_argument("--out", default="bench_data", help="Output directory")
+    parser.add_argument("--posts", type=int, default=10000, help="Number of posts (10k to 10M)")
+    parser.add_argument("--selected", type=int, default=1000, help="Number of selected posts")
+    parser.add_argument("--feedback", type=int, default=200, help="Number of feedback entries")
+    parser.add_argument("--queries", type=int, default=5, help="Number of distinct queries")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    
+    args = parser.parse_args()
+    
+    sizes = build_corpus(args.out, args.posts, args.selected, args.feedback, args.queries, args.seed)
+    print(f"Built corpus in {args.out}: {sizes}")
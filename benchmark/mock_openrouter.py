@@ -0,0 +1,202 @@
+"""
+Local mock of the OpenRouter chat completions endpoint.
+
+Replies are chosen from the system prompt so every stage gets an answer it can parse (a JSON
+keyword array, a ranking number, LIKE/PASS, a sentiment object or a Markdown profile). Latency,
+the share of failed requests and a requests-per-minute limit are configurable, and every reply
+carries a usage block with token counts estimated from the text length.
+
+    python -m benchmark.mock_openrouter --port 5055 --latency-ms 300 --error-rate 0.02 --rpm 600
+
+Point the pipeline at it with OPENROUTER_API_URL=http://127.0.0.1:5055/api/v1/chat/completions
+"""
+
+import re
+import json
+import time
+import random
+import threading
+import argparse
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Any, Optional
+
+from benchmark.corpus import TOPICS
+
+ALL_TOPIC_WORDS = [word for words in TOPICS.values() for word in words]
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)."""
+    return max(1, len(text) // 4)
+
+class MockSettings:
+    """Behaviour of the mock server, shared by all request handlers."""
+    
+    def __init__(self, latency_ms: float = 200, jitter_ms: float = 50, error_rate: float = 0.0,
+                 rpm: Optional[int] = None, seed: int = 42):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rpm = rpm
+        self.random = random.Random(seed)
+        self.request_times = deque()
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0}
+    
+    def delay(self) -> float:
+        with self.lock:
+            return max(0.0, self.random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+    
+    def should_fail(self) -> bool:
+        with self.lock:
+            return self.random.random() < self.error_rate
+    
+    def retry_after(self) -> Optional[float]:
+        """Record a request and return the seconds to wait if it is over the rate limit."""
+        now = time.time()
+        with self.lock:
+            self.stats["requests"] += 1
+            if not self.rpm:
+                return None
+            while self.request_times and now - self.request_times[0] >= 60:
+                self.request_times.popleft()
+            if len(self.request_times) >= self.rpm:
+                return 60 - (now - self.request_times[0])
+            self.request_times.append(now)
+            return None
+
+def mock_reply(messages: List[Dict[str, Any]], rng: random.Random) -> str:
+    """Build a reply the calling stage can parse, based on its system prompt."""
+    system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+    user = next((m.get("content", "") for m in messages if m.get("role") == "user"), "")
+    words = [word for word in user.lower().split() if word.isalpha() and len(word) > 3]
+    
+    if "keyword extraction assistant" in system:
+        return json.dumps(rng.sample(words, min(len(words), rng.randint(3, 5))) or ["general"])
+    if "post ranking assistant" in system:
+        return str(max(0, min(100, int(rng.gauss(55, 20)))))
+    if "keyword matching assistant" in system:
+        # Prefer topic words that appear in the prompt's keyword list
+        available = [word for word in ALL_TOPIC_WORDS if word in user.lower()] or ALL_TOPIC_WORDS
+        return json.dumps(rng.sample(available, min(len(available), 3)))
+    if "clone of a specific user" in system:
+        batch = re.search(r"given (\d+) numbered posts", system)
+        if batch:
+            return json.dumps([rng.choice(["LIKE", "PASS"]) for _ in range(int(batch.group(1)))])
+        return rng.choice(["LIKE", "PASS"])
+    if "sentiment analysis assistant" in system:
+        score = rng.randint(0, 100)
+        sentiment = "positive" if score > 60 else "negative" if score < 40 else "mixed"
+        return json.dumps({
+            "summary": "People are discussing the topic with a mix of news and opinions.",
+            "sentiment": sentiment,
+            "sentiment_score": score,
+            "key_points": ["Recent news drives most posts", "Opinions are split", "Engagement is high"]
+        })
+    if "JSON array of edits" in system:
+        return json.dumps([{"action": "add", "section": "Likes", "item": rng.choice(ALL_TOPIC_WORDS)}])
+    if "user profiling assistant" in system:
+        return ("# User Profile: Benchmark User\n\n## Interests\n- technology\n- science\n\n"
+                "## Content Preferences\n### Likes\n- ai\n- space\n\n### Doesn't Like\n- celebrity gossip\n")
+    return "OK"
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Handle chat completion requests."""
+    
+    settings = MockSettings()
+    
+    def send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+    
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": f"Unknown path: {self.path}"}})
+            return
+        
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            data = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self.send_json(400, {"error": {"message": "Invalid JSON"}})
+            return
+        
+        settings = self.settings
+        wait = settings.retry_after()
+        if wait is not None:
+            with settings.lock:
+                settings.stats["rate_limited"] += 1
+            self.send_json(429, {"error": {"message": "Rate limit exceeded"}}, {"Retry-After": str(max(1, int(wait + 0.5)))})
+            return
+        
+        time.sleep(settings.delay())
+        
+        if settings.should_fail():
+            with settings.lock:
+                settings.stats["errors"] += 1
+            self.send_json(500, {"error": {"message": "Mock upstream error"}})
+            return
+        
+        messages = data.get("messages", [])
+        with settings.lock:
+            content = mock_reply(messages, settings.random)
+        prompt_tokens = sum(estimate_tokens(str(m.get("content", ""))) for m in messages)
+        completion_tokens = estimate_tokens(content)
+        
+        self.send_json(200, {
+            "id": f"mock-{time.time_ns()}",
+            "model": data.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        })
+    
+    def log_message(self, format, *args):
+        pass
+
+def start_mock_server(settings: MockSettings, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """
+    Start the mock server on a background thread.
+    
+    Returns:
+        The running server; its URL is url_for(server) and it stops with server.shutdown()
+    """
+    handler = type("BoundMockHandler", (MockHandler,), {"settings": settings})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def url_for(server: ThreadingHTTPServer) -> str:
+    """Get the chat completions URL of a running mock server."""
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/api/v1/chat/completions"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a mock OpenRouter server for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to listen on")
+    parser.add_argument("--port", type=int, default=5055, help="Port to listen on")
+    parser.add_argument("--latency-ms", type=float, default=200, help="Mean response latency in milliseconds")
+    parser.add_argument("--jitter-ms", type=float, default=50, help="Standard deviation of the latency in milliseconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with HTTP 500")
+    parser.add_argument("--rpm", type=int, help="Requests per minute before answering HTTP 429")
+    
+    args = parser.parse_args()
+    
+    settings = MockSettings(args.latency_ms, args.jitter_ms, args.error_rate, args.rpm)
+    server = ThreadingHTTPServer((args.host, args.port), type("BoundMockHandler", (MockHandler,), {"settings": settings}))
+    print(f"Mock OpenRouter listening on http://{args.host}:{args.port}/api/v1/chat/completions")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Shutting down mock server... {settings.stats}")
+        server.server_close()
@@ -0,0 +1,225 @@
+"""
+Run every pipeline stage against a synthetic corpus and a mock OpenRouter server.
+
+    python -m benchmark.run_benchmark --posts 100000 --items 200 --latency-ms 300 --error-rate 0.02
+
+For each stage the report shows the items processed, errors, throughput and p50/p99 latency per
+item, and how many upstream errors the mock server returned while it ran. Transient upstream errors
+are retried by the OpenRouter client, so only the calls that still failed count as stage errors.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable, Optional
+
+from benchmark.corpus import build_corpus, TOPICS
+from benchmark.mock_openrouter import MockSettings, start_mock_server, url_for
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGES = ["keywords", "ranking", "discover", "feed", "validation", "validation_batch", "sentiment", "profile"]
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of a list of values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(-(-pct * len(ordered) // 100)))
+    return ordered[rank - 1]
+
+def time_stage(name: str, items: List[Any], call: Callable[[Any], Any], settings: MockSettings,
+               workers: int = 1, quiet: bool = True) -> Dict[str, Any]:
+    """
+    Call a stage once per item and measure it.
+    
+    Returns:
+        The stage's items, errors, items per second and p50/p99 latency in milliseconds
+    """
+    errors_before = settings.stats["errors"] + settings.stats["rate_limited"]
+    latencies = []
+    errors = 0
+    
+    def run_one(item):
+        started = time.perf_counter()
+        try:
+            call(item)
+            return time.perf_counter() - started, None
+        except Exception as e:
+            return time.perf_counter() - started, e
+    
+    # The pipeline modules print a line per item; keep the report readable
+    output = io.StringIO() if quiet else sys.stdout
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for latency, error in executor.map(run_one, items):
+                latencies.append(latency)
+                if error is not None:
+                    errors += 1
+    elapsed = time.perf_counter() - started
+    
+    return {
+        "stage": name,
+        "items": len(items),
+        "errors": errors,
+        "upstream_errors": settings.stats["errors"] + settings.stats["rate_limited"] - errors_before,
+        "seconds": round(elapsed, 3),
+        "items_per_second": round(len(items) / elapsed, 2) if elapsed > 0 else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+    }
+
+def sample_posts(db_file: str, count: int, seed: int) -> List[Dict[str, Any]]:
+    """Pick random posts from the corpus to feed the per-post stages."""
+    conn = sqlite3.connect(db_file)
+    conn.row_factory = sqlite3.Row
+    total = conn.execute("SELECT MAX(id) FROM posts").fetchone()[0] or 0
+    rng = random.Random(seed)
+    ids = [rng.randint(1, total) for _ in range(count)] if total else []
+    posts = [dict(conn.execute("SELECT * FROM posts WHERE id = ?", (post_id,)).fetchone()) for post_id in ids]
+    conn.close()
+    return posts
+
+def run_benchmark(workdir: str, posts: int, items: int, stages: List[str], settings: MockSettings,
+                  workers: int = 1, rebuild: bool = True, seed: int = 42) -> List[Dict[str, Any]]:
+    """Build the corpus, start the mock server and time each requested stage."""
+    workdir = os.path.abspath(workdir)
+    if rebuild or not os.path.exists(os.path.join(workdir, "x_com_posts.db")):
+        started = time.perf_counter()
+        sizes = build_corpus(workdir, posts=posts, selected=max(items * 5, 1000), feedback=max(items, 200),
+                             queries=len(TOPICS), seed=seed)
+        print(f"Built corpus in {workdir} in {time.perf_counter() - started:.1f}s: {sizes}")
+    
+    server = start_mock_server(settings)
+    
+    # openrouter_client reads these once at import, so set them before importing the stages
+    os.environ["OPENROUTER_API_URL"] = url_for(server)
+    os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+    os.environ.pop("USER_PROFILE_CONTENT", None)
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    
+    # The stages read their databases and profile from the working directory
+    previous_dir = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import generate_keywords
+        import ranking_llm
+        import user_posts_output
+        import user_bot_verification
+        import sentiment_analysis
+        import dynamic_user_profile
+        import feed_query
+        
+        sample = sample_posts("x_com_posts.db", items, seed)
+        with open("user_profile.txt", "r", encoding="utf-8") as f:
+            profile = f.read()
+        with open("keywords.txt", "r", encoding="utf-8") as f:
+            keywords = [line.strip() for line in f if line.strip()]
+        queries = [f"latest on {topic}" for topic in TOPICS]
+        
+        def discover(query):
+            matched = user_posts_output.keyword_finder_llm(query, keywords, profile)
+            return user_posts_output.rank_posts(user_posts_output.get_posts_by_keywords(matched, "x_com_posts.db"))
+        
+        def validate(post):
+            validation = user_bot_verification.llm_validate_post(profile, post, queries[0])
+            if validation == user_bot_verification.VALIDATION_FAILED:
+                raise RuntimeError(f"Validation of post {post['id']} failed")
+        
+        def validate_batch(batch):
+            decisions = user_bot_verification.validate_posts(profile, batch, max_workers=1)
+            if user_bot_verification.VALIDATION_FAILED in decisions.values():
+                raise RuntimeError("Batch validation failed")
+        
+        batch_size = user_bot_verification.BATCH_SIZE
+        validation_batches = [[dict(post, query=queries[0]) for post in sample[start:start + batch_size]]
+                              for start in range(0, len(sample), batch_size)]
+        
+        feed_conn = sqlite3.connect("x_com_posts.db", check_same_thread=False)
+        feed_conn.row_factory = sqlite3.Row
+        feed_query.setup_feed_indexes(feed_conn)
+        feed_state = {"cursor": None}
+        
+        def feed_page(_):
+            # Follow next_cursor so later items read deeper pages
+            page = feed_query.get_feed_page(feed_conn, 20, feed_state["cursor"])
+            feed_state["cursor"] = page["next_cursor"]
+        
+        selected = sentiment_analysis.get_selected_posts if "sentiment" in stages else None
+        feedback = None
+        if "profile" in stages:
+            with contextlib.redirect_stdout(io.StringIO()):
+                feedback = dynamic_user_profile.format_feedback_for_llm(
+                    dynamic_user_profile.get_user_feedback("user_feedback.db", new_only=False))
+        
+        stage_calls = {
+            "keywords": (sample, lambda post: generate_keywords.request_keywords(post["post_text"])),
+            "ranking": (sample, lambda post: ranking_llm.call_openrouter_for_ranking(profile, post)),
+            "discover": ([queries[i % len(queries)] for i in range(max(1, items // 10))], discover),
+            "feed": (list(range(items)), feed_page),
+            "validation": (sample, validate),
+            "validation_batch": (validation_batches, validate_batch),
+            "sentiment": (queries, lambda query: sentiment_analysis.analyze_sentiment(selected(query, "posts_selected.db"), query)),
+            "profile": ([None] * max(1, items // 20), lambda _: dynamic_user_profile.generate_dynamic_profile(profile, feedback)),
+        }
+        
+        results = []
+        for stage in stages:
+            stage_items, call = stage_calls[stage]
+            # The feed is read by one client at a time so its cursor chain stays in order
+            result = time_stage(stage, stage_items, call, settings, 1 if stage == "feed" else workers)
+            results.append(result)
+            print(f"Finished {stage}: {result['items']} items in {result['seconds']}s")
+        
+        feed_conn.close()
+        return results
+    finally:
+        os.chdir(previous_dir)
+        server.shutdown()
+        server.server_close()
+
+def print_report(results: List[Dict[str, Any]]):
+    """Print the results as a table."""
+    print(f"\n{'stage':<12}{'items':>8}{'errors':>8}{'upstream':>10}{'items/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for r in results:
+        print(f"{r['stage']:<12}{r['items']:>8}{r['errors']:>8}{r['upstream_errors']:>10}"
+              f"{r['items_per_second'] or 0:>10}{r['p50_ms'] or 0:>10}{r['p99_ms'] or 0:>10}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on a synthetic corpus.")
+    parser.add_argument("--workdir", default="bench_data", help="Directory for the corpus and stage outputs")
+    parser.add_argument("--posts", type=int, default=10000, help="Number of posts in the corpus (10k to 10M)")
+    parser.add_argument("--items", type=int, default=100, help="Number of items to run through each per-post stage")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma-separated stages to run ({', '.join(STAGES)})")
+    parser.add_argument("--workers", type=int, default=1, help="Concurrent calls per stage")
+    parser.add_argument("--latency-ms", type=float, default=200, help="Mean mock LLM latency in milliseconds")
+    parser.add_argument("--jitter-ms", type=float, default=50, help="Standard deviation of the mock latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of mock requests that fail with HTTP 500")
+    parser.add_argument("--rpm", type=int, help="Mock requests per minute before answering HTTP 429")
+    parser.add_argument("--reuse", action="store_true", help="Reuse an existing corpus in the workdir")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    
+    args = parser.parse_args()
+    
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(unknown)}")
+    
+    settings = MockSettings(args.latency_ms, args.jitter_ms, args.error_rate, args.rpm, args.seed)
+    results = run_benchmark(args.workdir, args.posts, args.items, stages, settings, args.workers, not args.reuse, args.seed)
+    print_report(results)
+    
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+        print(f"\nResults written to {args.json}")
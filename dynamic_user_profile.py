@@ -1,22 +1,17 @@
 import sqlite3
 import json
 import os
-import requests
+import sys
+import threading
 from dotenv import load_dotenv
 from typing import List, Dict, Any, Optional
+from openrouter_client import chat_completion
 from datetime import datetime
+import feedback_preferences
 
 # Load environment variables
 load_dotenv()
 
-# Get OpenRouter API key from environment variable or prompt user
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-if not OPENROUTER_API_KEY:
-    OPENROUTER_API_KEY = input("Enter your OpenRouter API key: ")
-
-# OpenRouter API endpoint
-OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
-
 # Model to use (default to GPT-4o)
 MODEL = os.getenv("OPENROUTER_MODEL", "openai/gpt-4o")
 
@@ -48,45 +43,32 @@ def load_base_profile(profile_file='user_profile.txt'):
         print(f"Current working directory: {os.getcwd()}")
         return ""
 
-def get_last_processed_timestamp(timestamp_file='last_processed_feedback.txt'):
-    """Get the timestamp of the last processed feedback."""
+def get_processed_feedback_id(conn, timestamp_file='last_processed_feedback.txt'):
+    """
+    Get the ID of the newest feedback entry the last regeneration read.
+    
+    The watermark is kept in the profile_state table of the feedback database and only moves once
+    a regenerated profile is saved. A timestamp left in last_processed_feedback.txt by an older
+    version is converted to a feedback ID until then.
+    """
+    feedback_preferences.setup_preference_tables(conn)
+    processed_id = feedback_preferences.get_state(conn, "processed_feedback_id")
+    if processed_id:
+        return int(processed_id)
+    
+    timestamp_path = get_absolute_path(timestamp_file)
+    if not os.path.exists(timestamp_path):
+        return 0
+    
     try:
-        # Get absolute path for timestamp file
-        timestamp_path = get_absolute_path(timestamp_file)
-        
-        # If file doesn't exist in any of the checked locations, create the directory for it
-        if not os.path.exists(os.path.dirname(timestamp_path)):
-            os.makedirs(os.path.dirname(timestamp_path), exist_ok=True)
-            
-        # Try to read the timestamp
-        if os.path.exists(timestamp_path):
-            with open(timestamp_path, 'r') as f:
-                timestamp = f.read().strip()
-                print(f"Last processed timestamp: {timestamp}")
-                return timestamp
-        else:
-            # If file doesn't exist, return a very old timestamp
-            print(f"No timestamp file found at {timestamp_path}, using default timestamp")
-            return "1970-01-01 00:00:00"
-    except Exception as e:
+        with open(timestamp_path, 'r') as f:
+            timestamp = f.read().strip()
+        row = conn.execute("SELECT MAX(id) FROM user_feedback WHERE feedback_timestamp <= ?", (timestamp,)).fetchone()
+        print(f"Last processed timestamp {timestamp} from {timestamp_path} is feedback ID {row[0] or 0}")
+        return row[0] or 0
+    except (OSError, sqlite3.Error) as e:
         print(f"Error reading timestamp file: {e}")
-        return "1970-01-01 00:00:00"
-
-def save_last_processed_timestamp(timestamp, timestamp_file='last_processed_feedback.txt'):
-    """Save the timestamp of the last processed feedback."""
-    try:
-        # Get absolute path for timestamp file
-        timestamp_path = get_absolute_path(timestamp_file)
-        
-        # Create directory if it doesn't exist
-        os.makedirs(os.path.dirname(timestamp_path) or '.', exist_ok=True)
-        
-        # Save the timestamp
-        with open(timestamp_path, 'w') as f:
-            f.write(timestamp)
-        print(f"Saved last processed timestamp: {timestamp} to {timestamp_path}")
-    except Exception as e:
-        print(f"Error saving timestamp: {e}")
+        return 0
 
 def get_absolute_path(file_path):
     """Get absolute path for a file, checking multiple locations."""
@@ -129,25 +111,26 @@ def get_user_feedback(db_file='user_feedback.db', new_only=True):
         print(f"Using feedback database: {feedback_db_path}")
         print(f"Using posts database: {posts_db_path}")
         
-        # Get the last processed timestamp if new_only is True
-        last_timestamp = get_last_processed_timestamp() if new_only else "1970-01-01 00:00:00"
-        
         # Connect to the database
         conn = sqlite3.connect(feedback_db_path)
+        
+        # Get the last processed feedback ID if new_only is True
+        processed_id = get_processed_feedback_id(conn) if new_only else 0
+        
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
         # Attach the posts database
         cursor.execute(f"ATTACH DATABASE '{posts_db_path}' AS posts_db")
         
-        # Get feedback newer than the last processed timestamp if new_only is True
+        # Get feedback newer than the last processed feedback if new_only is True
         cursor.execute("""
             SELECT uf.*, sp.post_text, sp.username, sp.keywords, sp.query
             FROM user_feedback uf
             JOIN posts_db.selected_posts sp ON uf.post_id = sp.id
-            WHERE uf.feedback_timestamp > ?
+            WHERE uf.id > ?
             ORDER BY uf.feedback_timestamp DESC
-        """, (last_timestamp,))
+        """, (processed_id,))
         feedback = [dict(row) for row in cursor.fetchall()]
         
         # Detach the posts database
@@ -155,11 +138,7 @@ def get_user_feedback(db_file='user_feedback.db', new_only=True):
         
         conn.close()
         
-        # If we got feedback, save the most recent timestamp
-        if feedback and new_only:
-            most_recent_timestamp = feedback[0]['feedback_timestamp']
-            save_last_processed_timestamp(most_recent_timestamp)
-            
+        # The watermark is only moved by main() once the profile made from this feedback is saved
         return feedback
         
     except sqlite3.Error as e:
@@ -243,13 +222,9 @@ def generate_dynamic_profile(base_profile, feedback_data):
         feedback_data: Formatted user feedback data
         
     Returns:
-        The dynamic user profile text
+        The dynamic user profile text. Raises if the LLM call fails, so a failed call
+        never overwrites the current profile with the base profile.
     """
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
     data = {
         "model": MODEL,
         "messages": [
@@ -287,18 +262,27 @@ Please generate an updated dynamic user profile that reflects the user's evolvin
         ]
     }
     
+    result = chat_completion(data, stage="profile")
+    dynamic_profile = result["choices"][0]["message"]["content"]
+    
+    return dynamic_profile
+
+def write_file_atomically(path, content):
+    """
+    Write a file so readers see either the old or the new content, never a partly written file.
+    
+    The content goes to a temporary file in the same directory, which then replaces the file.
+    """
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
     try:
-        response = requests.post(OPENROUTER_API_URL, headers=headers, json=data)
-        response.raise_for_status()
-        
-        result = response.json()
-        dynamic_profile = result["choices"][0]["message"]["content"]
-        
-        return dynamic_profile
-            
-    except Exception as e:
-        print(f"Error calling OpenRouter API: {e}")
-        return base_profile  # Return the base profile if there's an error
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
 
 def save_dynamic_profile(profile, output_file='dynamic_user_profile.md'):
     """Save the dynamic user profile to a file."""
@@ -315,23 +299,211 @@ def save_dynamic_profile(profile, output_file='dynamic_user_profile.md'):
         os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
         
         # Save the profile
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(profile)
+        write_file_atomically(output_path, profile)
         print(f"Successfully saved dynamic user profile to {output_path}")
         return True
     except Exception as e:
         print(f"Error saving dynamic user profile: {e}")
         return False
 
+def save_preference_vector(output_file=feedback_preferences.PREFERENCE_VECTOR_FILE):
+    """Save the keyword and author affinities learned from the counted feedback next to the profile."""
+    try:
+        vector = feedback_preferences.compute_preference_vector()
+        output_path = get_absolute_path(output_file)
+        if not os.path.exists(os.path.dirname(output_path)):
+            script_dir = os.path.dirname(os.path.abspath(__file__))
+            output_path = os.path.join(script_dir, output_file)
+        
+        write_file_atomically(output_path, json.dumps(vector, indent=2, sort_keys=True))
+        print(f"Saved preference vector ({len(vector['keywords'])} keywords, {len(vector['authors'])} authors) to {output_path}")
+        return True
+    except (sqlite3.Error, OSError) as e:
+        print(f"Error saving preference vector: {e}")
+        return False
+
+def parse_profile_edits(content):
+    """Parse a reply into a list of {"action", "section", "item"} edits, raising ValueError if it isn't one."""
+    text = content.strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+    
+    try:
+        edits = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Profile edits are not JSON: {e}")
+    
+    if not isinstance(edits, list):
+        raise ValueError("Profile edits are not a list")
+    return [edit for edit in edits
+            if isinstance(edit, dict) and edit.get("action") in ("add", "remove") and edit.get("section") and edit.get("item")]
+
+def request_profile_edits(profile, changes, text_feedback):
+    """
+    Ask the LLM how the preferences counted since the last rewrite should change the profile.
+    
+    Args:
+        profile: The current dynamic profile
+        changes: Keywords and authors whose preference moved, from feedback_preferences.get_pending_changes
+        text_feedback: Text feedback received since the last rewrite
+        
+    Returns:
+        A list of edits to apply with apply_profile_edits. Raises if the LLM call fails or
+        its reply isn't a list of edits.
+    """
+    counts = "\n".join(
+        f"- {change['kind']} \"{change['name']}\": +{change['pending_likes']} likes, +{change['pending_dislikes']} dislikes "
+        f"since the last update ({change['likes']} likes, {change['dislikes']} dislikes in total)"
+        for change in changes
+    )
+    comments = "\n".join(f"- On a post by {fb.get('username') or 'unknown'}: {fb.get('text_feedback')}" for fb in text_feedback)
+    
+    data = {
+        "model": MODEL,
+        "messages": [
+            {
+                "role": "system",
+                "content": """You are a user profiling assistant. You maintain a user's Markdown profile and update it
+                with small edits as their feedback on content accumulates, instead of rewriting it.
+                
+                You are given the current profile and how the user's likes and dislikes of keywords and authors
+                have changed since it was last updated. Decide which items to add to or remove from the profile's
+                sections (e.g. "Interests", "Likes", "Doesn't Like"), keeping everything that is still accurate.
+                
+                Return ONLY a JSON array of edits, with no additional text or explanation:
+                [
+                    {"action": "add", "section": "Likes", "item": "text of the new bullet"},
+                    {"action": "remove", "section": "Doesn't Like", "item": "text of the bullet to remove"}
+                ]
+                Return [] if the profile doesn't need to change.
+                """
+            },
+            {
+                "role": "user",
+                "content": f"""Here is the current user profile:
+
+{profile}
+
+Preference changes since the last update:
+{counts or "- none"}
+
+Text feedback since the last update:
+{comments or "- none"}
+"""
+            }
+        ]
+    }
+    
+    result = chat_completion(data, stage="profile")
+    return parse_profile_edits(result["choices"][0]["message"]["content"])
+
+def apply_profile_edits(profile, edits):
+    """
+    Apply edits to a Markdown profile.
+    
+    An added item becomes a bullet at the end of its section (a missing section is added at the
+    end of the profile); a removed item deletes the section's bullet with the same text.
+    """
+    lines = profile.rstrip("\n").split("\n")
+    
+    def find_section(name):
+        """Line range (heading, end) of the section with this heading, or None."""
+        for start, line in enumerate(lines):
+            if line.startswith("#") and line.lstrip("#").strip().lower() == name.strip().lower():
+                end = start + 1
+                while end < len(lines) and not lines[end].startswith("#"):
+                    end += 1
+                return start, end
+        return None
+    
+    def bullet_text(line):
+        return line.strip().lstrip("-*").strip().lower()
+    
+    for edit in edits:
+        item = str(edit["item"]).strip()
+        section = find_section(str(edit["section"]))
+        
+        if edit["action"] == "add":
+            if section is None:
+                lines.extend(["", f"### {edit['section']}", f"- {item}"])
+                continue
+            start, end = section
+            if any(bullet_text(line) == item.lower() for line in lines[start + 1:end]):
+                continue
+            
+            # After the section's last non-blank line
+            insert_at = end
+            while insert_at > start + 1 and not lines[insert_at - 1].strip():
+                insert_at -= 1
+            lines.insert(insert_at, f"- {item}")
+        else:
+            start, end = section if section else (0, len(lines))
+            for index in range(end - 1, start, -1):
+                if lines[index].strip().startswith(("-", "*")) and bullet_text(lines[index]) == item.lower():
+                    del lines[index]
+    
+    return "\n".join(lines) + "\n"
+
+def update_profile_incrementally():
+    """
+    Update the dynamic profile from feedback without regenerating it.
+    
+    New feedback is added to per-keyword and per-author preference counts. Only when the counts
+    have drifted past PROFILE_DRIFT_THRESHOLD since the last rewrite is the LLM asked for edits,
+    which are applied to the current dynamic profile. Without a dynamic profile yet, one is
+    generated in full. The preference vector rankers read is refreshed whenever new feedback is counted.
+    
+    Returns True when the profile is up to date, False when an update was due but failed.
+    """
+    try:
+        counted = feedback_preferences.count_new_feedback()
+        print(f"Counted {counted} new feedback entries.")
+        if counted or not os.path.exists(get_absolute_path(feedback_preferences.PREFERENCE_VECTOR_FILE)):
+            save_preference_vector()
+        
+        if not os.path.exists(get_absolute_path('dynamic_user_profile.md')):
+            return main()
+        
+        drift = feedback_preferences.get_drift()
+        if drift < feedback_preferences.DRIFT_THRESHOLD:
+            print(f"Preference drift {drift:g} is below the threshold of {feedback_preferences.DRIFT_THRESHOLD:g}. Keeping the current profile.")
+            return True
+        
+        changes = feedback_preferences.get_pending_changes()
+        text_feedback = feedback_preferences.get_pending_text_feedback()
+    except sqlite3.Error as e:
+        print(f"SQLite error: {e}")
+        return False
+    
+    profile = get_current_dynamic_profile()
+    print(f"Preference drift {drift:g} reached the threshold. Updating the dynamic user profile...")
+    try:
+        edits = request_profile_edits(profile, changes, text_feedback)
+    except Exception as e:
+        print(f"Error calling OpenRouter API: {e}")
+        print("Dynamic user profile update failed. Keeping the current profile.")
+        return False
+    
+    if not save_dynamic_profile(apply_profile_edits(profile, edits)):
+        return False
+    
+    feedback_preferences.reset_pending()
+    print(f"Applied {len(edits)} edits to the dynamic user profile.")
+    return True
+
 def main():
-    """Main function to generate a dynamic user profile."""
+    """
+    Main function to generate a dynamic user profile.
+    
+    Returns True once a profile is saved. When generation fails the current profile is left as it is.
+    """
     print("Starting dynamic user profile generation...")
     
     # Load base profile
     base_profile = load_base_profile()
     if not base_profile:
         print("Failed to load base user profile. Exiting.")
-        return
+        return False
     
     print("Base user profile loaded successfully.")
     
@@ -339,8 +511,7 @@ def main():
     feedback = get_user_feedback()
     if not feedback:
         print("No user feedback found. Using base profile only.")
-        save_dynamic_profile(base_profile)
-        return
+        return save_dynamic_profile(base_profile)
     
     print(f"Found {len(feedback)} feedback entries.")
     
@@ -349,13 +520,29 @@ def main():
     
     # Generate dynamic profile
     print("Generating dynamic user profile...")
-    dynamic_profile = generate_dynamic_profile(base_profile, formatted_feedback)
+    try:
+        dynamic_profile = generate_dynamic_profile(base_profile, formatted_feedback)
+    except Exception as e:
+        print(f"Error calling OpenRouter API: {e}")
+        print("Dynamic user profile generation failed. Keeping the current profile.")
+        return False
     
     # Save dynamic profile
     if save_dynamic_profile(dynamic_profile):
         print("Dynamic user profile generated successfully.")
+        
+        # The regenerated profile reflects the feedback counted so far; the next regeneration
+        # starts after the newest feedback it read
+        try:
+            feedback_preferences.count_new_feedback()
+            feedback_preferences.reset_pending(processed_feedback_id=max(entry['id'] for entry in feedback))
+        except sqlite3.Error as e:
+            print(f"SQLite error updating preference counts: {e}")
+        save_preference_vector()
+        return True
     else:
         print("Failed to save dynamic user profile.")
+        return False
 
 def get_current_dynamic_profile(profile_file='dynamic_user_profile.md'):
     """Get the current dynamic user profile, or generate one if it doesn't exist."""
@@ -371,26 +558,37 @@ def get_current_dynamic_profile(profile_file='dynamic_user_profile.md'):
             return profile
         else:
             print(f"Dynamic user profile file '{profile_path}' not found. Generating new profile...")
-            main()
+            if not main():
+                return None
             return get_current_dynamic_profile(profile_file)
     except Exception as e:
         print(f"Error reading dynamic profile: {e}")
         main()
         return get_current_dynamic_profile(profile_file)
 
-if __name__ == "__main__":
+def run_cli(argv: Optional[List[str]] = None):
+    """Parse command-line arguments and generate the dynamic profile."""
     import argparse
     
     parser = argparse.ArgumentParser(description="Generate a dynamic user profile based on feedback.")
     parser.add_argument("--force", action="store_true", help="Force regeneration of the dynamic profile")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Count new feedback and only edit the profile once preferences have drifted enough")
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     # Get absolute path for dynamic profile file
     profile_path = get_absolute_path('dynamic_user_profile.md')
     
-    if args.force or not os.path.exists(profile_path):
-        main()
+    if args.incremental:
+        if not update_profile_incrementally():
+            sys.exit(1)
+    elif args.force or not os.path.exists(profile_path):
+        if not main():
+            sys.exit(1)
     else:
         print("Dynamic user profile already exists. Use --force to regenerate.")
         print(f"Current profile location: {profile_path}")
+
+if __name__ == "__main__":
+    run_cli()
@@ -67,13 +67,17 @@ def export_keywords(db_file='x_com_posts.db', output_file='keywords.txt'):
     except Exception as e:
         print(f"Error: {e}")
 
-if __name__ == "__main__":
+def run_cli(argv=None):
+    """Parse command-line arguments and export keywords."""
     import argparse
     
     parser = argparse.ArgumentParser(description="Export keywords from the database to a text file.")
     parser.add_argument("--db", default="x_com_posts.db", help="Database file path")
     parser.add_argument("--output", default="keywords.txt", help="Output file path")
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     export_keywords(args.db, args.output)
+
+if __name__ == "__main__":
+    run_cli()
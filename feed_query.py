@@ -0,0 +1,138 @@
+import sqlite3
+import json
+from typing import List, Dict, Any, Optional
+
+from jsonl_export import encode_cursor, decode_cursor
+import tracing
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+def setup_feed_indexes(conn: sqlite3.Connection):
+    """Create the indexes that let feed pages be read in order without sorting the table."""
+    cursor = conn.cursor()
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_posts_feed ON posts(scraped_at DESC, id DESC)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_posts_username ON posts(username, scraped_at DESC, id DESC)")
+    conn.commit()
+
+def parse_keywords(keywords_json: Optional[str]) -> List[str]:
+    """Parse a JSON keywords column, returning [] for empty or invalid values."""
+    if not keywords_json:
+        return []
+    try:
+        keywords = json.loads(keywords_json)
+        return keywords if isinstance(keywords, list) else []
+    except json.JSONDecodeError:
+        return []
+
+def select_posts(conn: sqlite3.Connection, conditions: List[str], params: List[Any], count: int) -> List[sqlite3.Row]:
+    """Select up to count posts matching all conditions, in feed order."""
+    query = "SELECT * FROM posts"
+    if conditions:
+        query += " WHERE " + " AND ".join(f"({condition})" for condition in conditions)
+    query += " ORDER BY scraped_at DESC, id DESC LIMIT ?"
+    
+    with tracing.span("db.select_posts", "db", table="posts") as span:
+        cursor = conn.cursor()
+        cursor.execute(query, params + [count])
+        rows = cursor.fetchall()
+        span.set(rows=len(rows))
+    return rows
+
+def get_feed_page(conn: sqlite3.Connection, limit: int = DEFAULT_PAGE_SIZE, cursor_token: Optional[str] = None,
+                  min_ranking: Optional[int] = None, keyword: Optional[str] = None,
+                  username: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Get one page of the feed, newest posts first.
+    
+    Pages are read with keyset pagination on (scraped_at, id): the cursor holds the sort key of
+    the last post of the previous page, so every page is an index range scan and costs the same
+    no matter how deep it is or how large the table grows.
+    
+    Args:
+        conn: Open database connection
+        limit: Number of posts per page (at most MAX_PAGE_SIZE)
+        cursor_token: next_cursor of the previous page, or None for the first page
+        min_ranking: Only include posts ranked at least this high
+        keyword: Only include posts with a keyword containing this text
+        username: Only include posts from this user
+    
+    Returns:
+        A dictionary with the posts of the page and the next_cursor (None on the last page)
+    """
+    limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    filters = []
+    params: List[Any] = []
+    
+    if min_ranking is not None:
+        filters.append("user_ranking >= ?")
+        params.append(int(min_ranking))
+    
+    if username:
+        filters.append("username = ?")
+        params.append(username)
+    
+    if keyword:
+        # CASE keeps json_each away from rows whose keywords aren't valid JSON
+        filters.append(
+            "CASE WHEN json_valid(keywords) THEN "
+            "EXISTS (SELECT 1 FROM json_each(posts.keywords) WHERE json_each.value LIKE ?) ELSE 0 END"
+        )
+        params.append(f"%{keyword}%")
+    
+    # Fetch one extra row to know whether another page follows
+    count = limit + 1
+    
+    if not cursor_token:
+        rows = select_posts(conn, filters, params, count)
+    else:
+        scraped_at, post_id = decode_cursor(cursor_token)
+        
+        # Posts without scraped_at sort last (SQLite orders NULLs last in DESC order), so they
+        # are read once the posts with a timestamp run out
+        if scraped_at is None:
+            rows = select_posts(conn, filters + ["scraped_at IS NULL AND id < ?"], params + [post_id], count)
+        else:
+            rows = select_posts(conn, filters + ["(scraped_at, id) < (?, ?)"], params + [scraped_at, post_id], count)
+            if len(rows) < count:
+                rows += select_posts(conn, filters + ["scraped_at IS NULL"], params, count - len(rows))
+    
+    posts = []
+    for row in rows[:limit]:
+        post = dict(row)
+        post["keywords"] = parse_keywords(post.get("keywords"))
+        posts.append(post)
+    
+    next_cursor = None
+    if len(rows) > limit:
+        last = posts[-1]
+        next_cursor = encode_cursor(last["scraped_at"], last["id"])
+    
+    return {"posts": posts, "next_cursor": next_cursor}
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Print one page of the feed as JSON.")
+    parser.add_argument("--db", default="x_com_posts.db", help="Database file path")
+    parser.add_argument("--limit", type=int, default=DEFAULT_PAGE_SIZE, help="Number of posts per page")
+    parser.add_argument("--cursor", help="next_cursor of the previous page")
+    parser.add_argument("--min-ranking", type=int, help="Only include posts ranked at least this high")
+    parser.add_argument("--keyword", help="Only include posts with a keyword containing this text")
+    parser.add_argument("--username", help="Only include posts from this user")
+    
+    args = parser.parse_args()
+    
+    try:
+        conn = sqlite3.connect(args.db)
+        conn.row_factory = sqlite3.Row
+        setup_feed_indexes(conn)
+        
+        page = get_feed_page(conn, args.limit, args.cursor, args.min_ranking, args.keyword, args.username)
+        print(json.dumps(page, indent=2, ensure_ascii=False))
+        
+        conn.close()
+    except sqlite3.Error as e:
+        print(f"SQLite error: {e}")
+    except ValueError as e:
+        print(f"Error: {e}")
@@ -0,0 +1,245 @@
+import os
+import json
+import sqlite3
+from typing import List, Dict, Any, Optional, Tuple
+
+from sentiment_lexicon import score_text, label
+
+# Preference counts live in the feedback database, next to the feedback they are counted from
+FEEDBACK_DB = "user_feedback.db"
+POSTS_DB = "posts_selected.db"
+
+# How much the counts must have moved since the last profile rewrite before the LLM rewrites it again:
+# the sum over keywords and authors of |likes - dislikes| counted since then
+DRIFT_THRESHOLD = float(os.getenv("PROFILE_DRIFT_THRESHOLD", "10"))
+
+# The preference vector is saved next to the dynamic profile for rankers that don't read Markdown
+PREFERENCE_VECTOR_FILE = "preference_vector.json"
+
+# Pseudo-count that keeps a keyword or author seen once or twice from getting a full affinity
+AFFINITY_PRIOR = 2
+
+def setup_preference_tables(conn: sqlite3.Connection):
+    """Create the preference_counts and profile_state tables if they don't exist."""
+    cursor = conn.cursor()
+    
+    # Likes and dislikes per keyword and per author; the pending counts are those since the last rewrite
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS preference_counts (
+        kind TEXT,
+        name TEXT,
+        likes INTEGER DEFAULT 0,
+        dislikes INTEGER DEFAULT 0,
+        pending_likes INTEGER DEFAULT 0,
+        pending_dislikes INTEGER DEFAULT 0,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (kind, name)
+    )
+    ''')
+    
+    # Watermarks of the profile updates, as feedback IDs
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS profile_state (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )
+    ''')
+    conn.commit()
+
+def get_state(conn: sqlite3.Connection, key: str, default: str = "") -> str:
+    row = conn.execute("SELECT value FROM profile_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+def set_state(conn: sqlite3.Connection, key: str, value: Any):
+    conn.execute("INSERT OR REPLACE INTO profile_state (key, value) VALUES (?, ?)", (key, str(value)))
+
+def feedback_polarity(feedback: Dict[str, Any]) -> int:
+    """1 for a like, -1 for a dislike, and the lexicon sentiment of text feedback (0 if neutral)."""
+    feedback_type = (feedback.get('feedback_type') or "").lower()
+    if feedback_type == "like":
+        return 1
+    if feedback_type == "dislike":
+        return -1
+    
+    sentiment = label(score_text(feedback.get('text_feedback')))
+    return 1 if sentiment == "positive" else -1 if sentiment == "negative" else 0
+
+def feedback_targets(feedback: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """The (kind, name) preferences a feedback entry is about: the post's keywords and its author."""
+    targets = []
+    
+    try:
+        keywords = json.loads(feedback.get('keywords') or "[]")
+    except (json.JSONDecodeError, TypeError):
+        keywords = []
+    for keyword in keywords:
+        if isinstance(keyword, str) and keyword.strip():
+            targets.append(("keyword", keyword.strip().lower()))
+    
+    if feedback.get('username'):
+        targets.append(("author", feedback['username']))
+    return targets
+
+def get_feedback_after(conn: sqlite3.Connection, feedback_id: int, posts_db: str = POSTS_DB) -> List[Dict[str, Any]]:
+    """Get feedback entries newer than a feedback ID, with the keywords and author of their posts."""
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    
+    if os.path.exists(posts_db):
+        cursor.execute("ATTACH DATABASE ? AS posts_db", (posts_db,))
+        cursor.execute("""
+            SELECT uf.*, sp.post_text, sp.username, sp.keywords, sp.query
+            FROM user_feedback uf
+            LEFT JOIN posts_db.selected_posts sp ON uf.post_id = sp.id
+            WHERE uf.id > ?
+            ORDER BY uf.id
+        """, (feedback_id,))
+        feedback = [dict(row) for row in cursor.fetchall()]
+        cursor.execute("DETACH DATABASE posts_db")
+    else:
+        cursor.execute("SELECT * FROM user_feedback WHERE id > ? ORDER BY id", (feedback_id,))
+        feedback = [dict(row) for row in cursor.fetchall()]
+    
+    conn.row_factory = None
+    return feedback
+
+def count_new_feedback(db_file: str = FEEDBACK_DB, posts_db: str = POSTS_DB) -> int:
+    """
+    Add the feedback received since the last call to the preference counts.
+    
+    Counting is idempotent: the ID of the last counted feedback entry is stored with the counts,
+    in the same transaction.
+    
+    Returns:
+        The number of feedback entries counted
+    """
+    conn = sqlite3.connect(db_file)
+    setup_preference_tables(conn)
+    
+    counted_id = int(get_state(conn, "counted_feedback_id", "0"))
+    feedback = get_feedback_after(conn, counted_id, posts_db)
+    if not feedback:
+        conn.close()
+        return 0
+    
+    changes: Dict[Tuple[str, str], List[int]] = {}
+    for entry in feedback:
+        polarity = feedback_polarity(entry)
+        if polarity == 0:
+            continue
+        for target in feedback_targets(entry):
+            counts = changes.setdefault(target, [0, 0])
+            counts[0 if polarity > 0 else 1] += 1
+    
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO preference_counts (kind, name, likes, dislikes, pending_likes, pending_dislikes)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(kind, name) DO UPDATE SET
+                likes = likes + excluded.likes,
+                dislikes = dislikes + excluded.dislikes,
+                pending_likes = pending_likes + excluded.pending_likes,
+                pending_dislikes = pending_dislikes + excluded.pending_dislikes,
+                updated_at = CURRENT_TIMESTAMP
+            """,
+            [(kind, name, likes, dislikes, likes, dislikes) for (kind, name), (likes, dislikes) in changes.items()]
+        )
+        set_state(conn, "counted_feedback_id", feedback[-1]['id'])
+    
+    conn.close()
+    return len(feedback)
+
+def get_drift(db_file: str = FEEDBACK_DB) -> float:
+    """How far the counted preferences have moved since the profile was last rewritten."""
+    conn = sqlite3.connect(db_file)
+    setup_preference_tables(conn)
+    drift = conn.execute("SELECT COALESCE(SUM(ABS(pending_likes - pending_dislikes)), 0) FROM preference_counts").fetchone()[0]
+    conn.close()
+    return drift
+
+def get_pending_changes(db_file: str = FEEDBACK_DB, limit: int = 30) -> List[Dict[str, Any]]:
+    """The keywords and authors whose preference moved most since the last rewrite, with their overall counts."""
+    conn = sqlite3.connect(db_file)
+    setup_preference_tables(conn)
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute(
+        """
+        SELECT kind, name, likes, dislikes, pending_likes, pending_dislikes FROM preference_counts
+        WHERE pending_likes != pending_dislikes
+        ORDER BY ABS(pending_likes - pending_dislikes) DESC, name LIMIT ?
+        """,
+        (limit,)
+    ).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def get_pending_text_feedback(db_file: str = FEEDBACK_DB, posts_db: str = POSTS_DB, limit: int = 20) -> List[Dict[str, Any]]:
+    """Text feedback received since the last rewrite, which the counts only capture as a like or dislike."""
+    conn = sqlite3.connect(db_file)
+    setup_preference_tables(conn)
+    rewrite_id = int(get_state(conn, "rewrite_feedback_id", "0"))
+    counted_id = int(get_state(conn, "counted_feedback_id", "0"))
+    feedback = [entry for entry in get_feedback_after(conn, rewrite_id, posts_db)
+                if entry['id'] <= counted_id and entry.get('text_feedback')]
+    conn.close()
+    return feedback[-limit:]
+
+def reset_pending(db_file: str = FEEDBACK_DB, processed_feedback_id: Optional[int] = None):
+    """
+    Mark every counted feedback entry as reflected in the profile.
+    
+    After a full regeneration, processed_feedback_id is the newest feedback entry it read; it is
+    stored in the same transaction, so the next regeneration starts after it.
+    """
+    conn = sqlite3.connect(db_file)
+    setup_preference_tables(conn)
+    with conn:
+        conn.execute("UPDATE preference_counts SET pending_likes = 0, pending_dislikes = 0")
+        set_state(conn, "rewrite_feedback_id", get_state(conn, "counted_feedback_id", "0"))
+        if processed_feedback_id is not None:
+            set_state(conn, "processed_feedback_id", processed_feedback_id)
+    conn.close()
+
+def compute_preference_vector(db_file: str = FEEDBACK_DB) -> Dict[str, Dict[str, float]]:
+    """
+    Turn the preference counts into affinities from -1 (always disliked) to 1 (always liked).
+    
+    Returns:
+        {"keywords": {keyword: affinity}, "authors": {username: affinity}}, leaving out neutral entries
+    """
+    conn = sqlite3.connect(db_file)
+    setup_preference_tables(conn)
+    rows = conn.execute("SELECT kind, name, likes, dislikes FROM preference_counts ORDER BY kind, name").fetchall()
+    conn.close()
+    
+    vector: Dict[str, Dict[str, float]] = {"keywords": {}, "authors": {}}
+    for kind, name, likes, dislikes in rows:
+        affinity = round((likes - dislikes) / (likes + dislikes + AFFINITY_PRIOR), 4)
+        if affinity:
+            vector["keywords" if kind == "keyword" else "authors"][name] = affinity
+    return vector
+
+def load_preference_vector(vector_file: str = PREFERENCE_VECTOR_FILE) -> Dict[str, Dict[str, float]]:
+    """Load the saved preference vector, or an empty one if there is none yet."""
+    try:
+        with open(vector_file, 'r', encoding='utf-8') as f:
+            vector = json.load(f)
+        return {"keywords": vector.get("keywords", {}), "authors": vector.get("authors", {})}
+    except (OSError, ValueError, AttributeError):
+        return {"keywords": {}, "authors": {}}
+
+def preference_score(post: Dict[str, Any], vector: Dict[str, Dict[str, float]]) -> Optional[float]:
+    """
+    Score how much the user likes a post from -1 to 1: the mean affinity of its keywords and author.
+    
+    Returns None when the vector knows none of them.
+    """
+    affinities = [vector["keywords"][name] for kind, name in feedback_targets(post)
+                  if kind == "keyword" and name in vector["keywords"]]
+    if post.get('username') in vector["authors"]:
+        affinities.append(vector["authors"][post['username']])
+    
+    if not affinities:
+        return None
+    return sum(affinities) / len(affinities)
@@ -1,7 +1,17 @@
 import re
+import ast
 import json
 import sqlite3
-from typing import Dict, List, Any, Optional, Union
+from typing import Dict, List, Any, Optional, Union, Iterable, Iterator
+
+from sentiment_lexicon import score_text, setup_sentiment_column
+import pipeline_state
+
+# Where the posts array starts in an agent reply; the prompt's schema uses single quotes, so accept both
+POSTS_ARRAY_PATTERN = re.compile(r"""["']posts["']\s*:\s*\[""")
+
+# Metric fields that may come back abbreviated ("1.2K") and are stored as integers
+METRIC_FIELDS = ["views", "comments", "retweets", "likes", "saves"]
 
 def clean_agent_response(response: str) -> str:
     """
@@ -9,7 +19,7 @@ def clean_agent_response(response: str) -> str:
     
     Args:
         response (str): The raw response from the agent
-        
+    
     Returns:
         str: The cleaned JSON string
     """
@@ -32,15 +42,150 @@ def clean_agent_response(response: str) -> str:
     # If all else fails, return the original response
     return response
 
+class PostStreamParser:
+    """
+    Incrementally pull post objects out of the "posts" array of an agent reply.
+    
+    Text can be fed in chunks as it arrives; every post object is returned as soon as its
+    closing brace has been seen, so one malformed post doesn't lose the others and a reply
+    cut off mid-post still yields every post before the cut.
+    """
+    
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.in_array = False
+        self.done = False
+        self.object_start = None
+        self.depth = 0
+        self.quote = None
+        self.escaped = False
+        self.parsed = 0
+        self.skipped = 0
+    
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Add text to the parser and return the posts completed by it."""
+        if self.done:
+            return []
+        self.buffer += chunk
+        posts = []
+        
+        if not self.in_array:
+            match = POSTS_ARRAY_PATTERN.search(self.buffer)
+            if not match:
+                # Keep enough of the tail to match a "posts" key split across chunks
+                self.buffer = self.buffer[-32:]
+                return posts
+            self.in_array = True
+            self.buffer = self.buffer[match.end():]
+            self.position = 0
+        
+        buffer = self.buffer
+        i = self.position
+        while i < len(buffer):
+            char = buffer[i]
+            
+            # Strings may be double- or single-quoted; only the quote that opened one closes it
+            if self.quote:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == self.quote:
+                    self.quote = None
+            elif char in "\"'":
+                self.quote = char
+            elif char == "{":
+                if self.depth == 0:
+                    self.object_start = i
+                self.depth += 1
+            elif char == "}" and self.depth > 0:
+                self.depth -= 1
+                if self.depth == 0:
+                    post = parse_post_object(buffer[self.object_start:i + 1])
+                    if post is not None:
+                        posts.append(post)
+                        self.parsed += 1
+                    else:
+                        self.skipped += 1
+                    self.object_start = None
+            elif char == "]" and self.depth == 0:
+                self.done = True
+                break
+            i += 1
+        
+        # Drop the text of finished posts, keeping only a post still in progress
+        if self.object_start is not None:
+            self.buffer = buffer[self.object_start:]
+            self.position = i - self.object_start
+            self.object_start = 0
+        else:
+            self.buffer = ""
+            self.position = 0
+        return posts
+    
+    def close(self) -> bool:
+        """Finish parsing; returns False if the reply was cut off before the posts array ended."""
+        if self.object_start is not None:
+            self.skipped += 1
+            print(f"Agent response was truncated; dropped an incomplete post after {self.parsed} complete posts")
+        return self.done
+
+def parse_post_object(text: str) -> Optional[Dict[str, Any]]:
+    """Parse one post object, repairing trailing commas and Python-style quoting; None if it still isn't a post."""
+    text = re.sub(r",\s*([}\]])", r"\1", text)
+    
+    try:
+        post = json.loads(text)
+    except json.JSONDecodeError:
+        # The agent sometimes answers with single-quoted, Python-style dicts like the schema in its prompt
+        literals = {"null": "None", "true": "True", "false": "False"}
+        try:
+            post = ast.literal_eval(re.sub(r":\s*(null|true|false)\b", lambda match: ": " + literals[match.group(1)], text))
+        except (ValueError, SyntaxError):
+            print(f"Skipping malformed post: {text[:100]}...")
+            return None
+    
+    if isinstance(post, dict) and (post.get("post_text") or post.get("post_url") or post.get("url")):
+        return post
+    return None
+
+def iter_agent_posts(chunks: Union[str, Iterable[str]]) -> Iterator[Dict[str, Any]]:
+    """
+    Yield each post of an agent reply as soon as it parses.
+    
+    Args:
+        chunks: The whole reply, or its text in chunks as it streams in
+    """
+    parser = PostStreamParser()
+    for chunk in ([chunks] if isinstance(chunks, str) else chunks):
+        yield from parser.feed(chunk)
+    parser.close()
+
+def normalize_post(post: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Map the agent's field variants onto the posts table columns and convert abbreviated metrics.
+    
+    Null and unreadable values are left out, so the fields fall back to their defaults.
+    """
+    post = dict(post)
+    if not post.get("post_url") and post.get("url"):
+        post["post_url"] = post.pop("url")
+    for field in METRIC_FIELDS:
+        if field in post:
+            post[field] = convert_metrics(post[field])
+    return {key: value for key, value in post.items() if value is not None}
+
 def parse_agent_response(response: str) -> Optional[Dict[str, List[Dict[str, Any]]]]:
     """
     Parse the agent's response into a Python dictionary.
     
     Args:
         response (str): The raw response from the agent
-        
+    
     Returns:
-        Optional[Dict]: The parsed JSON as a Python dictionary, or None if parsing fails
+        Optional[Dict]: The parsed JSON as a Python dictionary, or None if parsing fails.
+        When the reply isn't valid JSON as a whole, the posts that do parse are returned.
     """
     # Clean the response
     cleaned_response = clean_agent_response(response)
@@ -52,7 +197,13 @@ def parse_agent_response(response: str) -> Optional[Dict[str, List[Dict[str, Any
     except json.JSONDecodeError as e:
         print(f"Error parsing JSON: {e}")
         print(f"Cleaned response: {cleaned_response[:200]}...")
-        return None
+    
+    # Recover the posts that are complete and valid on their own
+    posts = list(iter_agent_posts(response))
+    if posts:
+        print(f"Recovered {len(posts)} posts from the malformed response")
+        return {"posts": posts}
+    return None
 
 def convert_metrics(value: Union[str, int, None]) -> Optional[int]:
     """
@@ -60,7 +211,7 @@ def convert_metrics(value: Union[str, int, None]) -> Optional[int]:
     
     Args:
         value: The metric value as a string, int, or None
-        
+    
     Returns:
         Optional[int]: The converted integer value, or None if conversion fails
     """
@@ -91,19 +242,19 @@ def convert_metrics(value: Union[str, int, None]) -> Optional[int]:
     except (ValueError, TypeError):
         return None
 
-def save_posts_to_db(posts: List[Dict[str, Any]], db_file: str = "x_com_posts.db") -> int:
+def save_posts_to_db(posts: Iterable[Dict[str, Any]], db_file: str = "x_com_posts.db") -> int:
     """
     Save posts to the SQLite database.
     
     Args:
-        posts (List[Dict]): List of post dictionaries
+        posts (Iterable[Dict]): Post dictionaries, e.g. from iter_agent_posts as they parse
         db_file (str): Path to the SQLite database file
-        
+    
     Returns:
         int: Number of posts saved
     """
     # Connect to the database
-    conn = sqlite3.connect(db_file)
+    conn = pipeline_state.connect(db_file)
     cursor = conn.cursor()
     
     # Create the posts table if it doesn't exist
@@ -123,8 +274,11 @@ def save_posts_to_db(posts: List[Dict[str, Any]], db_file: str = "x_com_posts.db
         scraped_at DATETIME DEFAULT CURRENT_TIMESTAMP
     )
     ''')
+    setup_sentiment_column(conn)
+    
+    conn.commit()
     
-    # Insert each post
+    # Insert and commit each post, so an error later in the stream keeps the posts saved before it
     count = 0
     for post in posts:
         # Convert metrics to integers
@@ -137,28 +291,32 @@ def save_posts_to_db(posts: List[Dict[str, Any]], db_file: str = "x_com_posts.db
         # Get the post URL (handle different field names)
         post_url = post.get('post_url') or post.get('url')
         
-        cursor.execute('''
-        INSERT INTO posts (
-            post_text, post_url, username, image_url, 
-            views, comments, retweets, likes, saves, post_time
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            post.get('post_text'),
-            post_url,
-            post.get('username'),
-            post.get('image_url'),
-            views,
-            comments,
-            retweets,
-            likes,
-            saves,
-            post.get('post_time')
-        ))
+        try:
+            with conn:
+                cursor.execute('''
+                INSERT INTO posts (
+                    post_text, post_url, username, image_url, 
+                    views, comments, retweets, likes, saves, post_time, sentiment
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    post.get('post_text'),
+                    post_url,
+                    post.get('username'),
+                    post.get('image_url'),
+                    views,
+                    comments,
+                    retweets,
+                    likes,
+                    saves,
+                    post.get('post_time'),
+                    # Scored locally at ingest, so sentiment over many posts is a SQL aggregate
+                    score_text(post.get('post_text'))
+                ))
+        except sqlite3.Error as e:
+            print(f"SQLite error saving post {post_url}: {e}")
+            continue
         count += 1
     
-    # Commit the changes
-    conn.commit()
-    
     # Close the connection
     conn.close()
     
@@ -171,26 +329,15 @@ def process_agent_response(response: str, db_file: str = "x_com_posts.db") -> in
     Args:
         response (str): The raw response from the agent
         db_file (str): Path to the SQLite database file
-        
+    
     Returns:
         int: Number of posts saved
     """
-    # Parse the response
-    parsed = parse_agent_response(response)
-    
-    if parsed is None:
-        print("Failed to parse the agent's response")
-        return 0
+    # Save the posts as they parse, so a truncated or partly malformed response still stores its valid posts
+    count = save_posts_to_db(iter_agent_posts(response), db_file)
     
-    # Get the posts
-    posts = parsed.get('posts', [])
-    
-    if not posts:
+    if count == 0:
         print("No posts found in the agent's response")
-        return 0
-    
-    # Save the posts to the database
-    count = save_posts_to_db(posts, db_file)
     
     return count
 
@@ -2,27 +2,23 @@ import sqlite3
 import json
 import os
 import time
-import requests
 from dotenv import load_dotenv
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+from model_router import route_completion
+import job_ledger
+import pipeline_state
+from progress import ProgressReporter
+import tracing
 
 # Load environment variables
 load_dotenv()
 
-# Get OpenRouter API key from environment variable or prompt user
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-if not OPENROUTER_API_KEY:
-    OPENROUTER_API_KEY = input("Enter your OpenRouter API key: ")
-
-# OpenRouter API endpoint
-OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
-
 # Model to use (default to GPT-4o)
 MODEL = os.getenv("OPENROUTER_MODEL", "openai/gpt-4o")
 
 def setup_database():
     """Set up the database with necessary tables."""
-    conn = sqlite3.connect("x_com_posts.db")
+    conn = pipeline_state.connect("x_com_posts.db")
     cursor = conn.cursor()
     
     # Check if keywords column exists in posts table, add if it doesn't
@@ -47,24 +43,44 @@ def setup_database():
     conn.close()
     print("Database setup complete.")
 
-def get_posts_without_keywords(limit: Optional[int] = None) -> List[Dict[str, Any]]:
-    """Get posts that don't have keywords assigned yet."""
-    conn = sqlite3.connect("x_com_posts.db")
+@tracing.traced("db.get_posts_without_keywords", "db")
+def get_posts_without_keywords(limit: Optional[int] = None, post_ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+    """Get posts that don't have keywords assigned yet, optionally only the given post IDs."""
+    conn = pipeline_state.connect("x_com_posts.db")
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
-    query = "SELECT id, post_text FROM posts WHERE keywords IS NULL OR keywords = ''"
-    if limit:
-        query += f" LIMIT {limit}"
-    
-    cursor.execute(query)
-    posts = [dict(row) for row in cursor.fetchall()]
+    query = "SELECT id, post_text FROM posts WHERE (keywords IS NULL OR keywords = '')"
+    if post_ids is None:
+        if limit:
+            query += f" LIMIT {limit}"
+        cursor.execute(query)
+        posts = [dict(row) for row in cursor.fetchall()]
+    else:
+        # Look the IDs up in chunks; a large retry backlog would exceed SQLite's variable limit
+        posts = []
+        for chunk in job_ledger.chunk_ids(post_ids):
+            if limit and len(posts) >= limit:
+                break
+            cursor.execute(query + f" AND id IN ({', '.join('?' for _ in chunk)})", chunk)
+            posts.extend(dict(row) for row in cursor.fetchall())
+        if limit:
+            posts = posts[:limit]
+    tracing.set_attributes(rows=len(posts))
     
     conn.close()
     return posts
 
-def call_openrouter(post_text: str) -> List[str]:
-    """Call OpenRouter API to generate keywords for a post."""
+def call_openrouter(post_text: str, post_id: Optional[int] = None) -> List[str]:
+    """Call OpenRouter API to generate keywords for a post, returning [] if the call fails."""
+    try:
+        return request_keywords(post_text, post_id)
+    except Exception as e:
+        print(f"Error calling OpenRouter API: {e}")
+        return []
+
+def request_keywords(post_text: str, post_id: Optional[int] = None) -> List[str]:
+    """Generate keywords for a post, raising if the API call fails."""
     # Handle None or empty post_text
     if not post_text:
         print("Warning: Empty or None post_text provided")
@@ -78,11 +94,6 @@ def call_openrouter(post_text: str) -> List[str]:
             return words
         return ["short post"]
         
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
     data = {
         "model": MODEL,
         "messages": [
@@ -97,34 +108,37 @@ def call_openrouter(post_text: str) -> List[str]:
         ]
     }
     
+    return route_completion("keywords", data, parse_keywords, item_id=post_id)
+
+def parse_keywords(content: str) -> Tuple[List[str], bool]:
+    """
+    Parse a keywords reply into (keywords, confident); only a proper JSON array is confident.
+    
+    Raises ValueError for a reply without usable keywords, so the router escalates it and a post
+    whose last reply is unusable is marked failed instead of getting placeholder keywords.
+    """
+    # Try to parse the response as JSON
     try:
-        response = requests.post(OPENROUTER_API_URL, headers=headers, json=data)
-        response.raise_for_status()
-        
-        result = response.json()
-        content = result["choices"][0]["message"]["content"]
-        
-        # Try to parse the response as JSON
-        try:
-            keywords = json.loads(content)
-            if isinstance(keywords, list):
-                return keywords
-            else:
-                # If it's not a list, try to extract keywords from the text
-                return extract_keywords_from_text(content)
-        except json.JSONDecodeError:
-            # If it's not valid JSON, try to extract keywords from the text
-            return extract_keywords_from_text(content)
-            
-    except Exception as e:
-        print(f"Error calling OpenRouter API: {e}")
-        return []
+        keywords = json.loads(content)
+        if isinstance(keywords, list):
+            keywords = [keyword.strip() for keyword in keywords if isinstance(keyword, str) and keyword.strip()]
+            confident = True
+        else:
+            # If it's not a list, try to extract keywords from the text
+            keywords, confident = extract_keywords_from_text(content), False
+    except json.JSONDecodeError:
+        # If it's not valid JSON, try to extract keywords from the text
+        keywords, confident = extract_keywords_from_text(content), False
+    
+    if not keywords:
+        raise ValueError(f"No keywords in reply: {content[:100]}")
+    return keywords, confident
 
 def extract_keywords_from_text(text: str) -> List[str]:
-    """Extract keywords from text if the API doesn't return a proper JSON array."""
+    """Extract keywords from text if the API doesn't return a proper JSON array; [] if there are none."""
     # Handle empty text
     if not text or not text.strip():
-        return ["unknown"]
+        return []
         
     # Remove common formatting
     text = text.replace("Keywords:", "").replace("keywords:", "")
@@ -145,16 +159,13 @@ def extract_keywords_from_text(text: str) -> List[str]:
         if words:
             return words[:5]  # Limit to 5 keywords
     
-    # If all else fails, just return the whole text as one keyword (up to 50 chars)
-    if text.strip():
-        return [text.strip()[:50]]
-    
-    # Absolute fallback
-    return ["content"]
+    # Longer text without separators is prose, not a list of keywords
+    return []
 
+@tracing.traced("db.update_post_keywords", "db")
 def update_post_keywords(post_id: int, keywords: List[str]):
     """Update a post with the generated keywords."""
-    conn = sqlite3.connect("x_com_posts.db")
+    conn = pipeline_state.connect("x_com_posts.db")
     cursor = conn.cursor()
     
     # Convert keywords list to JSON string
@@ -171,7 +182,7 @@ def update_post_keywords(post_id: int, keywords: List[str]):
 
 def update_keywords_table(keywords: List[str]):
     """Update the keywords table with new keywords."""
-    conn = sqlite3.connect("x_com_posts.db")
+    conn = pipeline_state.connect("x_com_posts.db")
     cursor = conn.cursor()
     
     for keyword in keywords:
@@ -191,14 +202,30 @@ def update_keywords_table(keywords: List[str]):
     conn.commit()
     conn.close()
 
-def process_posts(limit: Optional[int] = None, batch_size: int = 10, force_update: bool = False):
-    """Process posts to generate and save keywords."""
+def process_posts(limit: Optional[int] = None, batch_size: int = 10, force_update: bool = False, resume: bool = False):
+    """
+    Process posts to generate and save keywords.
+    
+    Every post is tracked in the job ledger. With resume=True only posts whose earlier
+    attempts failed, and whose retry backoff has expired, are processed.
+    """
     # Set up the database
     setup_database()
+    job_ledger.setup_job_ledger()
     
     # Get posts without keywords or all posts if force_update is True
-    if force_update:
-        conn = sqlite3.connect("x_com_posts.db")
+    if resume:
+        retry_ids = job_ledger.get_retryable_item_ids("keywords")
+        posts = get_posts_without_keywords(limit, post_ids=retry_ids) if retry_ids else []
+        total_posts = len(posts)
+        
+        if total_posts == 0:
+            print("No failed posts are due for a retry.")
+            return
+        
+        print(f"Retrying {total_posts} posts that failed earlier.")
+    elif force_update:
+        conn = pipeline_state.connect("x_com_posts.db")
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -223,12 +250,21 @@ def process_posts(limit: Optional[int] = None, batch_size: int = 10, force_updat
         
         print(f"Found {total_posts} posts without keywords.")
     
+    job_ledger.mark_pending("keywords", [post["id"] for post in posts])
+    reporter = ProgressReporter("keywords", total_posts)
+    failed_count = 0
+    
     # Process posts in batches to avoid rate limits
     for i, post in enumerate(posts):
         print(f"Processing post {i+1}/{total_posts} (ID: {post['id']})...")
         
         # Generate keywords
-        keywords = call_openrouter(post["post_text"])
+        try:
+            keywords = request_keywords(post["post_text"], post["id"])
+            error = "No keywords generated"
+        except Exception as e:
+            keywords = []
+            error = str(e)
         
         if keywords:
             print(f"Generated keywords: {', '.join(keywords)}")
@@ -238,19 +274,27 @@ def process_posts(limit: Optional[int] = None, batch_size: int = 10, force_updat
             
             # Update the keywords table
             update_keywords_table(keywords)
+            job_ledger.mark_ok("keywords", post["id"])
+            reporter.advance(post["id"])
         else:
-            print("Failed to generate keywords for this post.")
+            print(f"Failed to generate keywords for this post: {error}")
+            job_ledger.mark_failed("keywords", post["id"], error)
+            reporter.advance(post["id"], error=error)
+            failed_count += 1
         
         # Sleep between requests to avoid rate limits
         if (i + 1) % batch_size == 0 and i + 1 < total_posts:
             print(f"Processed {i+1} posts. Sleeping for 5 seconds to avoid rate limits...")
             time.sleep(5)
     
+    reporter.finish()
     print(f"Finished processing {total_posts} posts.")
+    if failed_count:
+        print(f"{failed_count} posts failed. Retry them later with: python generate_keywords.py --resume")
 
 def view_keywords_stats():
     """View statistics about the keywords in the database."""
-    conn = sqlite3.connect("x_com_posts.db")
+    conn = pipeline_state.connect("x_com_posts.db")
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -313,7 +357,7 @@ def fix_missing_keywords():
             continue
         
         # For normal posts, use the API
-        keywords = call_openrouter(post["post_text"])
+        keywords = call_openrouter(post["post_text"], post["id"])
         
         if keywords:
             print(f"Generated keywords: {', '.join(keywords)}")
@@ -351,7 +395,8 @@ def fix_missing_keywords():
     
     print(f"Finished processing {len(posts)} posts.")
 
-if __name__ == "__main__":
+def run_cli(argv: Optional[List[str]] = None):
+    """Parse command-line arguments and run keyword generation."""
     import argparse
     
     parser = argparse.ArgumentParser(description="Generate keywords for posts using OpenRouter.")
@@ -360,8 +405,9 @@ if __name__ == "__main__":
     parser.add_argument("--stats", action="store_true", help="View keyword statistics")
     parser.add_argument("--force", action="store_true", help="Force update keywords for all posts, even those that already have keywords")
     parser.add_argument("--fix-missing", action="store_true", help="Fix posts that don't have keywords yet")
+    parser.add_argument("--resume", action="store_true", help="Only retry posts whose earlier keyword generation failed")
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     if args.stats:
         view_keywords_stats()
@@ -369,5 +415,8 @@ if __name__ == "__main__":
         fix_missing_keywords()
         view_keywords_stats()
     else:
-        process_posts(limit=args.limit, batch_size=args.batch_size, force_update=args.force)
+        process_posts(limit=args.limit, batch_size=args.batch_size, force_update=args.force, resume=args.resume)
         view_keywords_stats()
+
+if __name__ == "__main__":
+    run_cli()
@@ -0,0 +1,181 @@
+import sqlite3
+from typing import List, Dict, Any, Optional
+
+import pipeline_state
+
+# Retry backoff for failed items: 30s, 60s, 120s, ... capped at one hour
+BASE_BACKOFF_SECONDS = 30
+MAX_BACKOFF_SECONDS = 3600
+
+# Items that failed this many times are no longer retried by --resume
+MAX_ATTEMPTS = 5
+
+# Item IDs are looked up this many at a time, below SQLite's limit of 999 variables per statement on older builds
+ID_CHUNK_SIZE = 500
+
+def chunk_ids(item_ids: List[int], size: int = ID_CHUNK_SIZE) -> List[List[int]]:
+    """Split item IDs into chunks small enough for an IN (...) list."""
+    return [item_ids[start:start + size] for start in range(0, len(item_ids), size)]
+
+def setup_job_ledger(db_file: str = 'x_com_posts.db'):
+    """Create the job_items ledger table if it doesn't exist."""
+    conn = pipeline_state.connect(db_file)
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS job_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        job TEXT,
+        item_id INTEGER,
+        status TEXT DEFAULT 'pending',
+        attempts INTEGER DEFAULT 0,
+        last_error TEXT,
+        next_attempt_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(job, item_id)
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_job_items_status ON job_items(job, status, next_attempt_at)")
+    
+    conn.commit()
+    conn.close()
+
+def mark_pending(job: str, item_ids: List[int], db_file: str = 'x_com_posts.db'):
+    """Register items for a job run, keeping the attempt count of items seen before."""
+    conn = pipeline_state.connect(db_file)
+    cursor = conn.cursor()
+    
+    cursor.executemany(
+        """
+        INSERT INTO job_items (job, item_id, status) VALUES (?, ?, 'pending')
+        ON CONFLICT(job, item_id) DO UPDATE SET status = 'pending', updated_at = CURRENT_TIMESTAMP
+        """,
+        [(job, item_id) for item_id in item_ids]
+    )
+    
+    conn.commit()
+    conn.close()
+
+def mark_ok(job: str, item_id: int, db_file: str = 'x_com_posts.db'):
+    """Record that an item was processed successfully."""
+    conn = pipeline_state.connect(db_file)
+    cursor = conn.cursor()
+    
+    cursor.execute(
+        """
+        UPDATE job_items
+        SET status = 'ok', attempts = attempts + 1, last_error = NULL, updated_at = CURRENT_TIMESTAMP
+        WHERE job = ? AND item_id = ?
+        """,
+        (job, item_id)
+    )
+    
+    conn.commit()
+    conn.close()
+
+def mark_failed(job: str, item_id: int, error: str, db_file: str = 'x_com_posts.db'):
+    """Record a failed attempt and schedule the next retry with exponential backoff."""
+    conn = pipeline_state.connect(db_file)
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT attempts FROM job_items WHERE job = ? AND item_id = ?", (job, item_id))
+    row = cursor.fetchone()
+    attempts = (row[0] if row else 0) + 1
+    backoff = min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** (attempts - 1))
+    
+    cursor.execute(
+        """
+        INSERT INTO job_items (job, item_id, status, attempts, last_error, next_attempt_at)
+        VALUES (?, ?, 'failed', ?, ?, datetime('now', ?))
+        ON CONFLICT(job, item_id) DO UPDATE SET
+            status = 'failed',
+            attempts = excluded.attempts,
+            last_error = excluded.last_error,
+            next_attempt_at = excluded.next_attempt_at,
+            updated_at = CURRENT_TIMESTAMP
+        """,
+        (job, item_id, attempts, str(error)[:500], f"+{backoff} seconds")
+    )
+    
+    conn.commit()
+    conn.close()
+
+def get_retryable_item_ids(job: str, max_attempts: int = MAX_ATTEMPTS, db_file: str = 'x_com_posts.db') -> List[int]:
+    """Get failed items whose backoff has expired and that haven't used up their attempts."""
+    conn = pipeline_state.connect(db_file)
+    cursor = conn.cursor()
+    
+    cursor.execute(
+        """
+        SELECT item_id FROM job_items
+        WHERE job = ? AND status = 'failed' AND attempts < ? AND next_attempt_at <= CURRENT_TIMESTAMP
+        ORDER BY next_attempt_at
+        """,
+        (job, max_attempts)
+    )
+    item_ids = [row[0] for row in cursor.fetchall()]
+    
+    conn.close()
+    return item_ids
+
+def get_job_summary(job: str, db_file: str = 'x_com_posts.db') -> Dict[str, int]:
+    """Count the items of a job by status."""
+    conn = pipeline_state.connect(db_file)
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT status, COUNT(*) FROM job_items WHERE job = ? GROUP BY status", (job,))
+    summary = {status: count for status, count in cursor.fetchall()}
+    
+    conn.close()
+    return summary
+
+def get_failed_items(job: Optional[str] = None, db_file: str = 'x_com_posts.db') -> List[Dict[str, Any]]:
+    """Get the failed items of one job (or all jobs) with their attempt counts and last errors."""
+    conn = pipeline_state.connect(db_file)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    
+    query = "SELECT * FROM job_items WHERE status = 'failed'"
+    params = ()
+    if job:
+        query += " AND job = ?"
+        params = (job,)
+    query += " ORDER BY job, next_attempt_at"
+    
+    cursor.execute(query, params)
+    items = [dict(row) for row in cursor.fetchall()]
+    
+    conn.close()
+    return items
+
+def view_job_ledger(job: Optional[str] = None, db_file: str = 'x_com_posts.db'):
+    """Print the status of the job ledger."""
+    try:
+        setup_job_ledger(db_file)
+        
+        jobs = [job] if job else ["keywords", "ranking"]
+        for name in jobs:
+            summary = get_job_summary(name, db_file)
+            counts = ", ".join(f"{status}: {count}" for status, count in sorted(summary.items())) or "no items"
+            print(f"{name}: {counts}")
+        
+        failed = get_failed_items(job, db_file)
+        if failed:
+            print(f"\nFailed items ({len(failed)}):")
+            for item in failed:
+                print(f"  [{item['job']}] item {item['item_id']}: {item['attempts']} attempts, "
+                      f"next retry at {item['next_attempt_at']} - {item['last_error']}")
+    
+    except sqlite3.Error as e:
+        print(f"SQLite error: {e}")
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="View the per-item job ledger for keyword generation and ranking.")
+    parser.add_argument("--db", default="x_com_posts.db", help="Database file path")
+    parser.add_argument("--job", choices=["keywords", "ranking"], help="Only show one job")
+    
+    args = parser.parse_args()
+    
+    view_job_ledger(args.job, args.db)
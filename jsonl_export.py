@@ -0,0 +1,140 @@
+import sqlite3
+import sys
+import json
+import base64
+from typing import List, Optional, Tuple, Any, TextIO
+
+def get_table_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    """Get the column names of a table."""
+    cursor = conn.cursor()
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in cursor.fetchall()]
+
+def select_columns(requested: Optional[str], available: List[str]) -> List[str]:
+    """
+    Resolve a comma-separated column list against a table's columns.
+    
+    Args:
+        requested: Comma-separated column names, or None for every column
+        available: The table's columns
+    
+    Returns:
+        The columns to output, in the requested order
+    """
+    if not requested:
+        return available
+    
+    columns = [column.strip() for column in requested.split(",") if column.strip()]
+    unknown = [column for column in columns if column not in available]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)} (available: {', '.join(available)})")
+    
+    return columns
+
+def encode_cursor(sort_value: Any, row_id: int) -> str:
+    """Encode the sort key of the last row of a page as an opaque cursor."""
+    return base64.urlsafe_b64encode(json.dumps([sort_value, row_id]).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor_token: str) -> Tuple[Any, int]:
+    """Decode a cursor produced by encode_cursor."""
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor_token.encode('ascii')))
+        return sort_value, int(row_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor_token}") from e
+
+def stream_rows_jsonl(conn: sqlite3.Connection, table: str, columns: List[str], sort_column: str,
+                      where: str = "", params: tuple = (), limit: Optional[int] = None, offset: int = 0,
+                      cursor_token: Optional[str] = None, json_columns: Tuple[str, ...] = ("keywords",),
+                      out: TextIO = sys.stdout) -> int:
+    """
+    Write rows of a table as JSON lines, newest first, without loading the whole table.
+    
+    Rows are ordered by (sort_column, id) descending. A page can be selected with offset, or with
+    the cursor printed after the previous page, which keeps deep pages as fast as the first one.
+    When limit is set and the page is full, a final {"next_cursor": ...} line is written.
+    
+    Args:
+        conn: Open database connection
+        table: Table to read
+        columns: Columns to output (id and sort_column are read for the cursor even if not output)
+        sort_column: Column the rows are ordered by, newest first
+        where: Optional SQL condition on the rows
+        params: Parameters for the where condition
+        limit: Maximum number of rows to write
+        offset: Number of rows to skip
+        cursor_token: Cursor from a previous page
+        json_columns: Columns holding JSON text that are decoded in the output
+        out: Stream to write to
+    
+    Returns:
+        The number of rows written
+    """
+    sort_expr = f"COALESCE({sort_column}, '')"
+    read_columns = list(dict.fromkeys(columns + ["id", sort_column]))
+    conditions = [where] if where else []
+    query_params = list(params)
+    
+    if cursor_token:
+        sort_value, row_id = decode_cursor(cursor_token)
+        conditions.append(f"({sort_expr}, id) < (?, ?)")
+        query_params.extend([sort_value, row_id])
+    
+    query = f"SELECT {', '.join(read_columns)} FROM {table}"
+    if conditions:
+        query += " WHERE " + " AND ".join(f"({condition})" for condition in conditions)
+    query += f" ORDER BY {sort_expr} DESC, id DESC"
+    if limit or offset:
+        query += " LIMIT ? OFFSET ?"
+        query_params.extend([limit if limit else -1, offset])
+    
+    cursor = conn.cursor()
+    cursor.execute(query, query_params)
+    
+    count = 0
+    last_row = None
+    for row in cursor:
+        record = {column: row[column] for column in columns}
+        for column in json_columns:
+            if record.get(column):
+                try:
+                    record[column] = json.loads(record[column])
+                except json.JSONDecodeError:
+                    pass
+        
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        count += 1
+        last_row = row
+    
+    if limit and count == limit and last_row is not None:
+        out.write(json.dumps({"next_cursor": encode_cursor(last_row[sort_column] or "", last_row["id"])}) + "\n")
+    
+    out.flush()
+    return count
+
+
+def view_posts_jsonl(db_file: str = 'x_com_posts.db', limit: Optional[int] = None, offset: int = 0,
+                     cursor_token: Optional[str] = None, columns: Optional[str] = None) -> bool:
+    """
+    Stream the posts table as JSON lines (one row per line) for other programs to read.
+    
+    Errors go to stderr so they never mix with the rows on stdout.
+    
+    Returns:
+        True if the posts were written, False on a database error or a bad cursor or column list
+    """
+    try:
+        conn = sqlite3.connect(db_file)
+        conn.row_factory = sqlite3.Row
+        
+        selected = select_columns(columns, get_table_columns(conn, 'posts'))
+        stream_rows_jsonl(conn, 'posts', selected, 'scraped_at', limit=limit, offset=offset, cursor_token=cursor_token)
+        
+        conn.close()
+        return True
+        
+    except sqlite3.Error as e:
+        print(f"SQLite error: {e}", file=sys.stderr)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+    return False
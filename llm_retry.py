@@ -0,0 +1,145 @@
+import os
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional
+
+import requests
+
+# Retry settings for OpenRouter calls: attempts after the first, and the exponential backoff bounds in seconds
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "1"))
+RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "30"))
+
+# A model's circuit opens after this many consecutive outage errors and lets a trial call through after the cooldown
+BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+
+# Rate limiting and provider-side failures are worth retrying; other client errors will fail the same way again
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# Of those, the ones that mean the endpoint is down rather than busy
+OUTAGE_STATUS_CODES = {500, 502, 503, 504}
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a model whose circuit breaker is open."""
+
+def status_code_of(error: Exception) -> Optional[int]:
+    """HTTP status code of a failed request, or None for network errors and everything else."""
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a failed call may succeed if sent again: network errors, timeouts, 429 and 5xx responses."""
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    return isinstance(error, requests.HTTPError) and status_code_of(error) in RETRYABLE_STATUS_CODES
+
+def is_outage(error: Exception) -> bool:
+    """Whether a failed call counts against the endpoint's circuit breaker."""
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    return isinstance(error, requests.HTTPError) and status_code_of(error) in OUTAGE_STATUS_CODES
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Seconds the server asked us to wait in its Retry-After header (delay in seconds or an HTTP date)."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    if not value:
+        return None
+    
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_seconds(attempt: int, retry_after: Optional[float] = None) -> Optional[float]:
+    """
+    Seconds to wait before retry number attempt (starting at 0).
+    
+    Uses exponential backoff with full jitter, so many workers failing at once don't retry in lockstep.
+    A Retry-After from the server is honoured as a minimum; None means it asks for a longer wait than
+    RETRY_MAX_SECONDS and the call should fail now (the job ledger retries it later).
+    """
+    delay = random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** attempt))
+    if retry_after is not None:
+        if retry_after > RETRY_MAX_SECONDS:
+            return None
+        delay = max(delay, retry_after)
+    return delay
+
+class CircuitBreaker:
+    """
+    Stop calling an endpoint that keeps failing.
+    
+    After BREAKER_THRESHOLD consecutive outage errors the circuit opens and calls fail fast with
+    CircuitOpenError. Once the cooldown has passed, calls are let through again (half-open): the
+    first success closes the circuit, the first failure opens it for another cooldown.
+    """
+    
+    def __init__(self, name: str, threshold: int = BREAKER_THRESHOLD, cooldown_seconds: float = BREAKER_COOLDOWN_SECONDS):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+    
+    def before_call(self):
+        """Raise CircuitOpenError while the circuit is open and cooling down."""
+        with self.lock:
+            if self.state != "open":
+                return
+            remaining = self.cooldown_seconds - (time.time() - self.opened_at)
+            if remaining > 0:
+                raise CircuitOpenError(
+                    f"Circuit open for {self.name} after {self.failures} consecutive failures; retrying in {remaining:.0f}s"
+                )
+            self.state = "half-open"
+    
+    def record_success(self):
+        with self.lock:
+            if self.state != "closed":
+                print(f"Circuit closed for {self.name}")
+            self.state = "closed"
+            self.failures = 0
+    
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == "half-open" or (self.state == "closed" and self.failures >= self.threshold):
+                print(f"Circuit opened for {self.name} after {self.failures} consecutive failures")
+                self.state = "open"
+                self.opened_at = time.time()
+    
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"state": self.state, "failures": self.failures}
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    """
+    Get the circuit breaker of an endpoint.
+    
+    OpenRouter serves every model from one URL but each model from its own providers, so
+    breakers are kept per model: one provider's outage doesn't stop calls to the others.
+    """
+    with _breakers_lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker(endpoint)
+        return _breakers[endpoint]
+
+def get_breaker_status() -> Dict[str, Dict[str, Any]]:
+    """State and consecutive failures of every endpoint called so far."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.get_status() for breaker in breakers}
@@ -0,0 +1,277 @@
+import os
+import json
+import time
+import heapq
+import sqlite3
+import threading
+import itertools
+import contextvars
+from contextlib import contextmanager
+from collections import deque
+from typing import Dict, Any, List, Optional
+
+import llm_usage
+
+# Priorities: lower numbers are served first
+INTERACTIVE = 0
+NORMAL = 1
+BACKGROUND = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", NORMAL: "normal", BACKGROUND: "background"}
+
+# Default priority of each stage's calls; discovery and sentiment answer a user waiting on a search
+STAGE_PRIORITIES = {
+    "discover": INTERACTIVE,
+    "sentiment": INTERACTIVE,
+    "validate": NORMAL,
+    "profile": NORMAL,
+    "rank": BACKGROUND,
+    "keywords": BACKGROUND,
+}
+
+# Tokens assumed for a reply when reserving tokens-per-minute capacity before the call
+DEFAULT_COMPLETION_TOKENS = 300
+
+# How often the day's spend is re-read from llm_calls (other processes record calls too)
+SPEND_REFRESH_SECONDS = 60
+
+# Priority override for the calls made inside priority_context()
+_priority_override: contextvars.ContextVar = contextvars.ContextVar("llm_priority", default=None)
+
+class BudgetExceededError(RuntimeError):
+    """Raised when a call would go over the daily spend cap."""
+
+def _env_number(name: str, cast=float) -> Optional[float]:
+    value = os.getenv(name)
+    if not value:
+        return None
+    try:
+        return cast(value)
+    except ValueError:
+        print(f"Ignoring invalid {name}: {value}")
+        return None
+
+@contextmanager
+def priority_context(priority: int):
+    """Run the LLM calls made inside this block at the given priority, e.g. for an interactive search."""
+    token = _priority_override.set(priority)
+    try:
+        yield
+    finally:
+        _priority_override.reset(token)
+
+def map_in_context(executor, fn, items) -> List[Any]:
+    """
+    Run fn over items on a thread pool, returning the results in order.
+    
+    Pool threads don't inherit context variables, so each call runs in a copy of the caller's
+    context: the enclosing priority_context and tracing span still apply to its LLM calls.
+    """
+    futures = [executor.submit(contextvars.copy_context().run, fn, item) for item in items]
+    return [future.result() for future in futures]
+
+def get_priority(stage: Optional[str]) -> int:
+    """Get the priority of a call: the enclosing priority_context, else the stage's default."""
+    override = _priority_override.get()
+    if override is not None:
+        return override
+    return STAGE_PRIORITIES.get(stage or "", NORMAL)
+
+def estimate_tokens(data: Dict[str, Any]) -> int:
+    """Estimate the tokens a request will use (about four characters per token, plus the reply)."""
+    prompt_chars = sum(len(str(message.get("content", ""))) for message in data.get("messages", []))
+    return prompt_chars // 4 + int(data.get("max_tokens") or DEFAULT_COMPLETION_TOKENS)
+
+class Ticket:
+    """A granted request, kept in the rate window until it is a minute old."""
+    
+    def __init__(self, priority: int, tokens: int):
+        self.priority = priority
+        self.tokens = tokens
+        self.granted_at = time.time()
+
+class LLMScheduler:
+    """
+    Share one OpenRouter rate limit and budget between every stage running in the process.
+    
+    Calls wait in a priority queue and are let through, highest priority first, while the
+    requests-per-minute, tokens-per-minute and concurrency limits allow. Background calls leave
+    interactive_reserve of the per-minute capacity free, so a search never queues behind a bulk
+    ranking job. A call that would go over the daily spend cap raises BudgetExceededError.
+    A limit of None means unlimited.
+    """
+    
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None, daily_budget_usd: Optional[float] = None,
+                 max_concurrent: Optional[int] = 8, interactive_reserve: float = 0.2, db_file: str = llm_usage.LLM_USAGE_DB):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.daily_budget_usd = daily_budget_usd
+        self.max_concurrent = max_concurrent
+        self.interactive_reserve = interactive_reserve
+        self.db_file = db_file
+        
+        self.condition = threading.Condition()
+        self.waiting: List = []
+        self.sequence = itertools.count()
+        self.window: deque = deque()
+        self.in_flight = 0
+        
+        self.spend_day = None
+        self.spent_today = 0.0
+        self.spend_checked_at = 0.0
+    
+    def refresh_spend(self, now: float):
+        """Re-read today's spend from llm_calls when the day changes or the last read is stale."""
+        today = time.strftime("%Y-%m-%d", time.gmtime(now))
+        if today == self.spend_day and now - self.spend_checked_at < SPEND_REFRESH_SECONDS:
+            return
+        
+        try:
+            conn = sqlite3.connect(self.db_file, timeout=30)
+            row = conn.execute(
+                "SELECT COALESCE(SUM(cost_usd), 0) FROM llm_calls WHERE created_at >= ?", (today,)
+            ).fetchone()
+            conn.close()
+            self.spent_today = row[0]
+        except sqlite3.Error:
+            # No llm_calls table yet means nothing has been spent
+            if today != self.spend_day:
+                self.spent_today = 0.0
+        self.spend_day = today
+        self.spend_checked_at = now
+    
+    def limit_for(self, limit: Optional[int], priority: int) -> Optional[float]:
+        """The share of a per-minute limit a priority may use."""
+        if limit is None or priority == INTERACTIVE:
+            return limit
+        return limit * (1 - self.interactive_reserve)
+    
+    def wait_seconds(self, priority: int, tokens: int, now: float) -> Optional[float]:
+        """Seconds until a call could be let through, 0 if it can go now, None if only a release can free it."""
+        while self.window and now - self.window[0].granted_at >= 60:
+            self.window.popleft()
+        
+        if self.max_concurrent and self.in_flight >= self.max_concurrent:
+            return None
+        
+        rpm = self.limit_for(self.rpm, priority)
+        if rpm is not None and len(self.window) >= max(1, int(rpm)):
+            # Wait until enough of the oldest requests leave the window
+            excess = len(self.window) - max(1, int(rpm)) + 1
+            return 60 - (now - self.window[excess - 1].granted_at)
+        
+        tpm = self.limit_for(self.tpm, priority)
+        used_tokens = sum(ticket.tokens for ticket in self.window)
+        if tpm is not None and self.window and used_tokens + tokens > tpm:
+            freed = 0
+            for ticket in self.window:
+                freed += ticket.tokens
+                if used_tokens - freed + tokens <= tpm:
+                    return 60 - (now - ticket.granted_at)
+            return 60 - (now - self.window[-1].granted_at)
+        
+        return 0
+    
+    def acquire(self, priority: int, tokens: int) -> Ticket:
+        """Wait until a call may be sent; raises BudgetExceededError when the daily cap is reached."""
+        entry = (priority, next(self.sequence))
+        with self.condition:
+            heapq.heappush(self.waiting, entry)
+            try:
+                while True:
+                    now = time.time()
+                    if self.daily_budget_usd is not None:
+                        self.refresh_spend(now)
+                        if self.spent_today >= self.daily_budget_usd:
+                            raise BudgetExceededError(
+                                f"Daily LLM budget of ${self.daily_budget_usd:.2f} reached (spent ${self.spent_today:.2f})"
+                            )
+                    
+                    # Only the first call in the queue may go, so lower priorities never overtake
+                    if self.waiting[0] == entry:
+                        wait = self.wait_seconds(priority, tokens, now)
+                        if wait is not None and wait <= 0:
+                            break
+                    else:
+                        wait = None
+                    
+                    self.condition.wait(timeout=min(wait, 5) if wait else 5)
+            except BaseException:
+                self.waiting.remove(entry)
+                heapq.heapify(self.waiting)
+                self.condition.notify_all()
+                raise
+            
+            heapq.heappop(self.waiting)
+            ticket = Ticket(priority, tokens)
+            self.window.append(ticket)
+            self.in_flight += 1
+            self.condition.notify_all()
+            return ticket
+    
+    def release(self, ticket: Ticket, total_tokens: Optional[int] = None, cost_usd: Optional[float] = None):
+        """Finish a call, replacing its token estimate with the actual count and adding its cost."""
+        with self.condition:
+            self.in_flight -= 1
+            if total_tokens is not None:
+                ticket.tokens = total_tokens
+            if cost_usd:
+                self.spent_today += cost_usd
+            self.condition.notify_all()
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Current load and limits of the scheduler."""
+        with self.condition:
+            now = time.time()
+            while self.window and now - self.window[0].granted_at >= 60:
+                self.window.popleft()
+            queued = {}
+            for priority, _ in self.waiting:
+                name = PRIORITY_NAMES.get(priority, str(priority))
+                queued[name] = queued.get(name, 0) + 1
+            self.refresh_spend(now)
+            
+            return {
+                "queued": queued,
+                "in_flight": self.in_flight,
+                "requests_last_minute": len(self.window),
+                "tokens_last_minute": sum(ticket.tokens for ticket in self.window),
+                "spent_today_usd": round(self.spent_today, 4),
+                "limits": {
+                    "rpm": self.rpm,
+                    "tpm": self.tpm,
+                    "daily_budget_usd": self.daily_budget_usd,
+                    "max_concurrent": self.max_concurrent,
+                    "interactive_reserve": self.interactive_reserve
+                }
+            }
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> LLMScheduler:
+    """Get the process-wide scheduler, configured from LLM_RPM, LLM_TPM, LLM_DAILY_BUDGET_USD and LLM_MAX_CONCURRENT."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            max_concurrent = _env_number("LLM_MAX_CONCURRENT", int)
+            reserve = _env_number("LLM_INTERACTIVE_RESERVE")
+            _scheduler = LLMScheduler(
+                rpm=_env_number("LLM_RPM", int),
+                tpm=_env_number("LLM_TPM", int),
+                daily_budget_usd=_env_number("LLM_DAILY_BUDGET_USD"),
+                max_concurrent=max_concurrent if max_concurrent is not None else 8,
+                interactive_reserve=reserve if reserve is not None else 0.2
+            )
+        return _scheduler
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Show the LLM scheduler limits and today's spend.")
+    parser.add_argument("--db", default=llm_usage.LLM_USAGE_DB, help="Database file path")
+    
+    args = parser.parse_args()
+    
+    scheduler = get_scheduler()
+    scheduler.db_file = args.db
+    print(json.dumps(scheduler.get_status(), indent=2))
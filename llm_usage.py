@@ -0,0 +1,259 @@
+import sqlite3
+import threading
+import uuid
+from typing import List, Dict, Any, Optional
+
+import progress
+
+# The llm_calls table lives in the main posts database, next to pipeline_runs and job_items
+LLM_USAGE_DB = "x_com_posts.db"
+
+# Estimated USD prices per million (prompt, completion) tokens, used when OpenRouter doesn't report a cost
+MODEL_PRICES = {
+    "openai/gpt-4o": (2.50, 10.00),
+    "gpt-4o": (2.50, 10.00),
+    "openai/gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o-mini": (0.15, 0.60),
+    "openai/o3-mini": (1.10, 4.40),
+}
+
+# Calls made outside main.py or a service job are grouped under one run per process
+_run_id = uuid.uuid4().hex
+_tables_ready = set()
+_tables_lock = threading.Lock()
+
+def set_run_id(run_id: str):
+    """Group the LLM calls made from now on under a run (main.py uses its pipeline run ID)."""
+    global _run_id
+    _run_id = run_id
+
+def get_run_id() -> str:
+    """Get the run the current call belongs to: the service job it runs in, else the current run."""
+    return progress.get_job_id() or _run_id
+
+def estimate_cost(model: Optional[str], prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> Optional[float]:
+    """Estimate the cost of a call in USD from MODEL_PRICES, or None for unknown models."""
+    prices = MODEL_PRICES.get(model or "")
+    if prices is None or prompt_tokens is None or completion_tokens is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+def setup_llm_calls_table(db_file: str = LLM_USAGE_DB):
+    """Create the llm_calls table if it doesn't exist."""
+    conn = sqlite3.connect(db_file)
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS llm_calls (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_id TEXT,
+        stage TEXT,
+        item_id TEXT,
+        model TEXT,
+        prompt_tokens INTEGER,
+        completion_tokens INTEGER,
+        total_tokens INTEGER,
+        latency_ms REAL,
+        cost_usd REAL,
+        status TEXT,
+        error TEXT,
+        tier INTEGER DEFAULT 0,
+        route_id TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    
+    # Tables created before model routing have no tier or route_id column
+    cursor.execute("PRAGMA table_info(llm_calls)")
+    columns = [column[1] for column in cursor.fetchall()]
+    if "tier" not in columns:
+        cursor.execute("ALTER TABLE llm_calls ADD COLUMN tier INTEGER DEFAULT 0")
+    if "route_id" not in columns:
+        cursor.execute("ALTER TABLE llm_calls ADD COLUMN route_id TEXT")
+    
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_stage ON llm_calls(stage, item_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_run ON llm_calls(run_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_route ON llm_calls(route_id, tier)")
+    
+    conn.commit()
+    conn.close()
+
+def record_llm_call(stage: Optional[str], item_id: Optional[Any], model: Optional[str], usage: Optional[Dict[str, Any]],
+                    latency_ms: float, status: str = "ok", error: Optional[str] = None, tier: int = 0,
+                    route_id: Optional[str] = None, db_file: str = LLM_USAGE_DB) -> Optional[float]:
+    """
+    Record one LLM call and return its cost. Failures to record are printed and never break the call itself.
+    
+    Args:
+        stage: Pipeline stage that made the call (keywords, rank, discover, ...)
+        item_id: The post (or query) the call was about
+        model: Model name
+        usage: The usage block of the response (prompt_tokens, completion_tokens, total_tokens, cost)
+        latency_ms: Time from request to decoded response
+        status: "ok" or "error"
+        error: Error message of a failed call
+        tier: Position of the model in the stage's route (0 is the first model tried, see model_router.py)
+        route_id: The routed call the attempt belongs to, shared by its tiers and retries
+    """
+    usage = usage or {}
+    prompt_tokens = usage.get("prompt_tokens")
+    completion_tokens = usage.get("completion_tokens")
+    total_tokens = usage.get("total_tokens")
+    if total_tokens is None and prompt_tokens is not None and completion_tokens is not None:
+        total_tokens = prompt_tokens + completion_tokens
+    
+    # OpenRouter reports the actual cost when usage accounting is requested
+    cost = usage.get("cost")
+    if cost is None:
+        cost = estimate_cost(model, prompt_tokens, completion_tokens)
+    
+    try:
+        with _tables_lock:
+            if db_file not in _tables_ready:
+                setup_llm_calls_table(db_file)
+                _tables_ready.add(db_file)
+        
+        conn = sqlite3.connect(db_file, timeout=30)
+        cursor = conn.cursor()
+        
+        cursor.execute(
+            """
+            INSERT INTO llm_calls (run_id, stage, item_id, model, prompt_tokens, completion_tokens, total_tokens,
+                                   latency_ms, cost_usd, status, error, tier, route_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (get_run_id(), stage, str(item_id) if item_id is not None else None, model, prompt_tokens,
+             completion_tokens, total_tokens, round(latency_ms, 1), cost, status, error[:500] if error else None, tier,
+             route_id)
+        )
+        
+        conn.commit()
+        conn.close()
+    except sqlite3.Error as e:
+        print(f"SQLite error recording LLM call: {e}")
+    
+    return cost
+
+# Columns a report can be grouped by; "post" breaks spend down per item within each stage,
+# "tier" per model within each stage's route, with the share of calls escalated to the next tier
+REPORT_GROUPS = {
+    "stage": ["stage"],
+    "post": ["stage", "item_id"],
+    "run": ["run_id"],
+    "model": ["model"],
+    "tier": ["stage", "tier", "model"],
+}
+
+def get_usage_report(group_by: str = "stage", stage: Optional[str] = None, run_id: Optional[str] = None,
+                     limit: Optional[int] = None, db_file: str = LLM_USAGE_DB) -> List[Dict[str, Any]]:
+    """
+    Sum calls, tokens, latency and cost per group, most expensive first.
+    
+    Args:
+        group_by: One of REPORT_GROUPS
+        stage: Only include calls from this stage
+        run_id: Only include calls from this run
+        limit: Maximum number of groups to return
+    """
+    columns = REPORT_GROUPS[group_by]
+    conditions = []
+    params: List[Any] = []
+    if stage:
+        conditions.append("stage = ?")
+        params.append(stage)
+    if run_id:
+        conditions.append("run_id = ?")
+        params.append(run_id)
+    
+    query = f"""
+    SELECT {', '.join(columns)},
+           COUNT(*) AS calls,
+           SUM(status != 'ok') AS errors,
+           SUM(prompt_tokens) AS prompt_tokens,
+           SUM(completion_tokens) AS completion_tokens,
+           ROUND(AVG(latency_ms), 1) AS avg_latency_ms,
+           SUM(cost_usd) AS cost_usd,
+           MIN(created_at) AS first_call,
+           MAX(created_at) AS last_call
+    FROM llm_calls
+    """
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" GROUP BY {', '.join(columns)} ORDER BY cost_usd DESC, calls DESC"
+    if limit:
+        query += f" LIMIT {int(limit)}"
+    
+    setup_llm_calls_table(db_file)
+    conn = sqlite3.connect(db_file)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    rows = [dict(row) for row in cursor.fetchall()]
+    
+    if group_by == "tier":
+        # A routed call reached tier n if it has an attempt there, and was escalated if it also has one
+        # at a later tier; retries of a tier share the route ID, so they don't count as escalations
+        escalation_query = """
+        SELECT stage, tier, COUNT(DISTINCT route_id) AS routed,
+               COUNT(DISTINCT CASE WHEN EXISTS (
+                   SELECT 1 FROM llm_calls later WHERE later.route_id = llm_calls.route_id AND later.tier > llm_calls.tier
+               ) THEN route_id END) AS escalated
+        FROM llm_calls
+        WHERE route_id IS NOT NULL
+        """
+        if conditions:
+            escalation_query += " AND " + " AND ".join(conditions)
+        escalation_query += " GROUP BY stage, tier"
+        cursor.execute(escalation_query, params)
+        rates = {(row["stage"], row["tier"]): round(row["escalated"] / row["routed"], 3) for row in cursor.fetchall()}
+        
+        # Calls recorded before route IDs were, or made outside the router, have no rate
+        for row in rows:
+            row["escalation_rate"] = rates.get((row["stage"], row["tier"]))
+        rows.sort(key=lambda row: (row["stage"] or "", row["tier"] or 0))
+    
+    conn.close()
+    return rows
+
+def view_usage_report(group_by: str = "stage", stage: Optional[str] = None, run_id: Optional[str] = None,
+                      limit: Optional[int] = None, db_file: str = LLM_USAGE_DB):
+    """Print LLM spend grouped by stage, post, run or model."""
+    try:
+        rows = get_usage_report(group_by, stage, run_id, limit, db_file)
+    except sqlite3.Error as e:
+        print(f"SQLite error: {e}")
+        return
+    
+    if not rows:
+        print("No LLM calls recorded yet.")
+        return
+    
+    label = " / ".join(REPORT_GROUPS[group_by])
+    escalation_header = f" {'Escalated':>10}" if group_by == "tier" else ""
+    print(f"{label:<40} {'Calls':>7} {'Errors':>7} {'Prompt tok':>11} {'Compl tok':>10} {'Avg ms':>9} {'Cost USD':>10}{escalation_header}")
+    total_cost = 0.0
+    for row in rows:
+        name = " / ".join(str(row[column]) for column in REPORT_GROUPS[group_by])
+        cost = row["cost_usd"] or 0.0
+        total_cost += cost
+        escalation = ""
+        if group_by == "tier":
+            rate = row["escalation_rate"]
+            escalation = f" {rate:>10.1%}" if rate is not None else f" {'-':>10}"
+        print(f"{name[:40]:<40} {row['calls']:>7} {row['errors'] or 0:>7} {row['prompt_tokens'] or 0:>11} "
+              f"{row['completion_tokens'] or 0:>10} {row['avg_latency_ms'] or 0:>9} {cost:>10.4f}{escalation}")
+    print(f"\nTotal estimated cost: ${total_cost:.4f}")
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Report LLM token usage and cost.")
+    parser.add_argument("--db", default=LLM_USAGE_DB, help="Database file path")
+    parser.add_argument("--by", choices=REPORT_GROUPS.keys(), default="stage", help="Group calls by stage, post, run, model or routing tier")
+    parser.add_argument("--stage", help="Only include calls from this stage")
+    parser.add_argument("--run", help="Only include calls from this run ID")
+    parser.add_argument("--limit", type=int, help="Maximum number of rows to show")
+    
+    args = parser.parse_args()
+    
+    view_usage_report(args.by, args.stage, args.run, args.limit, args.db)
@@ -4,16 +4,31 @@ Social Media Content Curation System - Main Controller
 
 This script orchestrates the execution of all components in the social media content curation system.
 It allows running the entire pipeline or specific stages of the workflow.
+
+Components are imported and run in-process, in dependency order, so the interpreter, library imports
+and the shared OpenRouter session are set up once per run instead of once per component.
+Components whose dependencies have all finished run concurrently, up to --workers at a time.
+A component whose input watermarks have not changed since its last successful run is skipped,
+and every outcome is recorded in the pipeline_runs table.
 """
 
 import os
 import sys
 import argparse
-import subprocess
+import importlib
 import time
-from typing import List, Optional
+import uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, List, Optional, Tuple
+
+import pipeline_state
+import tracing
+import llm_usage
 
 # Define the components and their execution order
+# "inputs" names the watermarks (see pipeline_state.WATERMARK_SOURCES) a component reads;
+# a component without "inputs" (scrape) always runs. "unfinished" names the source counting the
+# items that failed or were left pending by its earlier runs; while there are any, it isn't skipped.
 COMPONENTS = {
     "scrape": {
         "script": "social_media_scraper.py",
@@ -24,42 +39,53 @@ COMPONENTS = {
     "keywords": {
         "script": "generate_keywords.py",
         "description": "Generate keywords for posts",
-        "depends_on": ["scrape"]
+        "depends_on": ["scrape"],
+        "inputs": ["posts"],
+        "unfinished": "keywords_unfinished"
     },
     "rank": {
         "script": "ranking_llm.py",
         "description": "Rank posts based on user preferences",
-        "depends_on": ["scrape"]
+        "depends_on": ["scrape"],
+        "inputs": ["posts"],
+        "unfinished": "ranking_unfinished"
     },
     "export": {
         "script": "export_keywords.py",
         "description": "Export keywords to text and JSON files",
-        "depends_on": ["keywords"]
+        "depends_on": ["keywords"],
+        "inputs": ["keywords_table"]
     },
     "discover": {
         "script": "user_posts_output.py",
         "description": "Find and select posts based on user query",
-        "depends_on": ["export", "rank"]
+        "depends_on": ["export", "rank"],
+        "inputs": ["posts_keywords", "posts_rankings", "keywords_file", "profile", "preferences"]
     },
     "validate": {
         "script": "user_bot_verification.py",
         "description": "Simulate user validation of selected posts",
-        "depends_on": ["discover"]
+        "depends_on": ["discover"],
+        "inputs": ["selected_posts"],
+        "unfinished": "validation_unfinished"
     },
     "feedback": {
         "script": "user_feedback_sample.py",
         "description": "Generate sample user feedback",
-        "depends_on": ["validate"]
+        "depends_on": ["validate"],
+        "inputs": ["selected_posts"]
     },
     "profile": {
         "script": "dynamic_user_profile.py",
         "description": "Generate dynamic user profile based on feedback",
-        "depends_on": ["feedback"]
+        "depends_on": ["feedback"],
+        "inputs": ["feedback", "base_profile"]
     },
     "view": {
         "script": "view_selected_posts.py",
         "description": "View selected posts with validation status",
-        "depends_on": ["validate"]
+        "depends_on": ["validate"],
+        "inputs": ["selected_posts", "validations"]
     }
 }
 
@@ -88,8 +114,13 @@ def check_dependencies() -> bool:
     
     return True
 
+def load_component_module(component_name: str):
+    """Import the module implementing a component (cached by Python after the first import)."""
+    module_name = os.path.splitext(COMPONENTS[component_name]["script"])[0]
+    return importlib.import_module(module_name)
+
 def run_component(component_name: str, args: List[str] = None, options: argparse.Namespace = None) -> bool:
-    """Run a specific component with optional arguments."""
+    """Run a specific component in-process with optional arguments."""
     if component_name not in COMPONENTS:
         print(f"Error: Unknown component '{component_name}'")
         return False
@@ -105,98 +136,300 @@ def run_component(component_name: str, args: List[str] = None, options: argparse
     print(f"Running {component_name}: {component['description']}")
     print(f"{'='*80}\n")
     
-    cmd = [sys.executable, script]
+    cmd_args = []
     
     # Add default arguments for the component if they exist
     component_default_args = COMPONENTS[component_name].get("default_args", [])
     if component_default_args:
-        cmd.extend(component_default_args)
+        cmd_args.extend(component_default_args)
     
     # Add custom arguments
     if args:
-        cmd.extend(args)
+        cmd_args.extend(args)
     
     # Add component-specific arguments based on options
     if options:
         if component_name == "scrape" and options.post_count != 10:
             # Override the default post count if specified
-            # Find the index of "--count" in the command
+            # Find the index of "--count" in the arguments
             try:
-                count_index = cmd.index("--count")
+                count_index = cmd_args.index("--count")
                 # Replace the value after "--count"
-                cmd[count_index + 1] = str(options.post_count)
+                cmd_args[count_index + 1] = str(options.post_count)
             except ValueError:
-                # If "--count" is not in the command, add it
-                cmd.extend(["--count", str(options.post_count)])
+                # If "--count" is not in the arguments, add it
+                cmd_args.extend(["--count", str(options.post_count)])
     
     try:
-        process = subprocess.run(cmd, check=True)
-        return process.returncode == 0
-    except subprocess.CalledProcessError as e:
-        print(f"Error running {script}: {e}")
+        module = load_component_module(component_name)
+        
+        # Components expose run_cli(argv) for their command-line interface; fall back to main()
+        if hasattr(module, "run_cli"):
+            module.run_cli(cmd_args)
+        else:
+            module.main()
+        return True
+    except SystemExit as e:
+        # argparse and early exits inside a component end up here instead of killing the controller
+        if e.code in (None, 0):
+            return True
+        print(f"Error running {script}: exited with status {e.code}")
         return False
     except Exception as e:
-        print(f"Unexpected error: {e}")
+        print(f"Error running {script}: {e}")
         return False
 
-def run_workflow_stage(stage: str, options: argparse.Namespace = None) -> bool:
-    """Run all components in a workflow stage."""
-    if stage not in WORKFLOW_STAGES:
-        print(f"Error: Unknown workflow stage '{stage}'")
-        return False
+def build_component_args(component: str, options: argparse.Namespace) -> List[str]:
+    """Build the command-line arguments for a component from the controller options."""
+    args = []
     
-    components = WORKFLOW_STAGES[stage]
-    success = True
+    # Add component-specific arguments based on options
+    if component == "keywords" and options.force_keywords:
+        args.append("--force")
+    elif component == "rank" and options.dynamic:
+        args.append("--dynamic")
+    elif component == "discover" and options.dynamic:
+        args.append("--dynamic")
+    elif component == "feedback" and options.feedback_count > 0:
+        args.extend(["--generate", str(options.feedback_count)])
+    elif component == "profile" and options.force_profile:
+        args.append("--force")
     
-    for component in components:
-        args = []
-        
-        # Add component-specific arguments based on options
-        if component == "keywords" and options.force_keywords:
-            args.append("--force")
-        elif component == "rank" and options.dynamic:
-            args.append("--dynamic")
-        elif component == "discover" and options.dynamic:
-            args.append("--dynamic")
-        elif component == "feedback" and options.feedback_count > 0:
-            args.extend(["--generate", str(options.feedback_count)])
-        elif component == "profile" and options.force_profile:
-            args.append("--force")
+    # Special handling for interactive components
+    if component == "discover" and options.query:
+        # For non-interactive mode, we need to provide the query
+        args.extend(["--query", options.query])
+    
+    return args
+
+def get_execution_order(component_names: List[str]) -> List[str]:
+    """
+    Topologically sort components using COMPONENTS[*]["depends_on"].
+    
+    Only dependencies inside the given set are considered, so a single stage can be run on its own.
+    Ties keep the order in which components were given.
+    """
+    selected = [name for name in component_names if name in COMPONENTS]
+    remaining_deps: Dict[str, set] = {
+        name: {dep for dep in COMPONENTS[name]["depends_on"] if dep in selected}
+        for name in selected
+    }
+    
+    order = []
+    while remaining_deps:
+        ready = [name for name in selected if name in remaining_deps and not remaining_deps[name]]
+        if not ready:
+            raise ValueError(f"Dependency cycle between components: {', '.join(remaining_deps)}")
         
-        # Special handling for interactive components
-        if component == "discover" and options.query:
-            # For non-interactive mode, we need to provide the query
-            # This requires modifying user_posts_output.py to accept a --query parameter
-            args.extend(["--query", options.query])
+        for name in ready:
+            order.append(name)
+            del remaining_deps[name]
+        for deps in remaining_deps.values():
+            deps.difference_update(ready)
+    
+    return order
+
+# Arguments that ask a component to redo its work regardless of its inputs
+FORCE_ARGS = {"--force", "--dynamic"}
+
+def should_skip_component(component: str, args: List[str], options: argparse.Namespace) -> Tuple[bool, Optional[str]]:
+    """
+    Decide whether a component can be skipped because its inputs are unchanged.
+    
+    Returns:
+        (skip, watermark) where watermark is the current input watermark, or None if not tracked
+    """
+    inputs = COMPONENTS[component].get("inputs")
+    if inputs is None:
+        return False, None
+    
+    watermark = pipeline_state.compute_watermark(inputs, args)
+    
+    # Forced runs, interactive discovery and --no-incremental always run, but still record their watermark
+    if getattr(options, "no_incremental", False) or FORCE_ARGS.intersection(args):
+        return False, watermark
+    if component == "discover" and not options.query:
+        return False, watermark
+    
+    # Failed items don't change the inputs, so they are retried by running again
+    unfinished = COMPONENTS[component].get("unfinished")
+    unfinished_count = (pipeline_state.WATERMARK_SOURCES[unfinished]() or [0])[0] if unfinished else 0
+    if unfinished_count:
+        print(f"Running {component}: {unfinished_count} items failed or were left pending by earlier runs")
+        return False, watermark
+    
+    return watermark == pipeline_state.get_last_successful_watermark(component), watermark
+
+def run_timed_component(component: str, options: argparse.Namespace, run_id: str,
+                        parent_span: Optional[tracing.Span] = None) -> Tuple[str, float, float]:
+    """Run a component unless its inputs are unchanged, and return (status, start time, end time)."""
+    start = time.time()
+    args = build_component_args(component, options)
+    
+    skip, watermark = should_skip_component(component, args, options)
+    if skip:
+        print(f"Skipping {component}: inputs unchanged since its last successful run")
+        end = time.time()
+        pipeline_state.record_pipeline_run(run_id, component, "skipped", watermark, end - start)
+        return "skipped", start, end
+    
+    # Components run on worker threads, so the run's span is passed in as the parent
+    with tracing.span(f"stage.{component}", "stage", parent=parent_span, run_id=run_id) as span:
+        success = run_component(component, args, options)
+        if not success:
+            span.fail(f"{component} failed")
+    end = time.time()
+    status = "ok" if success else "failed"
+    pipeline_state.record_pipeline_run(run_id, component, status, watermark, end - start)
+    
+    # Add a pause before dependents of this component start, if requested
+    if options.pause > 0:
+        print(f"\nPausing for {options.pause} seconds after {component}...\n")
+        time.sleep(options.pause)
+    
+    return status, start, end
+
+def get_critical_path(order: List[str], timings: Dict[str, Tuple[float, float]]) -> Tuple[List[str], float]:
+    """
+    Find the longest chain of dependent components by run time.
+    
+    Args:
+        order: Components in topological order
+        timings: Map of component name to (start offset, duration) in seconds
         
-        if not run_component(component, args, options):
-            success = False
-            if not options.continue_on_error:
-                print(f"Stopping workflow due to error in {component}")
-                return False
+    Returns:
+        The components on the critical path and its total duration
+    """
+    chain_time = {}
+    previous = {}
+    
+    for name in order:
+        if name not in timings:
+            continue
+        deps = [dep for dep in COMPONENTS[name]["depends_on"] if dep in chain_time]
+        slowest_dep = max(deps, key=lambda dep: chain_time[dep]) if deps else None
+        chain_time[name] = timings[name][1] + (chain_time[slowest_dep] if slowest_dep else 0)
+        previous[name] = slowest_dep
+    
+    if not chain_time:
+        return [], 0.0
+    
+    # Walk back from the component that finishes the longest chain
+    last = max(chain_time, key=chain_time.get)
+    path = []
+    node = last
+    while node:
+        path.append(node)
+        node = previous[node]
+    
+    return list(reversed(path)), chain_time[last]
+
+def print_timing_report(order: List[str], timings: Dict[str, Tuple[float, float]], statuses: Dict[str, str],
+                        wall_time: float):
+    """Print per-component timings and the critical path of a run."""
+    if not timings:
+        return
+    
+    print(f"\n{'='*80}")
+    print("Pipeline timing report")
+    print(f"{'='*80}")
+    print(f"{'Component':<12} {'Status':<8} {'Start':>10} {'Duration':>10}")
+    for name in order:
+        if name in timings:
+            start_offset, duration = timings[name]
+            print(f"{name:<12} {statuses[name]:<8} {start_offset:>9.2f}s {duration:>9.2f}s")
+    
+    total_time = sum(duration for _, duration in timings.values())
+    path, path_time = get_critical_path(order, timings)
+    
+    print(f"\nWall-clock time: {wall_time:.2f}s (sum of component times: {total_time:.2f}s)")
+    print(f"Critical path: {' -> '.join(path)} ({path_time:.2f}s)")
+
+def run_dag(component_names: List[str], options: argparse.Namespace) -> bool:
+    """
+    Run a set of components as a DAG.
+    
+    Components start as soon as all of their dependencies have succeeded, with at most
+    options.workers running at once. Components whose dependencies failed are not run, and
+    components whose inputs are unchanged since their last successful run are skipped.
+    """
+    try:
+        order = get_execution_order(component_names)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return False
+    
+    max_workers = max(1, getattr(options, "workers", 1))
+    pending = list(order)
+    running = {}
+    done = set()
+    failed = set()
+    timings = {}
+    statuses = {}
+    success = True
+    run_id = uuid.uuid4().hex
+    run_start = time.time()
+    
+    pipeline_state.setup_pipeline_runs_table()
+    llm_usage.set_run_id(run_id)
+    
+    with tracing.span("pipeline.run", "stage", run_id=run_id, components=",".join(order)) as run_span, \
+            ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            # Start every component that is ready, up to the worker limit
+            for component in list(pending):
+                deps = [dep for dep in COMPONENTS[component]["depends_on"] if dep in order]
+                failed_deps = [dep for dep in deps if dep in failed]
+                if failed_deps:
+                    print(f"Skipping {component} because its dependencies failed: {', '.join(failed_deps)}")
+                    failed.add(component)
+                    pending.remove(component)
+                elif len(running) < max_workers and all(dep in done for dep in deps):
+                    pending.remove(component)
+                    running[pool.submit(run_timed_component, component, options, run_id, run_span)] = component
+            
+            if not running:
+                break
+            
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                component = running.pop(future)
+                status, start, end = future.result()
+                timings[component] = (start - run_start, end - start)
+                statuses[component] = status
+                
+                if status != "failed":
+                    done.add(component)
+                else:
+                    failed.add(component)
+                    success = False
+                    if not options.continue_on_error:
+                        print(f"Stopping workflow due to error in {component}")
+                        # Let running components finish, but don't start new ones
+                        pending.clear()
+    
+    print_timing_report(order, timings, statuses, time.time() - run_start)
     
     return success
 
+def run_workflow_stage(stage: str, options: argparse.Namespace = None) -> bool:
+    """Run all components in a workflow stage."""
+    if stage not in WORKFLOW_STAGES:
+        print(f"Error: Unknown workflow stage '{stage}'")
+        return False
+    
+    return run_dag(WORKFLOW_STAGES[stage], options)
+
 def run_full_workflow(options: argparse.Namespace) -> bool:
     """Run the complete workflow from start to finish."""
-    stages = list(WORKFLOW_STAGES.keys())
-    
-    # Skip personalized_discovery if not using dynamic profile
-    if not options.dynamic:
-        stages.remove("personalized_discovery")
+    success = run_dag(list(COMPONENTS.keys()), options)
+    if not success and not options.continue_on_error:
+        return False
     
-    success = True
-    for stage in stages:
-        if not run_workflow_stage(stage, options):
+    # Personalized discovery reruns discover with the profile updated by the feedback stage
+    if options.dynamic:
+        if not run_workflow_stage("personalized_discovery", options):
             success = False
-            if not options.continue_on_error:
-                print(f"Stopping workflow due to error in stage {stage}")
-                return False
-        
-        # Add a pause between stages if requested
-        if options.pause > 0:
-            print(f"\nPausing for {options.pause} seconds before next stage...\n")
-            time.sleep(options.pause)
     
     return success
 
@@ -236,12 +469,18 @@ Examples:
     parser.add_argument("--force-profile", action="store_true", help="Force regeneration of dynamic profile")
     parser.add_argument("--feedback-count", type=int, default=10, help="Number of feedback entries to generate")
     parser.add_argument("--continue-on-error", action="store_true", help="Continue workflow even if a component fails")
-    parser.add_argument("--pause", type=int, default=0, help="Pause between stages (seconds)")
+    parser.add_argument("--pause", type=int, default=0, help="Pause after each component before its dependents start (seconds)")
+    parser.add_argument("--no-incremental", action="store_true", help="Run every component even if its inputs are unchanged")
+    parser.add_argument("--workers", type=int, default=4, help="Maximum number of components to run concurrently (default: 4, 1 runs them one at a time)")
     parser.add_argument("--query", help="Query for content discovery (non-interactive mode)")
     parser.add_argument("--post-count", type=int, default=10, help="Number of posts to scrape (default: 10)")
+    parser.add_argument("--trace", help="Append spans for stages, LLM calls, DB queries and browser actions to this JSONL file")
     
     args = parser.parse_args()
     
+    if args.trace:
+        tracing.add_exporter(tracing.append_to_file(args.trace))
+    
     # Check dependencies
     if not check_dependencies():
         return 1
@@ -267,6 +506,9 @@ Examples:
         
         success = run_component(args.component, component_args)
     
+    if args.trace:
+        print(f"\nTrace written to {args.trace} (summarize it with: python tracing.py summary {args.trace})")
+    
     return 0 if success else 1
 
 if __name__ == "__main__":
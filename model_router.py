@@ -0,0 +1,79 @@
+import os
+import uuid
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from openrouter_client import chat_completion
+from llm_retry import CircuitOpenError
+
+# Cheap, fast model tried first by the stages that route their calls
+CHEAP_MODEL = os.getenv("OPENROUTER_CHEAP_MODEL", "openai/gpt-4o-mini")
+
+# Stages whose calls start on CHEAP_MODEL and escalate to the stage's own model when the reply
+# fails validation or isn't confident. Profile generation is left out: it runs rarely and its
+# output feeds every other stage, so it always uses the strong model.
+ROUTED_STAGES = {"keywords", "rank", "discover", "validate", "sentiment"}
+
+# A parse function turns a reply into (value, confident); it raises ValueError for an unusable reply
+ParseFunction = Callable[[str], Tuple[Any, bool]]
+
+def routing_enabled() -> bool:
+    """Routing can be turned off with MODEL_ROUTING=off to send every call to the stage's own model."""
+    return os.getenv("MODEL_ROUTING", "on").lower() not in ("off", "0", "false", "no")
+
+def get_route(stage: str, model: str) -> List[str]:
+    """
+    Get the models a stage's calls go through, cheapest first.
+    
+    MODEL_ROUTE_<STAGE> (e.g. MODEL_ROUTE_RANK="openai/gpt-4o-mini,openai/o3-mini") overrides the
+    route of one stage; otherwise routed stages try CHEAP_MODEL before the stage's own model.
+    """
+    override = os.getenv(f"MODEL_ROUTE_{stage.upper()}")
+    if override:
+        return [name.strip() for name in override.split(",") if name.strip()]
+    
+    if not routing_enabled() or stage not in ROUTED_STAGES or CHEAP_MODEL == model:
+        return [model]
+    return [CHEAP_MODEL, model]
+
+def route_completion(stage: str, data: Dict[str, Any], parse: ParseFunction, item_id: Optional[Any] = None) -> Any:
+    """
+    Send a request through a stage's route, escalating to the next model on a bad or unsure reply.
+    
+    Args:
+        stage: Pipeline stage making the call
+        data: The request body; its model is the stage's strongest model
+        parse: Turns the reply text into (value, confident), raising ValueError if it is unusable
+        item_id: The post (or query) the call is about
+    
+    Returns:
+        The parsed value of the first confident reply, or of the last model's reply.
+        Raises on API errors and when the last model's reply is unusable. A model whose
+        circuit breaker is open is skipped in favour of the next one.
+    """
+    models = get_route(stage, data["model"])
+    
+    # Every attempt of this call is recorded under one route ID, so escalations can be counted per call
+    route_id = uuid.uuid4().hex
+    
+    for tier, model in enumerate(models):
+        last = tier == len(models) - 1
+        try:
+            result = chat_completion(dict(data, model=model), stage=stage, item_id=item_id, tier=tier, route_id=route_id)
+        except CircuitOpenError as e:
+            if last:
+                raise
+            print(f"Escalating {stage} call from {model} to {models[tier + 1]}: {e}")
+            continue
+        content = result["choices"][0]["message"]["content"]
+        
+        try:
+            value, confident = parse(content)
+        except ValueError as e:
+            if last:
+                raise
+            print(f"Escalating {stage} call from {model} to {models[tier + 1]}: {e}")
+            continue
+        
+        if confident or last:
+            return value
+        print(f"Escalating {stage} call from {model} to {models[tier + 1]}: low confidence")
@@ -0,0 +1,134 @@
+import os
+import time
+import threading
+import requests
+from dotenv import load_dotenv
+from typing import Dict, Any, Optional
+import tracing
+import llm_usage
+import llm_scheduler
+import llm_retry
+
+# Load environment variables
+load_dotenv()
+
+# OpenRouter API endpoint (can be overridden, e.g. to point at a local mock server)
+OPENROUTER_API_URL = os.getenv("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
+
+# Seconds to wait for a reply before the attempt counts as failed (and is retried)
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+
+# Shared state so every stage running in the same process reuses one key prompt and one connection pool
+_api_key: Optional[str] = None
+_session: Optional[requests.Session] = None
+_lock = threading.Lock()
+
+def get_api_key() -> str:
+    """Get the OpenRouter API key from the environment, prompting the user only once per process."""
+    global _api_key
+    with _lock:
+        if _api_key is None:
+            _api_key = os.getenv("OPENROUTER_API_KEY")
+            if not _api_key:
+                _api_key = input("Enter your OpenRouter API key: ")
+        return _api_key
+
+def get_session() -> requests.Session:
+    """Get the shared HTTP session used for all OpenRouter calls."""
+    global _session
+    with _lock:
+        if _session is None:
+            _session = requests.Session()
+        return _session
+
+def chat_completion(data: Dict[str, Any], stage: Optional[str] = None, item_id: Optional[Any] = None,
+                    tier: int = 0, route_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Send a chat completion request to OpenRouter, retrying transient failures.
+    
+    Network errors, timeouts, 429 and 5xx responses are retried up to llm_retry.MAX_RETRIES times
+    with jittered exponential backoff, waiting at least as long as a Retry-After header asks.
+    Repeated outages open the model's circuit breaker, after which calls fail fast with
+    llm_retry.CircuitOpenError until its cooldown has passed.
+    
+    Args:
+        data: The request body (model, messages, ...)
+        stage: Pipeline stage making the call, for usage accounting
+        item_id: The post (or query) the call is about, for usage accounting
+        tier: Position of the model in the stage's route, for usage accounting (see model_router.py)
+        route_id: The routed call this request is one step of, shared by its tiers and retries
+    
+    Returns:
+        The decoded JSON response. Raises the last error once retries are exhausted;
+        callers record the item as failed rather than storing a placeholder result.
+    """
+    breaker = llm_retry.get_breaker(data.get("model") or "default")
+    
+    attempt = 0
+    while True:
+        breaker.before_call()
+        try:
+            result = send_completion(data, stage, item_id, tier, route_id)
+        except llm_scheduler.BudgetExceededError:
+            raise
+        except Exception as e:
+            if llm_retry.is_outage(e):
+                breaker.record_failure()
+            if not llm_retry.is_retryable(e) or attempt >= llm_retry.MAX_RETRIES:
+                raise
+            
+            delay = llm_retry.backoff_seconds(attempt, llm_retry.retry_after_seconds(e))
+            if delay is None:
+                raise
+            print(f"Retrying {stage or 'LLM'} call to {data.get('model')} in {delay:.1f}s "
+                  f"(attempt {attempt + 2}/{llm_retry.MAX_RETRIES + 1}): {e}")
+            time.sleep(delay)
+            attempt += 1
+            continue
+        
+        breaker.record_success()
+        return result
+
+def send_completion(data: Dict[str, Any], stage: Optional[str] = None, item_id: Optional[Any] = None,
+                    tier: int = 0, route_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Make one chat completion attempt.
+    
+    Every attempt, failed or not, is recorded in the llm_calls table with its tokens, latency and cost.
+    Attempts wait for the shared scheduler, which serves interactive stages first and enforces the
+    rate limits and daily budget (raising llm_scheduler.BudgetExceededError once it is spent).
+    
+    Returns:
+        The decoded JSON response. Raises on HTTP or network errors.
+    """
+    headers = {
+        "Authorization": f"Bearer {get_api_key()}",
+        "Content-Type": "application/json"
+    }
+    
+    # Ask OpenRouter to include the actual cost in the usage block
+    body = dict(data)
+    body.setdefault("usage", {"include": True})
+    
+    scheduler = llm_scheduler.get_scheduler()
+    ticket = scheduler.acquire(llm_scheduler.get_priority(stage), llm_scheduler.estimate_tokens(data))
+    
+    started = time.perf_counter()
+    try:
+        with tracing.span("llm.chat_completion", "llm", model=data.get("model"), stage=stage, tier=tier) as span:
+            response = get_session().post(OPENROUTER_API_URL, headers=headers, json=body, timeout=REQUEST_TIMEOUT_SECONDS)
+            span.set(status_code=response.status_code, bytes=len(response.content))
+            response.raise_for_status()
+            
+            result = response.json()
+            usage = result.get("usage") or {}
+            span.set(prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"))
+    except Exception as e:
+        scheduler.release(ticket)
+        llm_usage.record_llm_call(stage, item_id, data.get("model"), None, (time.perf_counter() - started) * 1000, "error", str(e), tier, route_id)
+        raise
+    
+    cost = llm_usage.record_llm_call(stage, item_id, data.get("model"), usage, (time.perf_counter() - started) * 1000,
+                                   tier=tier, route_id=route_id)
+    scheduler.release(ticket, usage.get("total_tokens"), cost)
+    return result
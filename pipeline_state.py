@@ -0,0 +1,159 @@
+import sqlite3
+import json
+import os
+import hashlib
+from typing import List, Dict, Any, Optional
+
+# The pipeline_runs table lives in the main posts database
+PIPELINE_DB = "x_com_posts.db"
+
+# Components running side by side write to the posts database; a write waits this long for
+# another component's transaction instead of failing with "database is locked"
+BUSY_TIMEOUT_SECONDS = 30
+
+def connect(db_file: str = PIPELINE_DB) -> sqlite3.Connection:
+    """
+    Open a connection to a database that several components write to at the same time.
+    
+    The database is switched to WAL journaling, so readers don't block the writer, and writes
+    wait up to BUSY_TIMEOUT_SECONDS for the write lock.
+    """
+    conn = sqlite3.connect(db_file, timeout=BUSY_TIMEOUT_SECONDS)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+    except sqlite3.OperationalError:
+        # Leaving rollback journaling needs the database to itself and doesn't wait for the busy
+        # timeout; the connection still works, and a later one makes the switch
+        pass
+    return conn
+
+def query_one(db_file: str, query: str, params: tuple = ()) -> Optional[List[Any]]:
+    """Run a single-row query against a database, returning None if the database or table is missing."""
+    if not os.path.exists(db_file):
+        return None
+    
+    try:
+        conn = sqlite3.connect(db_file)
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        row = cursor.fetchone()
+        conn.close()
+        return list(row) if row else None
+    except sqlite3.Error:
+        return None
+
+def file_fingerprint(*file_paths: str) -> Optional[str]:
+    """Hash the contents of one or more files (missing files hash as empty)."""
+    digest = hashlib.sha256()
+    found = False
+    
+    for file_path in file_paths:
+        if os.path.exists(file_path):
+            found = True
+            with open(file_path, 'rb') as f:
+                digest.update(f.read())
+        digest.update(b"\0")
+    
+    return digest.hexdigest() if found else None
+
+def text_fingerprint(text: str) -> str:
+    """Hash a piece of text, e.g. the profile a cached LLM result was made with."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def normalize_query(query: Optional[str]) -> str:
+    """Normalize a search query for cache keys, ignoring case, repeated whitespace and surrounding punctuation."""
+    return " ".join((query or "").lower().split()).strip(" .,!?;:\"'")
+
+def profile_fingerprint() -> Optional[str]:
+    """Hash every source the LLM stages read the user profile from."""
+    env_profile = os.getenv("USER_PROFILE_CONTENT")
+    if env_profile:
+        return text_fingerprint(env_profile)
+    
+    return file_fingerprint("dynamic_user_profile.md", "user_profile.txt")
+
+# Input watermarks a component can declare in main.COMPONENTS[*]["inputs"], and the counts of
+# unfinished items it can declare in main.COMPONENTS[*]["unfinished"]
+WATERMARK_SOURCES = {
+    "posts": lambda: query_one("x_com_posts.db", "SELECT MAX(id), COUNT(*) FROM posts"),
+    "posts_keywords": lambda: query_one("x_com_posts.db", "SELECT COUNT(keywords) FROM posts WHERE keywords != ''"),
+    "posts_rankings": lambda: query_one("x_com_posts.db", "SELECT COUNT(user_ranking), SUM(user_ranking) FROM posts"),
+    "keywords_table": lambda: query_one("x_com_posts.db", "SELECT COUNT(*), SUM(frequency) FROM keywords"),
+    "keywords_file": lambda: file_fingerprint("keywords.txt"),
+    "profile": profile_fingerprint,
+    "base_profile": lambda: file_fingerprint("user_profile.txt"),
+    "selected_posts": lambda: query_one("posts_selected.db", "SELECT MAX(id), COUNT(*) FROM selected_posts"),
+    "validations": lambda: query_one("posts_selected.db", "SELECT COUNT(llm_clone_validated) FROM selected_posts WHERE llm_clone_validated NOT IN ('', 'failed')"),
+    "preferences": lambda: file_fingerprint("preference_vector.json"),
+    "keywords_unfinished": lambda: query_one("x_com_posts.db", "SELECT COUNT(*) FROM job_items WHERE job = 'keywords' AND status != 'ok'"),
+    "ranking_unfinished": lambda: query_one("x_com_posts.db", "SELECT COUNT(*) FROM job_items WHERE job = 'ranking' AND status != 'ok'"),
+    "validation_unfinished": lambda: query_one("posts_selected.db", "SELECT COUNT(*) FROM selected_posts WHERE llm_clone_validated IS NULL OR llm_clone_validated IN ('', 'failed')"),
+    "feedback": lambda: query_one("user_feedback.db", "SELECT MAX(id), MAX(feedback_timestamp) FROM user_feedback"),
+}
+
+def compute_watermark(inputs: List[str], args: List[str]) -> str:
+    """
+    Compute the current input watermark of a component.
+    
+    Args:
+        inputs: Names of watermark sources from WATERMARK_SOURCES
+        args: The component's command-line arguments (a different invocation never reuses a run)
+    
+    Returns:
+        The watermark as a canonical JSON string
+    """
+    watermark = {"args": args}
+    for name in inputs:
+        watermark[name] = WATERMARK_SOURCES[name]()
+    
+    return json.dumps(watermark, sort_keys=True)
+
+def setup_pipeline_runs_table(db_file: str = PIPELINE_DB):
+    """Create the pipeline_runs table if it doesn't exist."""
+    conn = sqlite3.connect(db_file)
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS pipeline_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_id TEXT,
+        component TEXT,
+        status TEXT,
+        input_watermark TEXT,
+        duration_seconds REAL,
+        finished_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_pipeline_runs_component ON pipeline_runs(component, status)")
+    
+    conn.commit()
+    conn.close()
+
+def get_last_successful_watermark(component: str, db_file: str = PIPELINE_DB) -> Optional[str]:
+    """Get the input watermark of the last successful run of a component."""
+    row = query_one(
+        db_file,
+        "SELECT input_watermark FROM pipeline_runs WHERE component = ? AND status = 'ok' ORDER BY id DESC LIMIT 1",
+        (component,)
+    )
+    return row[0] if row else None
+
+def record_pipeline_run(run_id: str, component: str, status: str, input_watermark: Optional[str],
+                        duration_seconds: float, db_file: str = PIPELINE_DB):
+    """Record the outcome (ok, failed or skipped) of a component run."""
+    try:
+        conn = sqlite3.connect(db_file)
+        cursor = conn.cursor()
+        
+        cursor.execute(
+            """
+            INSERT INTO pipeline_runs (run_id, component, status, input_watermark, duration_seconds)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (run_id, component, status, input_watermark, duration_seconds)
+        )
+        
+        conn.commit()
+        conn.close()
+    except sqlite3.Error as e:
+        print(f"SQLite error recording pipeline run: {e}")
@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from typing import Callable, Dict, Any, List, Optional
+
+# Functions called with every progress event; python_service.py registers one to relay
+# events to the website, and PROGRESS_FILE adds one that appends events as JSON lines
+_listeners: List[Callable[[Dict[str, Any]], None]] = []
+_listeners_lock = threading.Lock()
+
+# The job the current context is working for, attached to the events it emits. A context
+# variable, unlike a thread-local, follows the work into pool threads started with
+# llm_scheduler.map_in_context
+_current_job_id: contextvars.ContextVar = contextvars.ContextVar("progress_job_id", default=None)
+
+def add_listener(listener: Callable[[Dict[str, Any]], None]):
+    """Call a function with every progress event."""
+    with _listeners_lock:
+        _listeners.append(listener)
+
+def remove_listener(listener: Callable[[Dict[str, Any]], None]):
+    """Stop calling a function registered with add_listener."""
+    with _listeners_lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+def set_job_id(job_id: Optional[str]):
+    """Attach the events emitted by the current context to a job."""
+    _current_job_id.set(job_id)
+
+def get_job_id() -> Optional[str]:
+    """Get the job the current context is working for."""
+    return _current_job_id.get()
+
+def emit(event: Dict[str, Any]):
+    """Send an event to every listener; a failing listener never breaks the stage emitting it."""
+    event.setdefault("job_id", get_job_id())
+    event.setdefault("timestamp", time.time())
+    
+    with _listeners_lock:
+        listeners = list(_listeners)
+    
+    for listener in listeners:
+        try:
+            listener(event)
+        except Exception as e:
+            print(f"Error in progress listener: {e}")
+
+def append_to_file(file_path: str) -> Callable[[Dict[str, Any]], None]:
+    """Create a listener that appends events to a file as JSON lines."""
+    lock = threading.Lock()
+    
+    def listener(event: Dict[str, Any]):
+        with lock, open(file_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(event) + "\n")
+    
+    return listener
+
+class ProgressReporter:
+    """
+    Report the progress of a stage that processes a known number of items.
+    
+    Each event carries the items done and failed so far, the processing rate and the
+    estimated time left, so a caller can show progress without parsing printed output.
+    """
+    
+    def __init__(self, stage: str, total: int):
+        self.stage = stage
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.started_at = time.time()
+        self.emit("started")
+    
+    def emit(self, event_type: str, **details):
+        elapsed = time.time() - self.started_at
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        remaining = max(self.total - self.done, 0)
+        
+        event = {
+            "type": event_type,
+            "stage": self.stage,
+            "done": self.done,
+            "total": self.total,
+            "failed": self.failed,
+            "elapsed_seconds": round(elapsed, 2),
+            "items_per_second": round(rate, 3),
+            "eta_seconds": round(remaining / rate, 1) if rate > 0 else None
+        }
+        event.update(details)
+        emit(event)
+    
+    def advance(self, item_id: Optional[Any] = None, error: Optional[str] = None):
+        """Record one processed item, and its error if it failed."""
+        self.done += 1
+        if error:
+            self.failed += 1
+            self.emit("progress", item_id=item_id, error=str(error)[:500])
+        else:
+            self.emit("progress", item_id=item_id)
+    
+    def error(self, message: str):
+        """Report an error that isn't tied to a single item."""
+        self.emit("error", error=str(message)[:500])
+    
+    def finish(self):
+        """Report that the stage has finished."""
+        self.emit("finished")
+
+# Scripts run as subprocesses can write their events to a file given by the caller
+if os.getenv("PROGRESS_FILE"):
+    add_listener(append_to_file(os.getenv("PROGRESS_FILE")))
@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+"""
+Long-running Python service for the website.
+
+website/server.js used to start a new Python process for every search, ranking or keyword request
+and regex-parse its printed output. This service keeps the components imported (and the shared
+OpenRouter session and a read connection to the posts database open) and exposes their operations
+as JSON calls over local HTTP:
+
+    POST /rpc  {"method": "search", "params": {"query": "..."}}
+    ->         {"result": {...}}  or  {"error": "..."}
+
+Run it from the repository root:
+
+    python python_service.py --port 5001
+
+Long-running operations (scrape, rank, keywords) can also be started as background jobs with
+start_job. Their progress events are kept per job and read with job_events, and every job is
+recorded in the jobs table so its outcome can be looked up after it finishes.
+"""
+
+import os
+import json
+import sqlite3
+import threading
+import time
+import argparse
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Any, Optional
+
+import user_posts_output
+import sentiment_analysis
+import user_bot_verification
+import ranking_llm
+import generate_keywords
+import export_keywords
+import dynamic_user_profile
+import progress
+import feed_query
+import tracing
+import llm_scheduler
+import llm_retry
+
+DEFAULT_PORT = 5001
+
+# Operations that write to the posts database or the profile run one at a time. Search doesn't
+# take the lock: it only reads the posts database, and its own writes (query results, validations
+# and the query and sentiment caches) go to posts_selected.db in short transactions that wait for
+# each other through the WAL connection's busy timeout, so a long rank job never holds it up
+write_lock = threading.Lock()
+
+# Read connection to the posts database, opened on first use and shared between requests
+_posts_conn = None
+_posts_conn_lock = threading.Lock()
+
+# Operations that can run as background jobs
+JOB_KINDS = ("scrape", "rank", "keywords")
+
+# Progress events of the jobs started since the service started, keyed by job ID
+MAX_EVENTS_PER_JOB = 1000
+_job_events: Dict[str, List[Dict[str, Any]]] = {}
+_job_status: Dict[str, str] = {}
+_jobs_lock = threading.Lock()
+
+# Profile updates queued within this many seconds of each other are coalesced into one run
+PROFILE_DEBOUNCE_SECONDS = float(os.getenv("PROFILE_DEBOUNCE_SECONDS", "5"))
+
+# Profile update triggers waiting for the worker; at most one worker runs at a time
+_profile_queue = {"triggers": 0, "full": False, "last_trigger": 0.0, "worker_running": False}
+_profile_queue_lock = threading.Condition()
+
+def get_posts_connection(db_file: str = 'x_com_posts.db') -> sqlite3.Connection:
+    """Get the shared read connection to the posts database."""
+    global _posts_conn
+    if _posts_conn is None:
+        _posts_conn = sqlite3.connect(db_file, check_same_thread=False)
+        _posts_conn.row_factory = sqlite3.Row
+        feed_query.setup_feed_indexes(_posts_conn)
+    return _posts_conn
+
+def fetch_posts(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Get one page of scraped posts, newest first, with their keywords and rankings."""
+    min_ranking = params.get("min_ranking")
+    
+    with _posts_conn_lock:
+        return feed_query.get_feed_page(
+            get_posts_connection(),
+            limit=params.get("limit") or feed_query.DEFAULT_PAGE_SIZE,
+            cursor_token=params.get("cursor"),
+            min_ranking=int(min_ranking) if min_ranking not in (None, "") else None,
+            keyword=params.get("keyword"),
+            username=params.get("username")
+        )
+
+def search(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Select posts for a query, optionally validate them, then analyze the sentiment of the selection."""
+    query = params.get("query")
+    if not query:
+        raise ValueError("Search query is required")
+    
+    # The profile server.js sends is passed along with the call; a process-wide setting would leak
+    # into concurrent and later requests
+    profile = params.get("profile") or None
+    
+    # A user is waiting on the search, so its LLM calls go ahead of background jobs
+    with llm_scheduler.priority_context(llm_scheduler.INTERACTIVE):
+        user_posts_output.main_with_query(query, user_profile=profile)
+        
+        # Batched validation keeps judging the selection within the time a user waits for a search
+        if params.get("validate"):
+            unvalidated = user_bot_verification.get_unvalidated_posts(query=query)
+            if unvalidated and user_bot_verification.setup_database():
+                user_bot_verification.validate_selected_posts(profile or user_bot_verification.load_user_profile(), unvalidated)
+        
+        posts = sentiment_analysis.get_selected_posts(query)
+        for post in posts:
+            post["keywords"] = feed_query.parse_keywords(post.get("keywords"))
+        
+        # The lexicon score needs no LLM call, so it is the default. The LLM summary only runs when
+        # asked for with sentiment_mode "llm": an unchanged selection reuses its analysis and a
+        # changed one gets the previous analysis while it is refreshed
+        if params.get("sentiment_mode") == "llm":
+            sentiment = sentiment_analysis.analyze_sentiment_cached(posts, query, background=True) if posts else None
+        else:
+            sentiment = sentiment_analysis.local_sentiment(query) if posts else None
+    
+    if not sentiment:
+        sentiment = {
+            "summary": "No posts found for this query.",
+            "sentiment": "neutral",
+            "sentiment_score": 50,
+            "key_points": []
+        }
+    
+    return {"posts": posts, "sentiment_analysis": sentiment}
+
+def rank(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Rank posts that don't have a ranking yet."""
+    with write_lock:
+        ranking_llm.process_posts(limit=params.get("limit"), resume=bool(params.get("resume")),
+                                  user_profile=params.get("profile") or None)
+    return {"message": "Posts ranked"}
+
+def keywords(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Generate keywords for posts that don't have them yet."""
+    with write_lock:
+        generate_keywords.process_posts(limit=params.get("limit"), resume=bool(params.get("resume")))
+    return {"message": "Keywords generated"}
+
+def export(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Export the keywords table to keywords.txt."""
+    with write_lock:
+        export_keywords.export_keywords()
+    return {"message": "Feed prepared"}
+
+def update_profile(incremental: bool):
+    """Regenerate the dynamic user profile, or count new feedback and edit the profile on drift."""
+    with write_lock:
+        if incremental:
+            if not dynamic_user_profile.update_profile_incrementally():
+                raise RuntimeError("Dynamic user profile update failed; the current profile was kept")
+        elif not dynamic_user_profile.main():
+            raise RuntimeError("Dynamic user profile generation failed; the current profile was kept")
+
+def profile_worker():
+    """
+    Run queued profile updates one at a time until none are left.
+    
+    The worker waits until no trigger has arrived for PROFILE_DEBOUNCE_SECONDS, then runs one update
+    for all the triggers so far (a full regeneration if any of them asked for one). Triggers that
+    arrive during the update are coalesced into the next run.
+    """
+    while True:
+        with _profile_queue_lock:
+            while True:
+                if not _profile_queue["triggers"]:
+                    _profile_queue["worker_running"] = False
+                    return
+                remaining = _profile_queue["last_trigger"] + PROFILE_DEBOUNCE_SECONDS - time.monotonic()
+                if remaining <= 0:
+                    break
+                _profile_queue_lock.wait(remaining)
+            
+            triggers, full = _profile_queue["triggers"], _profile_queue["full"]
+            _profile_queue["triggers"], _profile_queue["full"] = 0, False
+        
+        print(f"Updating the dynamic user profile for {triggers} queued trigger(s)...")
+        try:
+            with tracing.span("job.profile", "job", triggers=triggers):
+                update_profile(incremental=not full)
+        except Exception as e:
+            print(f"Error updating dynamic user profile: {e}")
+
+def queue_profile_update(incremental: bool) -> int:
+    """Queue a profile update for the worker, starting it if it isn't running, and return the queued trigger count."""
+    with _profile_queue_lock:
+        _profile_queue["triggers"] += 1
+        _profile_queue["full"] = _profile_queue["full"] or not incremental
+        _profile_queue["last_trigger"] = time.monotonic()
+        triggers = _profile_queue["triggers"]
+        
+        if not _profile_queue["worker_running"]:
+            _profile_queue["worker_running"] = True
+            threading.Thread(target=profile_worker, daemon=True).start()
+    return triggers
+
+def profile(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Regenerate the dynamic user profile from feedback, or with incremental set, count it and edit the profile on drift.
+    
+    With queue set the update is left to the profile worker, which coalesces bursts of triggers, and
+    the call returns at once.
+    """
+    incremental = bool(params.get("incremental"))
+    if params.get("queue"):
+        triggers = queue_profile_update(incremental)
+        return {"message": "Dynamic user profile update queued", "queued_triggers": triggers}
+    
+    update_profile(incremental)
+    return {"message": "Dynamic user profile updated"}
+
+def scrape(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Scrape new posts with the browser agent."""
+    # The browser agent's dependencies are only imported when scraping is requested
+    import social_media_scraper
+    
+    post_count = int(params.get("count") or 10)
+    with write_lock:
+        social_media_scraper.job(post_count)
+    return {"message": "Scraping completed"}
+
+def setup_jobs_table(db_file: str = 'x_com_posts.db'):
+    """Create the jobs table if it doesn't exist."""
+    conn = sqlite3.connect(db_file)
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        kind TEXT,
+        params TEXT,
+        status TEXT,
+        last_event TEXT,
+        error TEXT,
+        started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        finished_at DATETIME
+    )
+    ''')
+    
+    conn.commit()
+    conn.close()
+
+def save_job(job_id: str, kind: str, params: Dict[str, Any], status: str,
+             last_event: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+    """Insert or update a job in the jobs table."""
+    # The profile text is passed along with the call and isn't worth keeping
+    stored_params = {key: value for key, value in params.items() if key != "profile"}
+    
+    try:
+        conn = sqlite3.connect('x_com_posts.db')
+        cursor = conn.cursor()
+        
+        cursor.execute(
+            """
+            INSERT INTO jobs (id, kind, params, status, last_event, error) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                status = excluded.status,
+                last_event = excluded.last_event,
+                error = excluded.error,
+                finished_at = CASE WHEN excluded.status = 'running' THEN NULL ELSE CURRENT_TIMESTAMP END
+            """,
+            (job_id, kind, json.dumps(stored_params), status,
+             json.dumps(last_event) if last_event else None, error)
+        )
+        
+        conn.commit()
+        conn.close()
+    except sqlite3.Error as e:
+        print(f"SQLite error saving job {job_id}: {e}")
+
+def record_event(event: Dict[str, Any]):
+    """Keep a progress event for the job that emitted it (progress listener)."""
+    job_id = event.get("job_id")
+    with _jobs_lock:
+        events = _job_events.get(job_id)
+        if events is None:
+            return
+        
+        # Sequence numbers keep counting when old events are dropped, so readers never skip any
+        event = dict(event, seq=(events[-1]["seq"] + 1) if events else 1)
+        events.append(event)
+        if len(events) > MAX_EVENTS_PER_JOB:
+            del events[0]
+
+def run_job(job_id: str, kind: str, params: Dict[str, Any]):
+    """Run an operation in the background, attaching its progress events to the job."""
+    progress.set_job_id(job_id)
+    try:
+        with tracing.span(f"job.{kind}", "job", job_id=job_id):
+            result = METHODS[kind](params)
+        status, error = "ok", None
+    except Exception as e:
+        print(f"Error in job {job_id} ({kind}): {e}")
+        status, error, result = "failed", str(e), None
+    finally:
+        progress.set_job_id(None)
+    
+    # The final event tells readers the job is over and how it ended
+    progress.emit({"job_id": job_id, "type": "job_finished", "status": status, "error": error, "result": result})
+    
+    with _jobs_lock:
+        _job_status[job_id] = status
+        events = _job_events.get(job_id) or []
+        last_progress = next((e for e in reversed(events) if e.get("stage")), None)
+    
+    save_job(job_id, kind, params, status, last_progress, error)
+
+def start_job(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Start scrape, rank or keywords in the background and return its job ID."""
+    kind = params.get("kind")
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unknown job kind: {kind} (expected one of {', '.join(JOB_KINDS)})")
+    
+    job_params = params.get("params") or {}
+    job_id = uuid.uuid4().hex
+    
+    with _jobs_lock:
+        _job_events[job_id] = []
+        _job_status[job_id] = "running"
+    save_job(job_id, kind, job_params, "running")
+    
+    threading.Thread(target=run_job, args=(job_id, kind, job_params), daemon=True).start()
+    return {"job_id": job_id}
+
+def job_events(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Get the progress events of a job after a sequence number."""
+    job_id = params.get("job_id")
+    after = int(params.get("after") or 0)
+    
+    with _jobs_lock:
+        if job_id not in _job_events:
+            raise ValueError(f"Unknown job or job not started by this service: {job_id}")
+        events = [event for event in _job_events[job_id] if event["seq"] > after]
+        status = _job_status[job_id]
+    
+    return {"job_id": job_id, "status": status, "events": events}
+
+def job_status(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Look up a job (including jobs that finished before the service restarted)."""
+    job_id = params.get("job_id")
+    
+    conn = sqlite3.connect('x_com_posts.db')
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+    row = cursor.fetchone()
+    conn.close()
+    
+    if not row:
+        raise ValueError(f"Unknown job: {job_id}")
+    
+    job = dict(row)
+    job["params"] = json.loads(job["params"]) if job["params"] else {}
+    job["last_event"] = json.loads(job["last_event"]) if job["last_event"] else None
+    
+    # A running job's latest event is only kept in memory
+    with _jobs_lock:
+        events = _job_events.get(job_id)
+        if job["status"] == "running" and events:
+            job["last_event"] = next((e for e in reversed(events) if e.get("stage")), job["last_event"])
+    
+    return job
+
+def list_jobs(params: Dict[str, Any]) -> Dict[str, Any]:
+    """List the most recent jobs."""
+    limit = int(params.get("limit") or 20)
+    
+    conn = sqlite3.connect('x_com_posts.db')
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, kind, status, error, started_at, finished_at FROM jobs ORDER BY started_at DESC LIMIT ?", (limit,))
+    jobs = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    
+    return {"jobs": jobs}
+
+def scheduler_status(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Report the LLM scheduler's queue, load and limits, and the state of each model's circuit breaker."""
+    status = llm_scheduler.get_scheduler().get_status()
+    status["circuits"] = llm_retry.get_breaker_status()
+    return status
+
+def health(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Report that the service is up."""
+    return {"status": "ok", "pid": os.getpid()}
+
+METHODS = {
+    "fetch_posts": fetch_posts,
+    "search": search,
+    "rank": rank,
+    "keywords": keywords,
+    "export": export,
+    "profile": profile,
+    "scrape": scrape,
+    "start_job": start_job,
+    "job_events": job_events,
+    "job_status": job_status,
+    "list_jobs": list_jobs,
+    "scheduler_status": scheduler_status,
+    "health": health,
+}
+
+# Methods the website polls; tracing them would bury the spans of real work
+UNTRACED_METHODS = {"job_events", "job_status", "list_jobs", "scheduler_status", "health"}
+
+class RPCHandler(BaseHTTPRequestHandler):
+    """Handle JSON calls posted to /rpc."""
+    
+    def send_json(self, status: int, body: Dict[str, Any]):
+        payload = json.dumps(body, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+    
+    def do_POST(self):
+        if self.path != "/rpc":
+            self.send_json(404, {"error": f"Unknown path: {self.path}"})
+            return
+        
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except (ValueError, json.JSONDecodeError) as e:
+            self.send_json(400, {"error": f"Invalid JSON request: {e}"})
+            return
+        
+        method = METHODS.get(request.get("method"))
+        if not method:
+            self.send_json(400, {"error": f"Unknown method: {request.get('method')}"})
+            return
+        
+        try:
+            if request.get("method") in UNTRACED_METHODS:
+                result = method(request.get("params") or {})
+            else:
+                with tracing.span(f"rpc.{request.get('method')}", "stage"):
+                    result = method(request.get("params") or {})
+            self.send_json(200, {"result": result})
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+        except Exception as e:
+            print(f"Error in {request.get('method')}: {e}")
+            self.send_json(500, {"error": str(e)})
+    
+    def log_message(self, format, *args):
+        print(f"python_service: {format % args}")
+
+def run_service(port: int = DEFAULT_PORT, host: str = "127.0.0.1"):
+    """Serve JSON calls until interrupted."""
+    setup_jobs_table()
+    
+    # Jobs left running when the service last stopped will never finish
+    conn = sqlite3.connect('x_com_posts.db')
+    conn.execute("UPDATE jobs SET status = 'failed', error = 'Service stopped', finished_at = CURRENT_TIMESTAMP WHERE status = 'running'")
+    conn.commit()
+    conn.close()
+    
+    progress.add_listener(record_event)
+    
+    server = ThreadingHTTPServer((host, port), RPCHandler)
+    print(f"Python service listening on http://{host}:{port}/rpc")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down Python service...")
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the curation components to the website as JSON calls.")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PYTHON_SERVICE_PORT", DEFAULT_PORT)), help="Port to listen on")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to bind to")
+    
+    args = parser.parse_args()
+    
+    run_service(args.port, args.host)
@@ -0,0 +1,96 @@
+import os
+import json
+import sqlite3
+from typing import List, Dict, Any, Optional
+
+import pipeline_state
+
+# Cached searches live in the selected posts database, next to the query results they produced
+QUERY_CACHE_DB = "posts_selected.db"
+
+# How long a cached search is reused while the posts don't change (0 turns the cache off)
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "600"))
+
+# A cached search is only valid for the posts, keywords, rankings and preferences it was computed from
+WATERMARK_INPUTS = ["posts", "posts_keywords", "posts_rankings", "keywords_file", "preferences"]
+
+def cache_enabled() -> bool:
+    return QUERY_CACHE_TTL_SECONDS > 0
+
+def current_watermark() -> str:
+    """Watermark of the search inputs; new posts, new keywords, changed rankings or preferences give a different one."""
+    return pipeline_state.compute_watermark(WATERMARK_INPUTS, [])
+
+def setup_query_cache(conn: sqlite3.Connection):
+    """Create the query_cache table if it doesn't exist."""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS query_cache (
+        query TEXT,
+        profile_hash TEXT,
+        watermark TEXT,
+        keywords TEXT,
+        post_ids TEXT,
+        cached_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (query, profile_hash)
+    )
+    ''')
+
+def get_cached_query(query: str, user_profile: Optional[str], watermark: str,
+                     db_file: str = QUERY_CACHE_DB) -> Optional[Dict[str, Any]]:
+    """
+    Look up an earlier search for the same (normalized) query and profile.
+    
+    Args:
+        query: The user query
+        user_profile: The profile the search is run with
+        watermark: The current watermark from current_watermark()
+    
+    Returns:
+        {"keywords": [...], "post_ids": [...]} with the ranked post IDs, best first, or None if
+        there is no entry, it has expired or the posts have changed since it was stored
+    """
+    if not cache_enabled() or not os.path.exists(db_file):
+        return None
+    
+    try:
+        conn = sqlite3.connect(db_file)
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT keywords, post_ids FROM query_cache
+            WHERE query = ? AND profile_hash = ? AND watermark = ? AND cached_at > datetime('now', ?)
+            """,
+            (pipeline_state.normalize_query(query), pipeline_state.text_fingerprint(user_profile or ""),
+             watermark, f"-{QUERY_CACHE_TTL_SECONDS} seconds")
+        )
+        row = cursor.fetchone()
+        conn.close()
+    except sqlite3.Error:
+        return None
+    
+    if not row:
+        return None
+    return {"keywords": json.loads(row[0]), "post_ids": json.loads(row[1])}
+
+def save_cached_query(query: str, user_profile: Optional[str], watermark: str, keywords: List[str],
+                      post_ids: List[int], db_file: str = QUERY_CACHE_DB):
+    """Store the keywords and ranked post IDs of a search, dropping entries that have expired."""
+    if not cache_enabled():
+        return
+    
+    try:
+        conn = pipeline_state.connect(db_file)
+        setup_query_cache(conn)
+        with conn:
+            conn.execute("DELETE FROM query_cache WHERE cached_at <= datetime('now', ?)", (f"-{QUERY_CACHE_TTL_SECONDS} seconds",))
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO query_cache (query, profile_hash, watermark, keywords, post_ids)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (pipeline_state.normalize_query(query), pipeline_state.text_fingerprint(user_profile or ""),
+                 watermark, json.dumps(keywords), json.dumps(post_ids))
+            )
+        conn.close()
+    except sqlite3.Error as e:
+        print(f"SQLite error caching query: {e}")
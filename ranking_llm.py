@@ -2,24 +2,24 @@ import sqlite3
 import json
 import os
 import time
-import requests
 from dotenv import load_dotenv
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+from model_router import route_completion
+import job_ledger
+import pipeline_state
+import feedback_preferences
+from progress import ProgressReporter
+import tracing
 
 # Load environment variables
 load_dotenv()
 
-# Get OpenRouter API key from environment variable or prompt user
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-if not OPENROUTER_API_KEY:
-    OPENROUTER_API_KEY = input("Enter your OpenRouter API key: ")
-
-# OpenRouter API endpoint
-OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
-
 # Model to use (default to o3 mini as requested)
 MODEL = "openai/o3-mini"
 
+# Rankings this close to 50 from the cheap model are treated as unsure and asked again of MODEL
+RANKING_CONFIDENCE_MARGIN = 10
+
 def load_user_profile():
     """Load the user profile, preferring environment variable, then dynamic profile, then file."""
     # First check if profile is provided in environment variable (from server.js)
@@ -49,7 +49,7 @@ def load_user_profile():
 
 def setup_database():
     """Set up the database with necessary tables and columns."""
-    conn = sqlite3.connect("x_com_posts.db")
+    conn = pipeline_state.connect("x_com_posts.db")
     cursor = conn.cursor()
     
     # Check if user_ranking column exists in posts table, add if it doesn't
@@ -64,9 +64,10 @@ def setup_database():
     conn.close()
     print("Database setup complete.")
 
-def get_posts_for_ranking(limit: Optional[int] = None) -> List[Dict[str, Any]]:
-    """Get posts that need to be ranked."""
-    conn = sqlite3.connect("x_com_posts.db")
+@tracing.traced("db.get_posts_for_ranking", "db")
+def get_posts_for_ranking(limit: Optional[int] = None, post_ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+    """Get posts that need to be ranked, optionally only the given post IDs."""
+    conn = pipeline_state.connect("x_com_posts.db")
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -77,22 +78,32 @@ def get_posts_for_ranking(limit: Optional[int] = None) -> List[Dict[str, Any]]:
     WHERE user_ranking IS NULL
     """
     
-    if limit:
-        query += f" LIMIT {limit}"
-    
-    cursor.execute(query)
-    posts = [dict(row) for row in cursor.fetchall()]
+    if post_ids is None:
+        if limit:
+            query += f" LIMIT {limit}"
+        cursor.execute(query)
+        posts = [dict(row) for row in cursor.fetchall()]
+    else:
+        # Look the IDs up in chunks; a large retry backlog would exceed SQLite's variable limit
+        posts = []
+        for chunk in job_ledger.chunk_ids(post_ids):
+            if limit and len(posts) >= limit:
+                break
+            cursor.execute(query + f" AND id IN ({', '.join('?' for _ in chunk)})", chunk)
+            posts.extend(dict(row) for row in cursor.fetchall())
+        if limit:
+            posts = posts[:limit]
+    tracing.set_attributes(rows=len(posts))
     
     conn.close()
     return posts
 
 def call_openrouter_for_ranking(user_profile: str, post: Dict[str, Any]) -> int:
-    """Call OpenRouter API to rank a post based on user preferences."""
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    """
+    Call OpenRouter API to rank a post based on user preferences.
     
+    Raises on API errors and unparseable replies, so a failed call is never stored as a ranking.
+    """
     # Format post statistics for the prompt
     stats = {
         "views": post.get("views", "N/A"),
@@ -150,37 +161,29 @@ Return only a single number between 0 and 100, with no additional text.
         ]
     }
     
-    try:
-        response = requests.post(OPENROUTER_API_URL, headers=headers, json=data)
-        response.raise_for_status()
-        
-        result = response.json()
-        content = result["choices"][0]["message"]["content"]
-        
-        # Try to extract a number from the response
-        try:
-            # Clean the response and extract just the number
-            content = content.strip()
-            # Remove any non-numeric characters except for digits
-            digits = ''.join(c for c in content if c.isdigit())
-            ranking = int(digits)
-            
-            # Ensure the ranking is within the valid range
-            if ranking > 100:
-                ranking = 100
-            
-            return ranking
-        except ValueError:
-            print(f"Could not parse ranking from response: {content}")
-            return 50  # Default to neutral ranking if parsing fails
-            
-    except Exception as e:
-        print(f"Error calling OpenRouter API: {e}")
-        return 50  # Default to neutral ranking if API call fails
+    return route_completion("rank", data, parse_ranking, item_id=post.get("id"))
+
+def parse_ranking(content: str) -> Tuple[int, bool]:
+    """Parse a ranking reply into (ranking, confident), raising ValueError if it holds no number."""
+    # Clean the response and extract just the number
+    content = content.strip()
+    # Remove any non-numeric characters except for digits
+    digits = ''.join(c for c in content if c.isdigit())
+    if not digits:
+        raise ValueError(f"Could not parse ranking from response: {content}")
+    
+    ranking = int(digits)
+    
+    # Ensure the ranking is within the valid range; an out-of-range reply isn't trusted
+    if ranking > 100:
+        return 100, False
+    
+    return ranking, abs(ranking - 50) > RANKING_CONFIDENCE_MARGIN
 
+@tracing.traced("db.update_post_ranking", "db")
 def update_post_ranking(post_id: int, ranking: int):
     """Update a post with the generated ranking."""
-    conn = sqlite3.connect("x_com_posts.db")
+    conn = pipeline_state.connect("x_com_posts.db")
     cursor = conn.cursor()
     
     # Update the post
@@ -192,8 +195,15 @@ def update_post_ranking(post_id: int, ranking: int):
     conn.commit()
     conn.close()
 
-def process_posts(limit: Optional[int] = None, batch_size: int = 5, force_dynamic: bool = False):
-    """Process posts to generate and save rankings."""
+def process_posts(limit: Optional[int] = None, batch_size: int = 5, force_dynamic: bool = False, resume: bool = False,
+                  user_profile: Optional[str] = None):
+    """
+    Process posts to generate and save rankings.
+    
+    Every post is tracked in the job ledger. With resume=True only posts whose earlier
+    attempts failed, and whose retry backoff has expired, are processed. A user_profile passed
+    in is used instead of the profile files.
+    """
     # Generate dynamic profile if requested
     if force_dynamic and os.path.exists("dynamic_user_profile.py"):
         print("Forcing dynamic profile regeneration...")
@@ -204,46 +214,106 @@ def process_posts(limit: Optional[int] = None, batch_size: int = 5, force_dynami
             print(f"Error generating dynamic profile: {e}")
     
     # Load user profile
-    user_profile = load_user_profile()
+    if not user_profile:
+        user_profile = load_user_profile()
     if not user_profile:
         print("Failed to load user profile. Exiting.")
         return
     
     # Set up the database
     setup_database()
+    job_ledger.setup_job_ledger()
     
     # Get posts for ranking
-    posts = get_posts_for_ranking(limit)
+    if resume:
+        retry_ids = job_ledger.get_retryable_item_ids("ranking")
+        posts = get_posts_for_ranking(limit, post_ids=retry_ids) if retry_ids else []
+    else:
+        posts = get_posts_for_ranking(limit)
     total_posts = len(posts)
     
     if total_posts == 0:
-        print("No posts found that need ranking.")
+        print("No failed posts are due for a retry." if resume else "No posts found that need ranking.")
         return
     
-    print(f"Found {total_posts} posts to rank.")
+    print(f"Found {total_posts} posts to {'retry' if resume else 'rank'}.")
+    job_ledger.mark_pending("ranking", [post["id"] for post in posts])
+    reporter = ProgressReporter("ranking", total_posts)
+    failed_count = 0
     
     # Process posts in batches to avoid rate limits
     for i, post in enumerate(posts):
         print(f"Processing post {i+1}/{total_posts} (ID: {post['id']})...")
         
-        # Generate ranking
-        ranking = call_openrouter_for_ranking(user_profile, post)
+        # Generate ranking; failures are recorded in the ledger instead of storing a placeholder score
+        try:
+            ranking = call_openrouter_for_ranking(user_profile, post)
+        except Exception as e:
+            print(f"Failed to rank post {post['id']}: {e}")
+            job_ledger.mark_failed("ranking", post["id"], str(e))
+            reporter.advance(post["id"], error=str(e))
+            failed_count += 1
+            continue
         
         print(f"Generated ranking: {ranking}/100")
         
         # Update the post with ranking
         update_post_ranking(post["id"], ranking)
+        job_ledger.mark_ok("ranking", post["id"])
+        reporter.advance(post["id"])
         
         # Sleep between requests to avoid rate limits
         if (i + 1) % batch_size == 0 and i + 1 < total_posts:
             print(f"Processed {i+1} posts. Sleeping for 5 seconds to avoid rate limits...")
             time.sleep(5)
     
-    print(f"Finished ranking {total_posts} posts.")
+    reporter.finish()
+    print(f"Finished ranking {total_posts - failed_count}/{total_posts} posts.")
+    if failed_count:
+        print(f"{failed_count} posts failed. Retry them later with: python ranking_llm.py --resume")
+
+def local_ranking(post: Dict[str, Any], vector: Dict[str, Dict[str, float]]) -> Optional[int]:
+    """Rank a post from 0-100 with the preference vector alone, or None if it knows nothing about the post."""
+    score = feedback_preferences.preference_score(post, vector)
+    if score is None:
+        return None
+    return round(50 + 50 * score)
+
+def rank_posts_locally(limit: Optional[int] = None):
+    """
+    Rank posts from the keyword and author affinities in the preference vector, without LLM calls.
+    
+    Posts whose keywords and author have no learned affinity are left unranked for the LLM ranker.
+    """
+    vector = feedback_preferences.load_preference_vector()
+    if not vector["keywords"] and not vector["authors"]:
+        print("No preference vector found. Run dynamic_user_profile.py to learn preferences from feedback.")
+        return
+    
+    setup_database()
+    posts = get_posts_for_ranking(limit)
+    if not posts:
+        print("No posts found that need ranking.")
+        return
+    
+    rankings = []
+    for post in posts:
+        ranking = local_ranking(post, vector)
+        if ranking is not None:
+            rankings.append((ranking, post["id"]))
+    
+    conn = pipeline_state.connect("x_com_posts.db")
+    with conn:
+        conn.executemany("UPDATE posts SET user_ranking = ? WHERE id = ?", rankings)
+    conn.close()
+    
+    print(f"Ranked {len(rankings)}/{len(posts)} posts from learned preferences.")
+    if len(rankings) < len(posts):
+        print(f"{len(posts) - len(rankings)} posts have no known keywords or authors. Rank them with: python ranking_llm.py")
 
 def view_ranking_stats():
     """View statistics about the rankings in the database."""
-    conn = sqlite3.connect("x_com_posts.db")
+    conn = pipeline_state.connect("x_com_posts.db")
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -285,7 +355,8 @@ def view_ranking_stats():
     
     conn.close()
 
-if __name__ == "__main__":
+def run_cli(argv: Optional[List[str]] = None):
+    """Parse command-line arguments and run post ranking."""
     import argparse
     
     parser = argparse.ArgumentParser(description="Rank posts based on user preferences using OpenRouter.")
@@ -293,11 +364,19 @@ if __name__ == "__main__":
     parser.add_argument("--batch-size", type=int, default=5, help="Number of posts to process before sleeping")
     parser.add_argument("--stats", action="store_true", help="View ranking statistics")
     parser.add_argument("--dynamic", action="store_true", help="Force regeneration of dynamic profile before ranking")
+    parser.add_argument("--resume", action="store_true", help="Only retry posts whose earlier ranking attempts failed")
+    parser.add_argument("--local", action="store_true", help="Rank posts from the learned preference vector without LLM calls")
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     if args.stats:
         view_ranking_stats()
+    elif args.local:
+        rank_posts_locally(limit=args.limit)
+        view_ranking_stats()
     else:
-        process_posts(limit=args.limit, batch_size=args.batch_size, force_dynamic=args.dynamic)
+        process_posts(limit=args.limit, batch_size=args.batch_size, force_dynamic=args.dynamic, resume=args.resume)
         view_ranking_stats()
+
+if __name__ == "__main__":
+    run_cli()
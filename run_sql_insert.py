@@ -1,7 +1,9 @@
 import sqlite3
 import os
 import time
+import tracing
 
+@tracing.traced("db.run_sql_file", "db")
 def run_sql_file(sql_file_path, db_file_path):
     """
     Execute SQL statements from a file against a SQLite database.
@@ -46,6 +48,7 @@ def run_sql_file(sql_file_path, db_file_path):
     
     # Close the connection
     conn.close()
+    tracing.set_attributes(statements=count, rows=post_count)
     
     print(f"Executed {count} SQL statements successfully")
     print(f"Total posts in database: {post_count}")
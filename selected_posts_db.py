@@ -0,0 +1,189 @@
+import sqlite3
+from typing import List, Dict, Any, Optional
+
+import pipeline_state
+
+# Query results live in the selected posts database, next to the validation cache
+SELECTED_POSTS_DB = "posts_selected.db"
+
+# Post columns stored once per post in result_posts (the post's ID is its ID in x_com_posts.db)
+POST_COLUMNS = ["username", "post_url", "post_time", "scraped_at", "post_text", "keywords",
+                "views", "comments", "retweets", "likes", "user_ranking", "image_url", "sentiment"]
+
+# The selected_posts view keeps the shape of the old selected_posts table, one row per query result
+SELECTED_POSTS_VIEW = '''
+CREATE VIEW selected_posts AS
+SELECT qr.id, qr.post_id AS original_post_id, p.username, p.post_url, p.post_time, p.scraped_at,
+       p.post_text, p.keywords, qr.matching_keyword_count, qr.score AS relevance_score,
+       p.views, p.comments, p.retweets, p.likes, p.user_ranking, p.image_url, p.sentiment,
+       q.query, qr.selected_at, qr.llm_clone_validated, qr.query_id, qr.rank
+FROM query_results qr
+LEFT JOIN queries q ON q.id = qr.query_id
+LEFT JOIN result_posts p ON p.id = qr.post_id
+'''
+
+def setup_selected_posts(conn: sqlite3.Connection):
+    """
+    Create the queries, result_posts and query_results tables and the selected_posts view.
+    
+    A database that still has the old selected_posts table is migrated: its rows keep their IDs
+    (feedback refers to them), each post is stored once and each query run becomes a queries row.
+    """
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS queries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        query TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS result_posts (
+        id INTEGER PRIMARY KEY,
+        username TEXT,
+        post_url TEXT,
+        post_time TEXT,
+        scraped_at TEXT,
+        post_text TEXT,
+        keywords TEXT,
+        views INTEGER,
+        comments INTEGER,
+        retweets INTEGER,
+        likes INTEGER,
+        user_ranking REAL,
+        image_url TEXT,
+        sentiment REAL,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS query_results (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        query_id INTEGER REFERENCES queries(id),
+        post_id INTEGER REFERENCES result_posts(id),
+        rank INTEGER,
+        score REAL,
+        matching_keyword_count INTEGER,
+        llm_clone_validated TEXT,
+        selected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_query_results_query ON query_results(query_id, rank)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_query_results_post ON query_results(post_id)")
+    
+    # Columns added to result_posts after it was first created
+    cursor.execute("PRAGMA table_info(result_posts)")
+    columns = [column[1] for column in cursor.fetchall()]
+    if "sentiment" not in columns:
+        cursor.execute("ALTER TABLE result_posts ADD COLUMN sentiment REAL")
+    
+    cursor.execute("SELECT type, sql FROM sqlite_master WHERE name = 'selected_posts'")
+    row = cursor.fetchone()
+    if row and row[0] == "table":
+        migrate_selected_posts_table(conn)
+    elif not row:
+        cursor.execute(SELECTED_POSTS_VIEW)
+    elif row[1].strip() != SELECTED_POSTS_VIEW.strip():
+        # The view was created by an older version with fewer columns
+        cursor.execute("DROP VIEW selected_posts")
+        cursor.execute(SELECTED_POSTS_VIEW)
+    
+    conn.commit()
+
+def migrate_selected_posts_table(conn: sqlite3.Connection):
+    """Move the rows of the old selected_posts table into queries, result_posts and query_results."""
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    
+    cursor.execute("SELECT * FROM selected_posts ORDER BY id")
+    rows = [dict(row) for row in cursor.fetchall()]
+    print(f"Migrating {len(rows)} selected posts to the query_results table...")
+    
+    # Each old query run inserted a queries row and its posts in the same second
+    cursor.execute("SELECT id, query, timestamp FROM queries")
+    query_ids = {(row["query"], row["timestamp"]): row["id"] for row in cursor.fetchall()}
+    
+    posts = {}
+    results = []
+    ranks: Dict[int, int] = {}
+    for row in rows:
+        run = (row.get("query"), row.get("selected_at"))
+        if run not in query_ids:
+            cursor.execute("INSERT INTO queries (query, timestamp) VALUES (?, ?)", run)
+            query_ids[run] = cursor.lastrowid
+        query_id = query_ids[run]
+        
+        # Rows without an original post keep their content under a negative ID
+        post_id = row.get("original_post_id")
+        if post_id is None:
+            post_id = -row["id"]
+        posts[post_id] = [row.get(column) for column in POST_COLUMNS]
+        
+        ranks[query_id] = ranks.get(query_id, 0) + 1
+        results.append((row["id"], query_id, post_id, ranks[query_id], row.get("relevance_score"),
+                        row.get("matching_keyword_count"), row.get("llm_clone_validated"), row.get("selected_at")))
+    
+    cursor.executemany(
+        f"INSERT OR REPLACE INTO result_posts (id, {', '.join(POST_COLUMNS)}) VALUES (?, {', '.join('?' * len(POST_COLUMNS))})",
+        [[post_id] + values for post_id, values in posts.items()]
+    )
+    cursor.executemany(
+        """
+        INSERT INTO query_results (id, query_id, post_id, rank, score, matching_keyword_count, llm_clone_validated, selected_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        results
+    )
+    cursor.execute("DROP TABLE selected_posts")
+    cursor.execute(SELECTED_POSTS_VIEW)
+    print(f"Stored {len(posts)} unique posts for {len(results)} query results.")
+
+def save_query_results(posts: List[Dict[str, Any]], query: Optional[str] = None, db_file: str = SELECTED_POSTS_DB) -> Optional[int]:
+    """
+    Record one query run and its ranked posts in a single transaction.
+    
+    Args:
+        posts: The ranked posts, best first, as returned by user_posts_output.rank_posts
+        query: The user query that found them; without one no queries row is stored and the
+            results have no query, as selected posts saved without a query always had
+    
+    Returns:
+        The ID of the queries row, or None without a query
+    """
+    conn = pipeline_state.connect(db_file)
+    setup_selected_posts(conn)
+    
+    with conn:
+        cursor = conn.cursor()
+        query_id = None
+        if query:
+            cursor.execute("INSERT INTO queries (query) VALUES (?)", (query,))
+            query_id = cursor.lastrowid
+        
+        # Posts are stored once and refreshed with their latest metrics
+        updates = ", ".join(f"{column} = excluded.{column}" for column in POST_COLUMNS)
+        cursor.executemany(
+            f"""
+            INSERT INTO result_posts (id, {', '.join(POST_COLUMNS)}) VALUES (?, {', '.join('?' * len(POST_COLUMNS))})
+            ON CONFLICT(id) DO UPDATE SET {updates}, updated_at = CURRENT_TIMESTAMP
+            """,
+            [[post.get("id")] + [post.get(column) for column in POST_COLUMNS] for post in posts]
+        )
+        cursor.executemany(
+            "INSERT INTO query_results (query_id, post_id, rank, score, matching_keyword_count) VALUES (?, ?, ?, ?, ?)",
+            [(query_id, post.get("id"), rank, post.get("relevance_score"), post.get("matching_keyword_count"))
+             for rank, post in enumerate(posts, 1)]
+        )
+    
+    conn.close()
+    return query_id
+
+def update_validations(validations: Dict[int, str], conn: sqlite3.Connection):
+    """Set the validation of query results (selected_posts IDs) on an open connection, inside its transaction."""
+    conn.executemany(
+        "UPDATE query_results SET llm_clone_validated = ? WHERE id = ?",
+        [(validation, result_id) for result_id, validation in validations.items()]
+    )
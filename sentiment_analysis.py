@@ -1,25 +1,34 @@
 import sqlite3
 import json
 import os
-import requests
-import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from typing import List, Dict, Any, Optional
+from model_router import route_completion
+import pipeline_state
+import selected_posts_db
+import llm_scheduler
+import sentiment_lexicon
 
 # Load environment variables
 load_dotenv()
 
-# Get OpenRouter API key from environment variable or prompt user
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-if not OPENROUTER_API_KEY:
-    OPENROUTER_API_KEY = input("Enter your OpenRouter API key: ")
-
-# OpenRouter API endpoint
-OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
-
 # Model to use (default to GPT-4o)
 MODEL = os.getenv("OPENROUTER_MODEL", "openai/gpt-4o")
 
+# Posts are analyzed in one prompt up to this many estimated tokens (about four characters per token);
+# larger sets are split into chunks analyzed concurrently and merged (0 always uses one prompt)
+CHUNK_TOKENS = int(os.getenv("SENTIMENT_CHUNK_TOKENS", "6000"))
+MAX_WORKERS = int(os.getenv("SENTIMENT_MAX_WORKERS", "4"))
+
+# Summary of the placeholder analysis returned for a reply that isn't JSON
+PARSE_ERROR_SUMMARY = "Error parsing LLM response as JSON."
+
+# Queries whose cached sentiment is being refreshed in the background
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
 def get_absolute_path(file_path):
     """Get absolute path for a file, checking multiple locations."""
     if os.path.exists(file_path):
@@ -121,14 +130,160 @@ def analyze_sentiment(posts, query):
             "sentiment_score": 50
         }
     
-    # Format posts for the LLM
-    formatted_posts = format_posts_for_llm(posts)
+    try:
+        return request_sentiment(posts, query)
+    except Exception as e:
+        print(f"Error calling OpenRouter API: {e}")
+        return {
+            "summary": f"Error analyzing sentiment: {str(e)}",
+            "sentiment": "neutral",
+            "sentiment_score": 50,
+            "key_points": ["Error occurred during analysis"],
+            "error": True
+        }
+
+def chunk_posts(posts, token_budget=CHUNK_TOKENS):
+    """Split posts into consecutive chunks whose formatted text fits the token budget (a longer post gets its own chunk)."""
+    if token_budget <= 0:
+        return [posts]
+    
+    chunks = []
+    chunk = []
+    chunk_tokens = 0
+    for post in posts:
+        tokens = len(format_posts_for_llm([post])) // 4
+        if chunk and chunk_tokens + tokens > token_budget:
+            chunks.append(chunk)
+            chunk = []
+            chunk_tokens = 0
+        chunk.append(post)
+        chunk_tokens += tokens
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def request_sentiment(posts, query):
+    """
+    Ask the LLM for the sentiment of a non-empty list of posts, raising on API errors.
+    
+    Posts that don't fit in one prompt are analyzed map-reduce style: chunks are analyzed
+    concurrently, then their summaries are merged and their scores averaged by post count. When
+    some chunks fail, the merge of the others is marked partial (see is_complete_sentiment).
+    """
+    chunks = chunk_posts(posts)
+    if len(chunks) == 1:
+        return request_chunk_sentiment(posts, query)
+    
+    print(f"Analyzing {len(posts)} posts in {len(chunks)} chunks...")
+    
+    def analyze_chunk(chunk):
+        try:
+            return request_chunk_sentiment(chunk, query)
+        except Exception as e:
+            print(f"Error analyzing a chunk of {len(chunk)} posts: {e}")
+            return e
+    
+    # The chunks' calls keep the caller's priority and tracing span
+    with ThreadPoolExecutor(max_workers=max(1, MAX_WORKERS)) as executor:
+        results = llm_scheduler.map_in_context(executor, analyze_chunk, chunks)
+    
+    # Chunks that failed or gave no usable score are left out of the merge
+    partials = [(result, len(chunk)) for result, chunk in zip(results, chunks)
+                if isinstance(result, dict) and is_complete_sentiment(result)]
+    if not partials:
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            raise errors[-1]
+        return results[-1]
+    
+    merged = merge_sentiments(partials, query)
+    if len(partials) < len(chunks):
+        # Only part of the posts were analyzed; the result is shown but not cached for the whole set
+        merged["partial"] = True
+        merged["chunks_failed"] = len(chunks) - len(partials)
+        print(f"{merged['chunks_failed']} of {len(chunks)} chunks failed; the analysis covers {merged['posts_analyzed']} of {len(posts)} posts.")
+    return merged
+
+def sentiment_label(score):
+    """The sentiment word for a 0-100 score."""
+    if score > 60:
+        return "positive"
+    if score < 40:
+        return "negative"
+    return "mixed"
+
+def merge_sentiments(partials, query):
+    """
+    Merge the analyses of chunks of posts into one.
     
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
+    Args:
+        partials: (analysis, post count) pairs
+        query: The search query that found the posts
+        
+    Returns:
+        An analysis whose score is the post-weighted average of the chunk scores and whose
+        summary and key points are merged by the LLM (or taken from the largest chunk if that fails)
+    """
+    total = sum(count for _, count in partials)
+    score = round(sum(analysis["sentiment_score"] * count for analysis, count in partials) / total)
+    
+    summaries = "\n\n".join(
+        f"Part {i} ({count} posts, sentiment score {analysis['sentiment_score']}):\n"
+        f"Summary: {analysis.get('summary')}\n"
+        f"Key points: {'; '.join(str(point) for point in analysis.get('key_points', []))}"
+        for i, (analysis, count) in enumerate(partials, 1)
+    )
+    data = {
+        "model": MODEL,
+        "messages": [
+            {
+                "role": "system",
+                "content": """You are a sentiment analysis assistant. You are given the analyses of several parts of a set of
+                social media posts on one topic. Merge them into a single analysis of the whole set, giving larger parts
+                more weight.
+                
+                Format your response as a JSON object with the following structure:
+                {
+                    "summary": "A very concise summary (2-3 sentences) of what people are saying about the topic",
+                    "sentiment": "positive/negative/mixed/neutral",
+                    "sentiment_score": number from 0-100,
+                    "key_points": ["point 1", "point 2", "point 3"]
+                }
+                
+                Return ONLY the JSON object, with no additional text or explanation.
+                """
+            },
+            {
+                "role": "user",
+                "content": f"""Merge these analyses of posts related to the search query: "{query}"
+
+{summaries}
+
+Remember to return only a JSON object with summary, sentiment, sentiment_score, and key_points.
+"""
+            }
+        ]
     }
     
+    try:
+        merged = route_completion("sentiment", data, parse_sentiment, item_id=query)
+    except Exception as e:
+        print(f"Error merging sentiment analyses: {e}")
+        merged = {}
+    if not is_complete_sentiment(merged):
+        merged = dict(max(partials, key=lambda partial: partial[1])[0])
+    
+    # The score is the weighted average of the chunk scores, not the LLM's estimate of it
+    merged["sentiment_score"] = score
+    merged["sentiment"] = sentiment_label(score)
+    merged["posts_analyzed"] = total
+    return merged
+
+def request_chunk_sentiment(posts, query):
+    """Ask the LLM for the sentiment of posts that fit in one prompt."""
+    # Format posts for the LLM
+    formatted_posts = format_posts_for_llm(posts)
+    
     data = {
         "model": MODEL,
         "messages": [
@@ -164,55 +319,252 @@ Remember to return only a JSON object with summary, sentiment, sentiment_score,
         ]
     }
     
+    return route_completion("sentiment", data, parse_sentiment, item_id=query)
+
+def is_complete_sentiment(analysis):
+    """
+    Whether an analysis has a summary and a numeric score and covers all its posts.
+    
+    Placeholders for failed calls and unparsable replies aren't complete, nor are merges that
+    are missing failed chunks.
+    """
+    summary = analysis.get("summary")
+    if not summary or summary == PARSE_ERROR_SUMMARY or analysis.get("error") or analysis.get("partial"):
+        return False
+    return isinstance(analysis.get("sentiment_score"), (int, float))
+
+def post_set_hash(posts):
+    """Hash the set of posts an analysis was made from; repeated selections of a post count once."""
+    post_ids = sorted({str(post.get('original_post_id') or post.get('id')) for post in posts})
+    return pipeline_state.text_fingerprint(",".join(post_ids))
+
+def setup_sentiment_cache(conn):
+    """Create the sentiment_cache table if it doesn't exist."""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS sentiment_cache (
+        query TEXT,
+        post_set_hash TEXT,
+        model TEXT,
+        analysis TEXT,
+        analyzed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (query, post_set_hash, model)
+    )
+    ''')
+
+def get_cached_sentiment(query, posts, db_file='posts_selected.db'):
+    """
+    Look up the latest analysis of a query.
+    
+    Returns:
+        (analysis, current): current is True when the analysis was made from the same set of
+        posts; (None, False) when the query hasn't been analyzed with this model yet
+    """
     try:
-        response = requests.post(OPENROUTER_API_URL, headers=headers, json=data)
-        response.raise_for_status()
+        conn = sqlite3.connect(get_absolute_path(db_file))
+        setup_sentiment_cache(conn)
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT analysis, post_set_hash = ? FROM sentiment_cache
+            WHERE query = ? AND model = ?
+            ORDER BY post_set_hash = ? DESC, analyzed_at DESC LIMIT 1
+            """,
+            (post_set_hash(posts), pipeline_state.normalize_query(query), MODEL, post_set_hash(posts))
+        )
+        row = cursor.fetchone()
+        conn.close()
+    except sqlite3.Error as e:
+        print(f"SQLite error reading sentiment cache: {e}")
+        return None, False
+    
+    if not row:
+        return None, False
+    return json.loads(row[0]), bool(row[1])
+
+def save_sentiment(query, posts, analysis, db_file='posts_selected.db'):
+    """Store an analysis under the query, the set of posts and the model."""
+    try:
+        conn = pipeline_state.connect(get_absolute_path(db_file))
+        setup_sentiment_cache(conn)
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sentiment_cache (query, post_set_hash, model, analysis) VALUES (?, ?, ?, ?)",
+                (pipeline_state.normalize_query(query), post_set_hash(posts), MODEL, json.dumps(analysis))
+            )
+        conn.close()
+    except sqlite3.Error as e:
+        print(f"SQLite error caching sentiment: {e}")
+
+def refresh_sentiment(posts, query, db_file='posts_selected.db'):
+    """Analyze the posts and cache the result if the call succeeded; a failed call's placeholder is returned but never cached."""
+    analysis = analyze_sentiment(posts, query)
+    if is_complete_sentiment(analysis):
+        save_sentiment(query, posts, analysis, db_file)
+    else:
+        print("Sentiment analysis failed or is incomplete; not caching it.")
+    return analysis
+
+def refresh_sentiment_in_background(posts, query, db_file='posts_selected.db'):
+    """Start refreshing a query's analysis unless a refresh of it is already running."""
+    key = pipeline_state.normalize_query(query)
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+    
+    def run():
+        try:
+            refresh_sentiment(posts, query, db_file)
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+    
+    threading.Thread(target=run, daemon=True).start()
+
+def analyze_sentiment_cached(posts, query, db_file='posts_selected.db', background=False):
+    """
+    Analyze the sentiment of a query's posts, reusing the cached analysis of the same set of posts.
+    
+    Args:
+        posts: List of posts to analyze
+        query: The search query that found these posts
+        background: When the set of posts has changed, return the previous analysis of the
+                    query straight away (marked "stale") and refresh it in a background thread
         
-        result = response.json()
-        content = result["choices"][0]["message"]["content"]
+    Returns:
+        A dictionary with summary and sentiment analysis
+    """
+    if not posts:
+        return analyze_sentiment(posts, query)
+    
+    cached, current = get_cached_sentiment(query, posts, db_file)
+    if cached and current:
+        print("Using cached sentiment analysis.")
+        return cached
+    
+    if cached and background:
+        print("Posts changed since the last sentiment analysis; refreshing it in the background.")
+        refresh_sentiment_in_background(posts, query, db_file)
+        return dict(cached, stale=True)
+    
+    return refresh_sentiment(posts, query, db_file)
+
+def parse_sentiment(content):
+    """
+    Parse a sentiment reply into (analysis, confident).
+    
+    Only a JSON object with a summary and a numeric sentiment_score is confident.
+    """
+    # Try to parse the response as JSON
+    try:
+        analysis = json.loads(content)
+    except json.JSONDecodeError:
+        # If it's not valid JSON, try to extract the JSON part
+        import re
+        analysis = None
+        json_match = re.search(r'({.*})', content, re.DOTALL)
+        if json_match:
+            try:
+                analysis = json.loads(json_match.group(1))
+            except json.JSONDecodeError:
+                pass
+    
+    if isinstance(analysis, dict):
+        confident = bool(analysis.get("summary")) and isinstance(analysis.get("sentiment_score"), (int, float))
+        return analysis, confident
+    
+    # If all else fails, return a basic structure with the content
+    return {
+        "summary": PARSE_ERROR_SUMMARY,
+        "sentiment": "neutral",
+        "sentiment_score": 50,
+        "key_points": [content[:200] + "..."]
+    }, False
+
+def local_sentiment(query, db_file='posts_selected.db'):
+    """
+    Score the sentiment of a query's selected posts without an LLM call.
+    
+    Posts are scored by the lexicon when they are scraped, so this is an aggregate over the
+    sentiment column; posts scraped before that are scored from their text.
+    
+    Returns:
+        A dictionary shaped like an LLM analysis, with a summary of the counts and no key points
+    """
+    try:
+        conn = sqlite3.connect(get_absolute_path(db_file))
+        selected_posts_db.setup_selected_posts(conn)
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT COUNT(sentiment), COALESCE(SUM(sentiment), 0),
+                   COALESCE(SUM(sentiment >= 0.05), 0), COALESCE(SUM(sentiment <= -0.05), 0)
+            FROM selected_posts WHERE query = ?
+            """,
+            (query,)
+        )
+        count, total, positive, negative = cursor.fetchone()
         
-        # Try to parse the response as JSON
-        try:
-            analysis = json.loads(content)
-            return analysis
-        except json.JSONDecodeError:
-            # If it's not valid JSON, try to extract the JSON part
-            import re
-            json_match = re.search(r'({.*})', content, re.DOTALL)
-            if json_match:
-                try:
-                    analysis = json.loads(json_match.group(1))
-                    return analysis
-                except json.JSONDecodeError:
-                    pass
-            
-            # If all else fails, return a basic structure with the content
-            return {
-                "summary": "Error parsing LLM response as JSON.",
-                "sentiment": "neutral",
-                "sentiment_score": 50,
-                "key_points": [content[:200] + "..."]
-            }
-            
-    except Exception as e:
-        print(f"Error calling OpenRouter API: {e}")
-        return {
-            "summary": f"Error analyzing sentiment: {str(e)}",
-            "sentiment": "neutral",
-            "sentiment_score": 50,
-            "key_points": ["Error occurred during analysis"]
-        }
+        cursor.execute("SELECT post_text FROM selected_posts WHERE query = ? AND sentiment IS NULL", (query,))
+        scores = sentiment_lexicon.score_texts(row[0] for row in cursor.fetchall())
+        conn.close()
+    except sqlite3.Error as e:
+        print(f"SQLite error: {e}")
+        return None
+    
+    count += len(scores)
+    if not count:
+        return None
+    total += sum(scores)
+    positive += sum(1 for score in scores if score >= 0.05)
+    negative += sum(1 for score in scores if score <= -0.05)
+    
+    compound = total / count
+    return {
+        "summary": f"{positive} of {count} posts are positive, {negative} negative and {count - positive - negative} neutral.",
+        "sentiment": sentiment_lexicon.label(compound),
+        "sentiment_score": sentiment_lexicon.to_percent(compound),
+        "key_points": [],
+        "method": "lexicon"
+    }
 
-def main():
-    """Main function to analyze sentiment of selected posts."""
-    # Check if query is provided as command line argument
-    if len(sys.argv) < 2:
-        print("Usage: python sentiment_analysis.py <query>")
-        return
+def backfill_post_sentiment(db_file='x_com_posts.db', batch_size=1000):
+    """Score the posts scraped before sentiment was scored at ingest."""
+    conn = sqlite3.connect(db_file)
+    sentiment_lexicon.setup_sentiment_column(conn)
+    cursor = conn.cursor()
+    
+    total = 0
+    while True:
+        cursor.execute("SELECT id, post_text FROM posts WHERE sentiment IS NULL LIMIT ?", (batch_size,))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        
+        scores = sentiment_lexicon.score_texts(row[1] for row in rows)
+        cursor.executemany("UPDATE posts SET sentiment = ? WHERE id = ?", [(score, row[0]) for score, row in zip(scores, rows)])
+        conn.commit()
+        total += len(rows)
     
-    query = sys.argv[1]
+    conn.close()
+    print(f"Scored the sentiment of {total} posts.")
+    return total
+
+def main(query, local=False):
+    """Main function to analyze sentiment of selected posts."""
     print(f"Analyzing sentiment for query: {query}")
     
+    # The lexicon score needs no LLM call
+    if local:
+        result = local_sentiment(query) or {
+            "summary": "No posts found for this query.",
+            "sentiment": "neutral",
+            "sentiment_score": 50,
+            "key_points": []
+        }
+        print(json.dumps(result, indent=2))
+        return result
+    
     # Get selected posts for the query
     posts = get_selected_posts(query)
     
@@ -225,9 +577,9 @@ def main():
             "key_points": []
         }
     else:
-        # Analyze sentiment
+        # Analyze sentiment (unless the same posts were analyzed before)
         print(f"Analyzing sentiment of {len(posts)} posts...")
-        result = analyze_sentiment(posts, query)
+        result = analyze_sentiment_cached(posts, query)
     
     # Print the result
     print("\nSentiment Analysis Result:")
@@ -244,5 +596,23 @@ def main():
     
     return result
 
+def run_cli(argv=None):
+    """Parse command-line arguments and analyze the sentiment of a query's posts."""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Analyze the sentiment of the posts selected for a query.")
+    parser.add_argument("query", nargs="?", help="The search query whose selected posts to analyze")
+    parser.add_argument("--local", action="store_true", help="Score with the local lexicon instead of an LLM summary")
+    parser.add_argument("--backfill", action="store_true", help="Score the sentiment of scraped posts that don't have one yet")
+    
+    args = parser.parse_args(argv)
+    
+    if args.backfill:
+        backfill_post_sentiment()
+    elif args.query:
+        main(args.query, local=args.local)
+    else:
+        parser.print_usage()
+
 if __name__ == "__main__":
-    main()
+    run_cli()
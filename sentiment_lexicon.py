@@ -0,0 +1,140 @@
+import re
+import math
+import sqlite3
+from typing import List, Iterable, Optional
+
+# Valence of common words, from -4 (extremely negative) to 4 (extremely positive), in the style of VADER
+LEXICON = {
+    # Positive
+    "good": 1.9, "great": 3.1, "excellent": 3.2, "amazing": 2.8, "awesome": 3.1, "fantastic": 2.6,
+    "wonderful": 2.7, "best": 3.2, "better": 1.9, "love": 3.2, "loved": 2.9, "loving": 2.9, "like": 1.5,
+    "liked": 1.8, "nice": 1.8, "happy": 2.7, "glad": 2.0, "excited": 2.2, "exciting": 2.2, "win": 2.8,
+    "wins": 2.7, "won": 2.7, "winning": 2.4, "success": 2.7, "successful": 2.8, "beautiful": 2.9,
+    "brilliant": 2.8, "impressive": 2.3, "incredible": 2.2, "perfect": 2.7, "positive": 2.6, "strong": 2.3,
+    "support": 1.7, "supports": 1.7, "thanks": 1.9, "thank": 1.5, "grateful": 2.0, "proud": 2.1,
+    "hope": 1.9, "hopeful": 2.3, "optimistic": 1.9, "fun": 2.3, "cool": 1.3, "enjoy": 2.2, "enjoyed": 2.3,
+    "improve": 1.9, "improved": 2.1, "improvement": 2.0, "gain": 2.0, "gains": 1.8, "growth": 1.6,
+    "record": 0.8, "breakthrough": 2.3, "innovative": 1.9, "safe": 1.9, "secure": 1.4, "agree": 1.5,
+    "congrats": 2.4, "congratulations": 2.9, "celebrate": 2.7, "wow": 2.8, "yes": 1.7, "rally": 1.2,
+    "bullish": 1.8, "recovery": 1.4, "approved": 1.8, "helpful": 1.8, "easy": 1.9, "fair": 1.3,
+    # Negative
+    "bad": -2.5, "terrible": -2.1, "awful": -2.0, "horrible": -2.5, "worst": -3.1, "worse": -2.1,
+    "hate": -2.7, "hated": -3.2, "hates": -1.9, "dislike": -1.6, "sad": -2.1, "angry": -2.3,
+    "mad": -2.2, "upset": -1.6, "fear": -2.2, "afraid": -2.0, "scary": -2.2, "worried": -1.2,
+    "worry": -1.9, "lose": -1.7, "loses": -1.3, "lost": -1.3, "losing": -1.6, "loss": -1.3,
+    "losses": -1.7, "fail": -2.5, "fails": -1.8, "failed": -2.3, "failure": -2.3, "crash": -1.7,
+    "crisis": -3.1, "disaster": -3.1, "problem": -1.7, "problems": -1.7, "wrong": -2.1, "poor": -2.1,
+    "weak": -1.9, "broken": -2.1, "scam": -2.9, "fraud": -2.8, "corrupt": -3.0, "lie": -1.6,
+    "lies": -1.8, "stupid": -2.4, "ugly": -2.3, "annoying": -1.7, "boring": -1.3, "disappointed": -1.9,
+    "disappointing": -2.2, "concern": -1.3, "concerns": -1.5, "risk": -1.1, "risky": -1.4,
+    "threat": -2.4, "attack": -2.1, "war": -2.9, "kill": -3.7, "killed": -3.5, "death": -2.9,
+    "dead": -3.3, "sick": -2.3, "pain": -2.3, "hurt": -2.4, "decline": -1.1, "drop": -1.1,
+    "drops": -1.1, "fell": -1.1, "bearish": -1.5, "recession": -1.8, "inflation": -0.8,
+    "ban": -2.6, "banned": -2.0, "no": -1.2, "sucks": -1.5, "ridiculous": -2.1, "outrage": -2.3,
+    "delay": -1.3, "delayed": -0.9, "layoffs": -1.9, "injury": -2.0, "injured": -1.7,
+}
+
+# Emoji and emoticons, scored like words
+EMOJI = {
+    "😀": 2.0, "😃": 2.0, "😄": 2.2, "😁": 2.0, "😊": 2.2, "🙂": 1.2, "😍": 3.0, "🥰": 3.0, "😂": 1.6,
+    "🤣": 1.6, "👍": 1.9, "👏": 1.9, "🙌": 2.0, "🎉": 2.4, "🔥": 1.5, "❤️": 3.0, "❤": 3.0, "💯": 2.0,
+    "🚀": 1.6, "✅": 1.2, "😢": -2.1, "😭": -2.0, "😞": -2.1, "😠": -2.4, "😡": -2.8, "🤬": -3.0,
+    "👎": -1.9, "💔": -2.6, "😱": -1.5, "😨": -1.8, "🤮": -2.7, "😤": -1.4, "❌": -1.2,
+    ":)": 2.0, ":-)": 2.0, ":d": 2.3, ":(": -1.9, ":-(": -1.9, ":/": -1.2,
+}
+
+# Words that strengthen or soften the word after them
+BOOSTERS = {
+    "very": 0.293, "really": 0.293, "extremely": 0.293, "incredibly": 0.293, "so": 0.293, "super": 0.293,
+    "totally": 0.293, "absolutely": 0.293, "most": 0.293, "more": 0.293, "highly": 0.293,
+    "slightly": -0.293, "somewhat": -0.293, "barely": -0.293, "kinda": -0.293, "little": -0.293,
+}
+
+# Words that flip the sentiment of the three words after them
+NEGATIONS = {
+    "not", "no", "never", "none", "nobody", "nothing", "neither", "nor", "without", "cannot",
+    "isnt", "arent", "wasnt", "werent", "dont", "doesnt", "didnt", "wont", "wouldnt", "cant",
+    "couldnt", "shouldnt", "hasnt", "havent", "hadnt", "aint",
+}
+
+NEGATION_SCALAR = -0.74
+CAPS_BOOST = 0.733
+EXCLAMATION_BOOST = 0.292
+NORMALIZATION_ALPHA = 15
+
+# Words, contractions and emoticons; emoji are matched one character at a time
+TOKEN_PATTERN = re.compile(r"[A-Za-z]+(?:'[A-Za-z]+)?|:-?[)(/dD]|[\U0001F300-\U0001FAFF☀-➿]️?")
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text or "")
+
+def score_text(text: Optional[str]) -> float:
+    """
+    Score the sentiment of a text from -1 (most negative) to 1 (most positive), 0 being neutral.
+    
+    Word and emoji valences are summed after applying boosters, negations (a negation in the three
+    words before a word flips and dampens it), emphasis in ALL CAPS and "but" (what follows it
+    counts more), then normalized. Exclamation marks strengthen the result.
+    """
+    tokens = tokenize(text)
+    if not tokens:
+        return 0.0
+    
+    # Capitals only mean emphasis when the rest of the text isn't shouting too
+    words = [token for token in tokens if token.isalpha()]
+    mixed_case = any(word.isupper() for word in words) and not all(word.isupper() for word in words)
+    lowered = [token.lower().replace("'", "") for token in tokens]
+    but_index = lowered.index("but") if "but" in lowered else None
+    
+    valences = []
+    for i, token in enumerate(lowered):
+        valence = LEXICON.get(token, EMOJI.get(token))
+        if valence is None:
+            continue
+        
+        if mixed_case and tokens[i].isupper() and len(tokens[i]) > 1:
+            valence += CAPS_BOOST if valence > 0 else -CAPS_BOOST
+        
+        for distance, previous in enumerate(reversed(lowered[max(0, i - 3):i]), 1):
+            boost = BOOSTERS.get(previous)
+            if boost:
+                scaled = boost * (1 - 0.05 * (distance - 1))
+                valence += scaled if valence > 0 else -scaled
+            if previous in NEGATIONS:
+                valence *= NEGATION_SCALAR
+        
+        if but_index is not None:
+            valence *= 0.5 if i < but_index else 1.5 if i > but_index else 1
+        valences.append(valence)
+    
+    total = sum(valences)
+    if total:
+        emphasis = min(text.count("!"), 4) * EXCLAMATION_BOOST
+        total += emphasis if total > 0 else -emphasis
+    return total / math.sqrt(total * total + NORMALIZATION_ALPHA)
+
+def score_texts(texts: Iterable[Optional[str]]) -> List[float]:
+    """Score many texts at once (e.g. a batch of posts at ingest)."""
+    return [round(score_text(text), 4) for text in texts]
+
+def to_percent(compound: float) -> int:
+    """Convert a -1..1 score to the 0-100 scale of LLM sentiment analyses (50 is neutral)."""
+    return round((compound + 1) * 50)
+
+def label(compound: float) -> str:
+    """The sentiment word for a -1..1 score, with VADER's ±0.05 neutral band."""
+    if compound >= 0.05:
+        return "positive"
+    if compound <= -0.05:
+        return "negative"
+    return "neutral"
+
+def setup_sentiment_column(conn: sqlite3.Connection):
+    """Add the sentiment column to the posts table if it doesn't exist."""
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA table_info(posts)")
+    columns = [column[1] for column in cursor.fetchall()]
+    
+    if "sentiment" not in columns:
+        print("Adding sentiment column to posts table...")
+        cursor.execute("ALTER TABLE posts ADD COLUMN sentiment REAL")
@@ -4,11 +4,18 @@ import time
 import schedule
 import json
 import argparse
-from typing import List
-from pydantic import BaseModel
+from typing import List, Optional
+from pydantic import BaseModel, ValidationError
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
+from langchain_core.callbacks import BaseCallbackHandler
 from browser_use import Agent, Controller, Browser, ActionResult
+from progress import ProgressReporter
+import tracing
+import llm_usage
+from fix_json_parser import iter_agent_posts, normalize_post
+from sentiment_lexicon import score_text, setup_sentiment_column
+import pipeline_state
 
 load_dotenv()
 
@@ -70,6 +77,7 @@ controller = Controller(output_model=Posts)
 
 # Define a custom action to open Twitter
 @controller.action('Open Twitter')
+@tracing.traced("browser.open_twitter", "browser")
 async def open_twitter(browser: Browser):
     page = browser.get_current_page()
     # Set a longer timeout (60 seconds) and wait until the network is idle
@@ -84,6 +92,7 @@ async def open_twitter(browser: Browser):
 
 # Define a custom action to navigate to the home feed
 @controller.action('Navigate to Home Feed')
+@tracing.traced("browser.navigate_to_home_feed", "browser")
 async def navigate_to_home_feed(browser: Browser):
     page = browser.get_current_page()
     try:
@@ -124,6 +133,7 @@ async def navigate_to_home_feed(browser: Browser):
 
 # Define a custom action to get post selectors
 @controller.action('Get Post Selectors')
+@tracing.traced("browser.get_post_selectors", "browser")
 async def get_post_selectors(browser: Browser, count: int = 10):
     page = browser.get_current_page()
     try:
@@ -187,6 +197,7 @@ async def get_post_selectors(browser: Browser, count: int = 10):
 
 # Define a custom action to extract post metrics
 @controller.action('Extract Post Metrics')
+@tracing.traced("browser.extract_post_metrics", "browser")
 async def extract_post_metrics(browser: Browser, post_selector: str):
     page = browser.get_current_page()
     try:
@@ -337,11 +348,18 @@ async def close_browser(browser: Browser):
 # Prompt User for Sensitive Credentials
 # --------------------------------------
 
-username = input("Enter your x.com username: ")
-password = input("Enter your x.com password: ")
-
 # The sensitive_data dict maps placeholder keys to real values.
-sensitive_data = {"x_username": username, "x_password": password}
+# It is filled in on first use so that importing this module (e.g. from main.py) does not prompt.
+sensitive_data = None
+
+def get_sensitive_data():
+    """Prompt for the x.com credentials once and cache them for later runs."""
+    global sensitive_data
+    if sensitive_data is None:
+        username = input("Enter your x.com username: ")
+        password = input("Enter your x.com password: ")
+        sensitive_data = {"x_username": username, "x_password": password}
+    return sensitive_data
 
 # ----------------------------------------------
 # Define the Task Instruction for the Agent
@@ -387,7 +405,43 @@ def create_task_str(post_count: int):
 # Initialize the LLM Model
 # -----------------------
 
-llm = ChatOpenAI(model="gpt-4o", temperature=0.0)
+class LLMUsageCallback(BaseCallbackHandler):
+    """Record the tokens, latency and cost of every call the browser agent makes to its LLM."""
+    
+    def __init__(self, stage: str, model: str):
+        self.stage = stage
+        self.model = model
+        self.started = {}
+    
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self.started[run_id] = time.perf_counter()
+    
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self.started[run_id] = time.perf_counter()
+    
+    def latency_ms(self, run_id) -> float:
+        started = self.started.pop(run_id, None)
+        return (time.perf_counter() - started) * 1000 if started else 0.0
+    
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = dict((response.llm_output or {}).get("token_usage") or {})
+        
+        # Newer langchain versions report usage on the message instead of llm_output
+        if not usage and response.generations and response.generations[0]:
+            message = getattr(response.generations[0][0], "message", None)
+            metadata = getattr(message, "usage_metadata", None) or {}
+            usage = {
+                "prompt_tokens": metadata.get("input_tokens"),
+                "completion_tokens": metadata.get("output_tokens"),
+                "total_tokens": metadata.get("total_tokens")
+            }
+        
+        llm_usage.record_llm_call(self.stage, None, self.model, usage, self.latency_ms(run_id))
+    
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        llm_usage.record_llm_call(self.stage, None, self.model, None, self.latency_ms(run_id), "error", str(error))
+
+llm = ChatOpenAI(model="gpt-4o", temperature=0.0, callbacks=[LLMUsageCallback("scrape", "gpt-4o")])
 
 # ---------------------------------------------------------
 # Asynchronous Function to Run the Agent & Store the Data
@@ -403,71 +457,25 @@ async def main_job(post_count: int = 25):
     if agent_instance is None:
         print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: Creating new agent instance...")
         task = create_task_str(post_count)
-        agent_instance = Agent(task=task, llm=llm, sensitive_data=sensitive_data, controller=controller)
+        agent_instance = Agent(task=task, llm=llm, sensitive_data=get_sensitive_data(), controller=controller)
     else:
         print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: Reusing existing agent instance...")
     
+    reporter = ProgressReporter("scrape", post_count)
     try:
         print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: Running agent...")
-        history = await agent_instance.run()
-        result = history.final_result()
+        with tracing.span("browser.agent_run", "browser", post_count=post_count) as span:
+            history = await agent_instance.run()
+            result = history.final_result()
+            span.set(bytes=len(result) if result else 0)
         
         if result:
             print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: Agent returned result. Parsing...")
-            try:
-                # Log the raw result for debugging
-                print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: Raw result: {result[:200]}...")
-                
-                # Try to use the fix_json_parser module if available
-                try:
-                    from fix_json_parser import parse_agent_response
-                    
-                    # Parse the agent's response
-                    parsed_dict = parse_agent_response(result)
-                    
-                    if parsed_dict:
-                        # Convert the dictionary to a Posts object
-                        parsed = Posts.model_validate(parsed_dict)
-                        print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: Successfully parsed {len(parsed.posts)} posts using fix_json_parser.")
-                    else:
-                        # Fall back to the original method
-                        parsed: Posts = Posts.model_validate_json(result)
-                        print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: Successfully parsed {len(parsed.posts)} posts using standard parser.")
-                except ImportError:
-                    # If the fix_json_parser module is not available, use the original method
-                    parsed: Posts = Posts.model_validate_json(result)
-                    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: Successfully parsed {len(parsed.posts)} posts.")
-            except json.JSONDecodeError as e:
-                print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: JSON decode error: {e}")
-                print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: Raw result: {result}")
-                
-                # Try to save the raw result to a file for later processing
-                try:
-                    with open("agent_response.txt", "w") as f:
-                        f.write(result)
-                    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: Saved raw result to agent_response.txt")
-                    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: You can process this file later using: python fix_json_parser.py agent_response.txt")
-                except Exception as write_error:
-                    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: Error saving raw result: {write_error}")
-                
-                return
-            except Exception as e:
-                print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: Error parsing agent output: {e}")
-                print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: Raw result: {result}")
-                
-                # Try to save the raw result to a file for later processing
-                try:
-                    with open("agent_response.txt", "w") as f:
-                        f.write(result)
-                    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: Saved raw result to agent_response.txt")
-                    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: You can process this file later using: python fix_json_parser.py agent_response.txt")
-                except Exception as write_error:
-                    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: Error saving raw result: {write_error}")
-                
-                return
+            # Log the raw result for debugging
+            print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: Raw result: {result[:200]}...")
             
             # Connect to (or create) a SQLite database and create the posts table if needed.
-            conn = sqlite3.connect("x_com_posts.db")
+            conn = pipeline_state.connect("x_com_posts.db")
             c = conn.cursor()
             c.execute('''CREATE TABLE IF NOT EXISTS posts (
                             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -482,34 +490,75 @@ async def main_job(post_count: int = 25):
                             saves INTEGER,
                             post_time TEXT,
                             scraped_at DATETIME DEFAULT CURRENT_TIMESTAMP)''')
-            # Insert each post into the table.
-            for post in parsed.posts:
-                # Convert any string metrics to integers
-                views = convert_abbreviated_number(post.views)
-                comments = convert_abbreviated_number(post.comments)
-                retweets = convert_abbreviated_number(post.retweets)
-                likes = convert_abbreviated_number(post.likes)
-                saves = convert_abbreviated_number(post.saves)
-                
-                c.execute('''
-                    INSERT INTO posts (
-                        post_text, post_url, username, image_url, 
-                        views, comments, retweets, likes, saves, post_time
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    post.post_text, post.post_url, post.username, post.image_url,
-                    views, comments, retweets, likes, saves, post.post_time
-                ))
+            setup_sentiment_column(conn)
             conn.commit()
+            
+            # Insert and commit each post as soon as it parses, so a truncated or partly malformed
+            # reply, or an error later in the stream, still keeps the posts stored before it
+            stored = 0
+            with tracing.span("db.store_posts", "db", table="posts") as span:
+                for post_dict in iter_agent_posts(result):
+                    try:
+                        post = Post.model_validate(normalize_post(post_dict))
+                    except ValidationError as e:
+                        print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: Skipping invalid post: {e.errors()[0].get('msg')}")
+                        reporter.error("Invalid post in agent output")
+                        continue
+                    
+                    # Convert any string metrics to integers
+                    views = convert_abbreviated_number(post.views)
+                    comments = convert_abbreviated_number(post.comments)
+                    retweets = convert_abbreviated_number(post.retweets)
+                    likes = convert_abbreviated_number(post.likes)
+                    saves = convert_abbreviated_number(post.saves)
+                    
+                    try:
+                        with conn:
+                            c.execute('''
+                                INSERT INTO posts (
+                                    post_text, post_url, username, image_url, 
+                                    views, comments, retweets, likes, saves, post_time, sentiment
+                                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                            ''', (
+                                post.post_text, post.post_url, post.username, post.image_url,
+                                views, comments, retweets, likes, saves, post.post_time, score_text(post.post_text)
+                            ))
+                    except sqlite3.Error as e:
+                        print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: SQLite error storing post: {e}")
+                        reporter.advance(post.post_url, error=f"SQLite error: {e}")
+                        continue
+                    stored += 1
+                    reporter.advance(post.post_url)
+                span.set(rows=stored)
             conn.close()
-            print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: Stored {len(parsed.posts)} posts successfully.")
+            
+            if stored == 0:
+                print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: Could not parse any posts from the agent output")
+                
+                # Try to save the raw result to a file for later processing
+                try:
+                    with open("agent_response.txt", "w") as f:
+                        f.write(result)
+                    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: Saved raw result to agent_response.txt")
+                    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: You can process this file later using: python fix_json_parser.py agent_response.txt")
+                except Exception as write_error:
+                    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: Error saving raw result: {write_error}")
+                
+                reporter.error("Could not parse agent output")
+                reporter.finish()
+                return
+            
+            print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: Stored {stored} posts successfully.")
         else:
             print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: No result from agent.")
+            reporter.error("No result from agent")
     except Exception as e:
         print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: Error during agent execution: {e}")
+        reporter.error(f"Error during agent execution: {e}")
         # If there's an error, reset the agent instance so we create a new one next time
         agent_instance = None
     
+    reporter.finish()
     print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}: Agent task completed, browser session closed.")
 
 # ----------------------
@@ -523,11 +572,12 @@ def job(post_count: int = 10):
 # Main: Run Once
 # ----------------------
 
-if __name__ == "__main__":
+def run_cli(argv: Optional[List[str]] = None):
+    """Parse command-line arguments and run the scraper once."""
     # Parse command-line arguments
     parser = argparse.ArgumentParser(description="Scrape posts from Twitter/X.com")
     parser.add_argument("--count", type=int, default=10, help="Number of posts to scrape (default: 10)")
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     post_count = args.count
     
@@ -535,3 +585,6 @@ if __name__ == "__main__":
     # Run the job once and exit
     job(post_count)
     print(f"Scraping completed. {post_count} posts saved to x_com_posts.db")
+
+if __name__ == "__main__":
+    run_cli()
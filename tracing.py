@@ -0,0 +1,357 @@
+import os
+import sys
+import json
+import time
+import uuid
+import inspect
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, List, Optional
+
+# Functions called with every finished span; TRACE_FILE adds one that appends spans as JSON lines.
+# Spans are only measured while at least one exporter is registered, so tracing costs nothing when off.
+_exporters: List[Callable[[Dict[str, Any]], None]] = []
+_exporters_lock = threading.Lock()
+
+# The span the current thread or asyncio task is inside, used as the parent of new spans
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+# Kinds of span, used to group the summary report
+KINDS = ["stage", "llm", "db", "browser", "job"]
+
+# Numeric attributes summed per span name in the summary report
+SUMMED_ATTRIBUTES = ["prompt_tokens", "completion_tokens", "rows", "bytes"]
+
+def add_exporter(exporter: Callable[[Dict[str, Any]], None]):
+    """Call a function with every finished span."""
+    with _exporters_lock:
+        _exporters.append(exporter)
+
+def remove_exporter(exporter: Callable[[Dict[str, Any]], None]):
+    """Stop calling a function registered with add_exporter."""
+    with _exporters_lock:
+        if exporter in _exporters:
+            _exporters.remove(exporter)
+
+def is_enabled() -> bool:
+    """Check whether spans are being recorded."""
+    return bool(_exporters)
+
+def append_to_file(file_path: str) -> Callable[[Dict[str, Any]], None]:
+    """Create an exporter that appends spans to a file as JSON lines."""
+    lock = threading.Lock()
+    
+    def exporter(span_record: Dict[str, Any]):
+        with lock, open(file_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(span_record) + "\n")
+    
+    return exporter
+
+class Span:
+    """A timed operation with attributes, such as one LLM call or one DB query."""
+    
+    def __init__(self, name: str, kind: str, parent: Optional["Span"] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.kind = kind
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.error = None
+        self.start_time = time.time()
+        self.started = time.perf_counter()
+    
+    def set(self, **attributes):
+        """Add attributes to the span, e.g. span.set(rows=20, bytes=5120)."""
+        self.attributes.update(attributes)
+    
+    def fail(self, error: Any):
+        """Mark the span as failed."""
+        self.status = "error"
+        self.error = str(error)[:500]
+    
+    def to_record(self) -> Dict[str, Any]:
+        duration = time.perf_counter() - self.started
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_time": self.start_time,
+            "end_time": self.start_time + duration,
+            "duration_ms": round(duration * 1000, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes
+        }
+
+class _NoopSpan:
+    """Stands in for a span while tracing is off."""
+    
+    trace_id = None
+    span_id = None
+    
+    def set(self, **attributes):
+        pass
+    
+    def fail(self, error: Any):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+def current_span() -> Optional[Span]:
+    """Get the span the caller is inside, to pass as parent to work started on another thread."""
+    return _current_span.get()
+
+def set_attributes(**attributes):
+    """Add attributes to the span the caller is inside, if any (for functions wrapped with @traced)."""
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attributes)
+
+@contextmanager
+def span(name: str, kind: str, parent: Optional[Span] = None, **attributes):
+    """
+    Time a block of code as a span.
+    
+    Spans nest: a span started inside another becomes its child. Work handed to another thread
+    doesn't inherit the current span, so pass parent=current_span() explicitly there.
+    
+    Args:
+        name: Name of the operation, e.g. "llm.chat_completion"
+        kind: One of KINDS
+        parent: Parent span, defaults to the span the caller is inside
+        **attributes: Initial attributes; more can be added with span.set()
+    """
+    if not _exporters:
+        yield NOOP_SPAN
+        return
+    
+    new_span = Span(name, kind, parent if parent is not None else _current_span.get(), attributes)
+    token = _current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        # SystemExit(0) is how command-line components finish normally
+        if not (isinstance(e, SystemExit) and e.code in (None, 0)):
+            new_span.fail(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        record = new_span.to_record()
+        with _exporters_lock:
+            exporters = list(_exporters)
+        for exporter in exporters:
+            try:
+                exporter(record)
+            except Exception as e:
+                print(f"Error in trace exporter: {e}")
+
+def traced(name: str, kind: str):
+    """Decorator that runs a function (sync or async) inside a span."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name, kind):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def load_spans(file_path: str) -> List[Dict[str, Any]]:
+    """Read spans from a JSONL trace file, skipping lines that aren't valid JSON."""
+    spans = []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                spans.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return spans
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def to_otlp(spans: List[Dict[str, Any]], service_name: str = "content-curation") -> Dict[str, Any]:
+    """
+    Convert spans to the OpenTelemetry OTLP/JSON trace format.
+    
+    The result can be posted to a collector's /v1/traces endpoint or loaded by tools
+    that read OTLP JSON files.
+    """
+    otlp_spans = []
+    for record in spans:
+        attributes = dict(record.get("attributes") or {})
+        attributes["pipeline.kind"] = record.get("kind")
+        
+        otlp_span = {
+            "traceId": record["trace_id"],
+            "spanId": record["span_id"],
+            "name": record["name"],
+            # Calls out of the process (LLM, browser, database) are CLIENT spans, the rest INTERNAL
+            "kind": 3 if record.get("kind") in ("llm", "browser", "db") else 1,
+            "startTimeUnixNano": str(int(record["start_time"] * 1e9)),
+            "endTimeUnixNano": str(int(record["end_time"] * 1e9)),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None],
+            "status": {"code": 2, "message": record.get("error") or ""} if record.get("status") == "error" else {"code": 1}
+        }
+        if record.get("parent_id"):
+            otlp_span["parentSpanId"] = record["parent_id"]
+        otlp_spans.append(otlp_span)
+    
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": otlp_spans}]
+        }]
+    }
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a non-empty list of values."""
+    ordered = sorted(values)
+    rank = max(1, int(-(-pct * len(ordered) // 100)))
+    return ordered[rank - 1]
+
+def summarize(spans: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Summarize spans per name: count, errors, total and p50/p99 time, and summed tokens, rows and bytes.
+    
+    Returns:
+        One entry per span name, slowest total first
+    """
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for record in spans:
+        groups.setdefault(record["name"], []).append(record)
+    
+    summary = []
+    for name, records in groups.items():
+        durations = [record["duration_ms"] for record in records]
+        entry = {
+            "name": name,
+            "kind": records[0].get("kind"),
+            "count": len(records),
+            "errors": sum(1 for record in records if record.get("status") == "error"),
+            "total_ms": round(sum(durations), 1),
+            "p50_ms": round(percentile(durations, 50), 1),
+            "p99_ms": round(percentile(durations, 99), 1),
+            "max_ms": round(max(durations), 1)
+        }
+        for attribute in SUMMED_ATTRIBUTES:
+            values = [record.get("attributes", {}).get(attribute) for record in records]
+            values = [value for value in values if isinstance(value, (int, float))]
+            if values:
+                entry[attribute] = sum(values)
+        summary.append(entry)
+    
+    summary.sort(key=lambda entry: entry["total_ms"], reverse=True)
+    return summary
+
+def print_summary(spans: List[Dict[str, Any]]):
+    """Print where time went, per kind of span and per span name."""
+    if not spans:
+        print("No spans found.")
+        return
+    
+    summary = summarize(spans)
+    
+    # Time per kind only counts spans without a parent of the same kind, so nested spans aren't counted twice
+    by_id = {record["span_id"]: record for record in spans}
+    kind_totals: Dict[str, float] = {}
+    for record in spans:
+        parent = by_id.get(record.get("parent_id"))
+        if parent is None or parent.get("kind") != record.get("kind"):
+            kind_totals[record["kind"]] = kind_totals.get(record["kind"], 0) + record["duration_ms"]
+    
+    print("Time by kind:")
+    for kind, total in sorted(kind_totals.items(), key=lambda item: item[1], reverse=True):
+        print(f"  {kind:<10} {total / 1000:>10.2f}s")
+    
+    print(f"\n{'Span':<36} {'Count':>7} {'Errors':>7} {'Total s':>9} {'p50 ms':>9} {'p99 ms':>9} {'Max ms':>9}  Totals")
+    for entry in summary:
+        totals = ", ".join(f"{attribute}={entry[attribute]}" for attribute in SUMMED_ATTRIBUTES if attribute in entry)
+        print(f"{entry['name'][:36]:<36} {entry['count']:>7} {entry['errors']:>7} {entry['total_ms'] / 1000:>9.2f} "
+              f"{entry['p50_ms']:>9.1f} {entry['p99_ms']:>9.1f} {entry['max_ms']:>9.1f}  {totals}")
+
+def export_otlp(spans: List[Dict[str, Any]], output_file: Optional[str] = None, endpoint: Optional[str] = None):
+    """Write spans as OTLP JSON to a file and/or post them to an OTLP/HTTP collector endpoint."""
+    payload = to_otlp(spans)
+    
+    if output_file:
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(payload, f)
+        print(f"Wrote {len(spans)} spans to {output_file}")
+    
+    if endpoint:
+        import urllib.request
+        request = urllib.request.Request(
+            endpoint,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=30) as response:
+            print(f"Posted {len(spans)} spans to {endpoint} (HTTP {response.status})")
+
+# Scripts can write their spans to a file given by the caller
+if os.getenv("TRACE_FILE"):
+    add_exporter(append_to_file(os.getenv("TRACE_FILE")))
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Summarize or export pipeline traces.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    summary_parser = subparsers.add_parser("summary", help="Show where time went in a trace file")
+    summary_parser.add_argument("trace_file", help="JSONL trace file (TRACE_FILE or main.py --trace)")
+    summary_parser.add_argument("--kind", choices=KINDS, help="Only include spans of this kind")
+    summary_parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    
+    otlp_parser = subparsers.add_parser("otlp", help="Convert a trace file to OpenTelemetry OTLP JSON")
+    otlp_parser.add_argument("trace_file", help="JSONL trace file")
+    otlp_parser.add_argument("--out", help="Write OTLP JSON to this file")
+    otlp_parser.add_argument("--endpoint", help="Post to an OTLP/HTTP collector, e.g. http://localhost:4318/v1/traces")
+    
+    args = parser.parse_args()
+    
+    try:
+        spans = load_spans(args.trace_file)
+    except OSError as e:
+        print(f"Error reading trace file: {e}")
+        sys.exit(1)
+    
+    if args.command == "summary":
+        if args.kind:
+            spans = [record for record in spans if record.get("kind") == args.kind]
+        if args.json:
+            print(json.dumps(summarize(spans), indent=2))
+        else:
+            print_summary(spans)
+    else:
+        if not args.out and not args.endpoint:
+            print(json.dumps(to_otlp(spans), indent=2))
+        else:
+            try:
+                export_otlp(spans, args.out, args.endpoint)
+            except OSError as e:
+                print(f"Error exporting spans: {e}")
+                sys.exit(1)
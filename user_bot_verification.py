@@ -1,24 +1,27 @@
 import sqlite3
 import json
 import os
-import requests
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from typing import List, Dict, Any, Optional
+from model_router import route_completion
+import pipeline_state
+import selected_posts_db
+import llm_scheduler
 
 # Load environment variables
 load_dotenv()
 
-# Get OpenRouter API key from environment variable or prompt user
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-if not OPENROUTER_API_KEY:
-    OPENROUTER_API_KEY = input("Enter your OpenRouter API key: ")
-
-# OpenRouter API endpoint
-OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
-
 # Model to use (default to GPT-4o)
 MODEL = os.getenv("OPENROUTER_MODEL", "openai/gpt-4o")
 
+# Stored when the LLM call fails, so the post is retried on the next run instead of being recorded as a pass
+VALIDATION_FAILED = "failed"
+
+# Posts judged per LLM call (the profile is sent once per batch), and batches validated at once
+BATCH_SIZE = 10
+MAX_WORKERS = 4
+
 def load_user_profile(profile_file='user_profile.txt'):
     """Load the user profile from the profile file."""
     try:
@@ -33,24 +36,31 @@ def setup_database(db_file='posts_selected.db'):
     """Set up the database with necessary tables and columns."""
     try:
         # Connect to the database
-        conn = sqlite3.connect(db_file)
+        conn = pipeline_state.connect(db_file)
         cursor = conn.cursor()
         
-        # Check if selected_posts table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='selected_posts';")
+        # Check if selected_posts exists (a view over query_results, or the old table)
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name='selected_posts';")
         if not cursor.fetchone():
             print("No 'selected_posts' table found in the database.")
             conn.close()
             return False
         
-        # Check if llm_clone_validated column exists in selected_posts table
-        cursor.execute("PRAGMA table_info(selected_posts)")
-        columns = [column[1] for column in cursor.fetchall()]
+        # Validations are stored on query_results; an old selected_posts table is migrated first
+        selected_posts_db.setup_selected_posts(conn)
         
-        if "llm_clone_validated" not in columns:
-            print("Adding llm_clone_validated column to selected_posts table...")
-            cursor.execute("ALTER TABLE selected_posts ADD COLUMN llm_clone_validated TEXT")
-            conn.commit()
+        # Decisions reused for repeated selections of a post for the same query and profile
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS validation_cache (
+            profile_hash TEXT,
+            original_post_id INTEGER,
+            query TEXT,
+            validation TEXT,
+            validated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (profile_hash, original_post_id, query)
+        )
+        ''')
+        conn.commit()
         
         conn.close()
         return True
@@ -62,18 +72,21 @@ def setup_database(db_file='posts_selected.db'):
         print(f"Error: {e}")
         return False
 
-def get_unvalidated_posts(db_file='posts_selected.db'):
-    """Get posts from the database that haven't been validated yet."""
+def get_unvalidated_posts(db_file='posts_selected.db', query=None):
+    """Get posts from the database that haven't been validated yet, or whose validation failed."""
     try:
         # Connect to the database
         conn = sqlite3.connect(db_file)
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
-        # Get posts that haven't been validated
-        cursor.execute(
-            "SELECT * FROM selected_posts WHERE llm_clone_validated IS NULL OR llm_clone_validated = ''"
-        )
+        # Get posts that haven't been validated, optionally only those selected for one query
+        sql = "SELECT * FROM selected_posts WHERE (llm_clone_validated IS NULL OR llm_clone_validated IN ('', ?))"
+        params = [VALIDATION_FAILED]
+        if query is not None:
+            sql += " AND query = ?"
+            params.append(query)
+        cursor.execute(sql, params)
         posts = [dict(row) for row in cursor.fetchall()]
         
         conn.close()
@@ -134,13 +147,8 @@ def llm_validate_post(user_profile, post, query):
         query: The query that was used to find this post
         
     Returns:
-        "like" or "pass" based on the LLM's decision
+        "like" or "pass" based on the LLM's decision, or VALIDATION_FAILED if the call failed
     """
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
     # Format the post for the LLM
     formatted_post = format_post_for_llm(post)
     
@@ -168,52 +176,227 @@ Consider the user's interests, preferences, and the relevance of the post to the
     }
     
     try:
-        response = requests.post(OPENROUTER_API_URL, headers=headers, json=data)
-        response.raise_for_status()
-        
-        result = response.json()
-        content = result["choices"][0]["message"]["content"].strip().upper()
-        
-        # Extract LIKE or PASS from the response
-        if "LIKE" in content:
-            return "like"
-        elif "PASS" in content:
-            return "pass"
-        else:
-            print(f"Unexpected response from LLM: {content}")
-            # Default to pass if we can't determine
-            return "pass"
-            
+        return route_completion("validate", data, parse_validation, item_id=post.get("id"))
     except Exception as e:
         print(f"Error calling OpenRouter API: {e}")
-        # Default to pass if there's an error
-        return "pass"
+        return VALIDATION_FAILED
+
+def parse_validation(content):
+    """
+    Parse a validation reply into ("like" or "pass", confident).
+    
+    A bare LIKE or PASS is confident; a longer reply that mentions one of them is used but not trusted.
+    A reply with neither raises ValueError, so it is escalated and, from the last model, recorded as
+    VALIDATION_FAILED rather than as a decision the user never made.
+    """
+    content = content.strip().strip(".!").upper()
+    
+    if content in ("LIKE", "PASS"):
+        return content.lower(), True
+    
+    # Extract LIKE or PASS from the response
+    if "LIKE" in content:
+        return "like", False
+    elif "PASS" in content:
+        return "pass", False
+    else:
+        raise ValueError(f"Unexpected response from LLM: {content[:100]}")
+
+def llm_validate_batch(user_profile, posts, query):
+    """
+    Call the LLM once to validate a batch of posts found by the same query.
+    
+    Args:
+        user_profile: The user profile text
+        posts: The posts to validate
+        query: The query that was used to find these posts
+        
+    Returns:
+        A list with "like" or "pass" for each post, in order. Raises on API errors and on
+        replies that don't hold one decision per post.
+    """
+    formatted_posts = "\n".join(f"[{i}] {format_post_for_llm(post)}" for i, post in enumerate(posts, 1))
+    
+    data = {
+        "model": MODEL,
+        "messages": [
+            {
+                "role": "system",
+                "content": f"""You are a clone of a specific user with the following profile:
+
+{user_profile}
+
+Your task is to evaluate social media posts and decide whether the real user would LIKE or PASS on each of them.
+The user was searching for: "{query}"
+
+You will be given {len(posts)} numbered posts. Respond with ONLY a JSON array of {len(posts)} strings, each "LIKE" or "PASS",
+with one decision per post in the order the posts are numbered, e.g. ["LIKE", "PASS"].
+Consider the user's interests, preferences, and the relevance of each post to their search query.
+"""
+            },
+            {
+                "role": "user",
+                "content": f"Would I like or pass on each of these posts?\n\n{formatted_posts}"
+            }
+        ]
+    }
+    
+    def parse_batch(content):
+        return parse_batch_validation(content, len(posts))
+    
+    item_id = ",".join(str(post.get("id")) for post in posts)
+    return route_completion("validate", data, parse_batch, item_id=item_id)
+
+def parse_batch_validation(content, count):
+    """
+    Parse a batch validation reply into (decisions, confident).
+    
+    Raises ValueError unless the reply is an array with one decision per post;
+    decisions other than a bare LIKE or PASS make the batch unsure.
+    """
+    content = content.strip()
+    if content.startswith("```"):
+        content = content.strip("`").removeprefix("json").strip()
+    
+    try:
+        decisions = json.loads(content)
+    except json.JSONDecodeError:
+        raise ValueError(f"Batch validation reply is not a JSON array: {content[:100]}")
+    if not isinstance(decisions, list) or len(decisions) != count:
+        raise ValueError(f"Expected {count} decisions, got: {content[:100]}")
+    
+    results = [parse_validation(str(decision)) for decision in decisions]
+    return [validation for validation, _ in results], all(confident for _, confident in results)
+
+def validate_posts(user_profile, posts, batch_size=BATCH_SIZE, max_workers=MAX_WORKERS):
+    """
+    Validate posts in concurrent batches of posts found by the same query.
+    
+    A batch whose reply can't be matched to its posts is validated post by post instead;
+    posts whose LLM calls fail get VALIDATION_FAILED.
+    
+    Returns:
+        A dict mapping post ID to "like", "pass" or VALIDATION_FAILED
+    """
+    # Group posts by query so each batch shares one prompt
+    groups = {}
+    for post in posts:
+        groups.setdefault(post.get('query') or 'unknown', []).append(post)
+    
+    batches = []
+    for query, group in groups.items():
+        for start in range(0, len(group), max(1, batch_size)):
+            batches.append((query, group[start:start + max(1, batch_size)]))
+    
+    def run_batch(batch):
+        query, batch_posts = batch
+        try:
+            decisions = llm_validate_batch(user_profile, batch_posts, query)
+        except ValueError as e:
+            print(f"Batch reply unusable ({e}); validating {len(batch_posts)} posts one by one")
+            decisions = [llm_validate_post(user_profile, post, query) for post in batch_posts]
+        except Exception as e:
+            print(f"Error calling OpenRouter API: {e}")
+            decisions = [VALIDATION_FAILED] * len(batch_posts)
+        
+        print(f"Validated {len(batch_posts)} posts for query '{query}': "
+              f"{decisions.count('like')} like, {decisions.count('pass')} pass, {decisions.count(VALIDATION_FAILED)} failed")
+        return [(post.get('id'), decision) for post, decision in zip(batch_posts, decisions)]
+    
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        for batch_results in llm_scheduler.map_in_context(executor, run_batch, batches):
+            results.update(batch_results)
+    return results
+
+def validation_cache_key(post):
+    """The (original post ID, normalized query) a decision is cached under, or None for posts without an original."""
+    if post.get('original_post_id') is None:
+        return None
+    return (post['original_post_id'], pipeline_state.normalize_query(post.get('query')))
 
-def update_post_validation(post_id, validation, db_file='posts_selected.db'):
-    """Update a post with the validation result."""
+def get_cached_validations(profile_hash, keys, db_file='posts_selected.db'):
+    """Look up cached decisions for (original post ID, normalized query) keys made with this profile."""
+    post_ids = sorted({post_id for post_id, _ in keys})
+    cached = {}
+    
     try:
-        # Connect to the database
         conn = sqlite3.connect(db_file)
         cursor = conn.cursor()
         
-        # Update the post
-        cursor.execute(
-            "UPDATE selected_posts SET llm_clone_validated = ? WHERE id = ?",
-            (validation, post_id)
-        )
+        # Look the posts up in chunks to stay under SQLite's variable limit
+        for start in range(0, len(post_ids), 500):
+            chunk = post_ids[start:start + 500]
+            cursor.execute(
+                f"SELECT original_post_id, query, validation FROM validation_cache "
+                f"WHERE profile_hash = ? AND original_post_id IN ({', '.join('?' * len(chunk))})",
+                [profile_hash] + chunk
+            )
+            for post_id, query, validation in cursor.fetchall():
+                if (post_id, query) in keys:
+                    cached[(post_id, query)] = validation
         
-        conn.commit()
+        conn.close()
+    except sqlite3.Error as e:
+        print(f"SQLite error reading validation cache: {e}")
+    
+    return cached
+
+def validate_selected_posts(user_profile, posts, db_file='posts_selected.db', batch_size=BATCH_SIZE, max_workers=MAX_WORKERS):
+    """
+    Validate selected posts and store the results, reusing earlier decisions.
+    
+    A post selected again for the same (normalized) query with the same profile gets the cached
+    decision, and copies of a post selected by several runs of a query are validated once.
+    
+    Returns:
+        A dict mapping selected post ID to "like", "pass" or VALIDATION_FAILED
+    """
+    profile_hash = pipeline_state.text_fingerprint(user_profile)
+    keys = {post['id']: validation_cache_key(post) or ('row', post['id']) for post in posts}
+    cached = get_cached_validations(profile_hash, set(keys.values()), db_file)
+    
+    # One post per decision still to be made
+    pending = {}
+    for post in posts:
+        key = keys[post['id']]
+        if key not in cached and key not in pending:
+            pending[key] = post
+    reused = sum(1 for post in posts if keys[post['id']] in cached)
+    print(f"Reusing {reused} cached validations; validating {len(pending)} unique posts.")
+    
+    fresh = validate_posts(user_profile, list(pending.values()), batch_size, max_workers) if pending else {}
+    decisions = dict(cached)
+    decisions.update({key: fresh[post['id']] for key, post in pending.items()})
+    
+    validations = {post['id']: decisions[keys[post['id']]] for post in posts}
+    cache_rows = [(profile_hash, key[0], key[1], fresh[post['id']]) for key, post in pending.items()
+                  if key[0] != 'row' and fresh[post['id']] != VALIDATION_FAILED]
+    if save_validations(validations, db_file, cache_rows):
+        print(f"Successfully updated {len(validations)} posts with their validation.")
+    else:
+        print("Failed to update posts with their validation.")
+    return validations
+
+def save_validations(validations, db_file='posts_selected.db', cache_rows=None):
+    """Write validation results (post ID to decision) and new validation_cache rows in one transaction."""
+    try:
+        conn = pipeline_state.connect(db_file)
+        with conn:
+            selected_posts_db.update_validations(validations, conn)
+            if cache_rows:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO validation_cache (profile_hash, original_post_id, query, validation) VALUES (?, ?, ?, ?)",
+                    cache_rows
+                )
         conn.close()
         return True
         
     except sqlite3.Error as e:
         print(f"SQLite error: {e}")
         return False
-    except Exception as e:
-        print(f"Error: {e}")
-        return False
 
-def main():
+def main(batch_size=BATCH_SIZE, max_workers=MAX_WORKERS):
     """Main function to run the user bot verification."""
     print("Starting user bot verification...")
     
@@ -240,27 +423,25 @@ def main():
     
     print(f"Found {len(posts)} unvalidated posts.")
     
-    # Process each post
-    for i, post in enumerate(posts, 1):
-        post_id = post.get('id')
-        query = post.get('query', 'unknown')
-        
-        print(f"Processing post {i}/{len(posts)} (ID: {post_id})...")
-        
-        # Call LLM to validate post
-        validation = llm_validate_post(user_profile, post, query)
-        
-        print(f"LLM decision: {validation}")
-        
-        # Update post with validation
-        if update_post_validation(post_id, validation):
-            print(f"Successfully updated post {post_id} with validation: {validation}")
-        else:
-            print(f"Failed to update post {post_id}")
-        
-        print()
+    # Validate the posts in batches, reusing cached decisions, and store all results together
+    validations = validate_selected_posts(user_profile, posts, batch_size=batch_size, max_workers=max_workers)
     
     print("Finished processing all posts.")
+    failed_count = list(validations.values()).count(VALIDATION_FAILED)
+    if failed_count:
+        print(f"{failed_count} posts failed validation. Run again to retry them.")
+
+def run_cli(argv: Optional[List[str]] = None):
+    """Parse command-line arguments and validate the unvalidated selected posts."""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Simulate user validation of selected posts.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help=f"Posts judged per LLM call (default: {BATCH_SIZE})")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help=f"Batches validated concurrently (default: {MAX_WORKERS})")
+    
+    args = parser.parse_args(argv)
+    
+    main(args.batch_size, args.workers)
 
 if __name__ == "__main__":
-    main()
+    run_cli()
@@ -203,14 +203,15 @@ def view_user_feedback(db_file='user_feedback.db'):
     except Exception as e:
         print(f"Error: {e}")
 
-if __name__ == "__main__":
+def run_cli(argv: Optional[List[str]] = None):
+    """Parse command-line arguments and generate or view feedback."""
     import argparse
     
     parser = argparse.ArgumentParser(description="Generate and view sample user feedback.")
     parser.add_argument("--generate", type=int, default=0, help="Generate sample feedback (specify count)")
     parser.add_argument("--view", action="store_true", help="View user feedback")
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     if args.generate > 0:
         generate_sample_feedback(args.generate)
@@ -220,3 +221,6 @@ if __name__ == "__main__":
     
     if not args.generate and not args.view:
         print("Please specify an action: --generate COUNT or --view")
+
+if __name__ == "__main__":
+    run_cli()
@@ -2,22 +2,18 @@ import sqlite3
 import json
 import os
 import time
-import requests
 from datetime import datetime
 from dotenv import load_dotenv
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+from model_router import route_completion
+import selected_posts_db
+import query_cache
+import feedback_preferences
+import tracing
 
 # Load environment variables
 load_dotenv()
 
-# Get OpenRouter API key from environment variable or prompt user
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-if not OPENROUTER_API_KEY:
-    OPENROUTER_API_KEY = input("Enter your OpenRouter API key: ")
-
-# OpenRouter API endpoint
-OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
-
 # Model to use (default to GPT-4o)
 MODEL = os.getenv("OPENROUTER_MODEL", "openai/gpt-4o")
 
@@ -58,7 +54,6 @@ def load_user_profile():
         print(f"Error loading base user profile: {e}")
         return None
 
-import requests
 import json
 from typing import List
 
@@ -73,12 +68,8 @@ def keyword_finder_llm(user_query: str, keywords: List[str], user_profile: str =
         
     Returns:
         List of the most relevant keywords from the available keywords list.
+        Raises if the LLM call fails, rather than searching with keywords the user never asked for.
     """
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
     # Format the keywords as a comma-separated string
     keywords_str = ", ".join(keywords)
     
@@ -110,28 +101,23 @@ Only return keywords from the provided list.
         ]
     }
     
-    try:
-        response = requests.post(OPENROUTER_API_URL, headers=headers, json=data)
-        response.raise_for_status()
-        
-        result = response.json()
-        content = result["choices"][0]["message"]["content"]
-        
+    # Replies are checked against the available keywords, so a reply made up of unknown ones is escalated
+    available = set(keywords)
+    
+    def parse_matched_keywords(content: str) -> Tuple[List[str], bool]:
         # Try to parse the response as JSON
         try:
             matched_keywords = json.loads(content)
             if isinstance(matched_keywords, list):
-                return matched_keywords
+                return matched_keywords, any(keyword in available for keyword in matched_keywords)
             else:
                 # If it's not a list, try to extract keywords from the text
-                return extract_keywords_from_text(content)
+                return extract_keywords_from_text(content), False
         except json.JSONDecodeError:
             # If it's not valid JSON, try to extract keywords from the text
-            return extract_keywords_from_text(content)
-            
-    except Exception as e:
-        print(f"Error calling OpenRouter API: {e}")
-        return []
+            return extract_keywords_from_text(content), False
+    
+    return route_completion("discover", data, parse_matched_keywords, item_id=user_query)
 
 
 def extract_keywords_from_text(text: str) -> List[str]:
@@ -171,24 +157,16 @@ def get_posts_by_keywords(keywords: List[str], db_file='x_com_posts.db') -> List
         cursor = conn.cursor()
         
         # Get all posts
-        cursor.execute("SELECT * FROM posts ORDER BY scraped_at DESC")
-        all_posts = [dict(row) for row in cursor.fetchall()]
+        with tracing.span("db.get_posts_by_keywords", "db", table="posts") as span:
+            cursor.execute("SELECT * FROM posts ORDER BY scraped_at DESC")
+            all_posts = [dict(row) for row in cursor.fetchall()]
+            span.set(rows=len(all_posts))
         
         # Filter posts by keywords
         matching_posts = []
         
         for post in all_posts:
-            post_keywords = []
-            
-            # Parse keywords JSON if it exists
-            if post.get('keywords'):
-                try:
-                    post_keywords = json.loads(post['keywords'])
-                except (json.JSONDecodeError, TypeError):
-                    pass
-            
-            # Count how many keywords match
-            matching_keyword_count = sum(1 for kw in keywords if kw in post_keywords)
+            matching_keyword_count = count_matching_keywords(post, keywords)
             
             # If at least one keyword matches, add the post to the results
             if matching_keyword_count > 0:
@@ -206,15 +184,64 @@ def get_posts_by_keywords(keywords: List[str], db_file='x_com_posts.db') -> List
         print(f"Error: {e}")
         return []
 
-def rank_posts(posts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def count_matching_keywords(post: Dict[str, Any], keywords: List[str]) -> int:
+    """Count how many of the keywords a post has."""
+    post_keywords = []
+    
+    # Parse keywords JSON if it exists
+    if post.get('keywords'):
+        try:
+            post_keywords = json.loads(post['keywords'])
+        except (json.JSONDecodeError, TypeError):
+            pass
+    
+    return sum(1 for kw in keywords if kw in post_keywords)
+
+def get_posts_by_ids(post_ids: List[int], keywords: List[str], db_file='x_com_posts.db') -> List[Dict[str, Any]]:
+    """
+    Get the posts of a cached search, with their matching keyword count for ranking.
+    
+    Args:
+        post_ids: IDs of the posts to get
+        keywords: The keywords the search matched them on
+        db_file: Path to the SQLite database file
+        
+    Returns:
+        The posts that still exist
+    """
+    if not post_ids:
+        return []
+    
+    try:
+        conn = sqlite3.connect(db_file)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        
+        with tracing.span("db.get_posts_by_ids", "db", table="posts") as span:
+            cursor.execute(f"SELECT * FROM posts WHERE id IN ({', '.join('?' * len(post_ids))})", post_ids)
+            posts = [dict(row) for row in cursor.fetchall()]
+            span.set(rows=len(posts))
+        
+        for post in posts:
+            post['matching_keyword_count'] = count_matching_keywords(post, keywords)
+        
+        conn.close()
+        return posts
+        
+    except sqlite3.Error as e:
+        print(f"SQLite error: {e}")
+        return []
+
+def rank_posts(posts: List[Dict[str, Any]], preferences: Optional[Dict[str, Dict[str, float]]] = None) -> List[Dict[str, Any]]:
     """
-    Rank posts based on keyword matches, ranking, and recency.
+    Rank posts based on keyword matches, ranking, learned preferences, and recency.
     
     Args:
         posts: List of posts to rank
+        preferences: The preference vector from feedback_preferences.load_preference_vector(), if any
         
     Returns:
-        List of posts sorted by relevance, ranking, and recency
+        List of posts sorted by relevance, ranking, preferences, and recency
     """
     # Calculate a score for each post
     for post in posts:
@@ -232,6 +259,13 @@ def rank_posts(posts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
             except (ValueError, TypeError):
                 pass
         
+        # Consider the keyword and author affinities learned from feedback
+        # A liked post gains up to 30 points, a disliked one loses up to 30
+        if preferences:
+            affinity = feedback_preferences.preference_score(post, preferences)
+            if affinity is not None:
+                score += affinity * 30
+        
         # Consider metrics (views, likes, etc.)
         try:
             # Views
@@ -357,6 +391,7 @@ def ensure_keyword_count(keywords: List[str], all_keywords: List[str], min_count
     
     return keywords
 
+@tracing.traced("db.save_selected_posts", "db")
 def save_posts_to_database(posts: List[Dict[str, Any]], db_file='posts_selected.db', query: str = None):
     """
     Save selected posts to a database for other programs to use.
@@ -367,124 +402,26 @@ def save_posts_to_database(posts: List[Dict[str, Any]], db_file='posts_selected.
         query: The user query that was used to find these posts
     """
     try:
-        # Connect to the database
-        conn = sqlite3.connect(db_file)
-        cursor = conn.cursor()
-        
-        # Create the selected_posts table if it doesn't exist
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS selected_posts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            original_post_id INTEGER,
-            username TEXT,
-            post_url TEXT,
-            post_time TEXT,
-            scraped_at TEXT,
-            post_text TEXT,
-            keywords TEXT,
-            matching_keyword_count INTEGER,
-            relevance_score REAL,
-            views INTEGER,
-            comments INTEGER,
-            retweets INTEGER,
-            likes INTEGER,
-            user_ranking REAL,
-            image_url TEXT,
-            query TEXT,
-            selected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
-        
-        # Create the queries table if it doesn't exist
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS queries (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            query TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
-        
-        # Insert the query
-        if query:
-            cursor.execute(
-                "INSERT INTO queries (query) VALUES (?)",
-                (query,)
-            )
-            query_id = cursor.lastrowid
-        else:
-            query_id = None
-        
-        # Insert the posts
+        rows = []
         for post in posts:
-            # Convert metrics to integers if possible
-            views = post.get('views', 0)
-            if views and views != 'N/A':
-                try:
-                    views = int(str(views).replace(',', ''))
-                except (ValueError, TypeError):
-                    views = 0
-            else:
-                views = 0
-                
-            comments = post.get('comments', 0)
-            if comments and comments != 'N/A':
-                try:
-                    comments = int(str(comments).replace(',', ''))
-                except (ValueError, TypeError):
-                    comments = 0
-            else:
-                comments = 0
-                
-            retweets = post.get('retweets', 0)
-            if retweets and retweets != 'N/A':
-                try:
-                    retweets = int(str(retweets).replace(',', ''))
-                except (ValueError, TypeError):
-                    retweets = 0
-            else:
-                retweets = 0
-                
-            likes = post.get('likes', 0)
-            if likes and likes != 'N/A':
-                try:
-                    likes = int(str(likes).replace(',', ''))
-                except (ValueError, TypeError):
-                    likes = 0
-            else:
-                likes = 0
+            row = dict(post)
             
-            # Insert the post
-            cursor.execute(
-                """
-                INSERT INTO selected_posts (
-                    original_post_id, username, post_url, post_time, scraped_at,
-                    post_text, keywords, matching_keyword_count, relevance_score,
-                    views, comments, retweets, likes, user_ranking, image_url, query
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    post.get('id'),
-                    post.get('username'),
-                    post.get('post_url'),
-                    post.get('post_time'),
-                    post.get('scraped_at'),
-                    post.get('post_text'),
-                    post.get('keywords'),
-                    post.get('matching_keyword_count'),
-                    post.get('relevance_score'),
-                    views,
-                    comments,
-                    retweets,
-                    likes,
-                    post.get('user_ranking'),
-                    post.get('image_url'),
-                    query
-                )
-            )
+            # Convert metrics to integers if possible
+            for metric in ('views', 'comments', 'retweets', 'likes'):
+                value = post.get(metric, 0)
+                if value and value != 'N/A':
+                    try:
+                        value = int(str(value).replace(',', ''))
+                    except (ValueError, TypeError):
+                        value = 0
+                else:
+                    value = 0
+                row[metric] = value
+            rows.append(row)
         
-        # Commit the changes
-        conn.commit()
-        conn.close()
+        # Each post is stored once; the query run links to it with its rank and score
+        selected_posts_db.save_query_results(rows, query, db_file)
+        tracing.set_attributes(rows=len(posts))
         
         print(f"Successfully saved {len(posts)} posts to {db_file}")
         
@@ -516,7 +453,12 @@ def main():
     
     # Call keyword_finder_llm to find relevant keywords
     print("Calling keyword_finder_llm to find relevant keywords...")
-    relevant_keywords = keyword_finder_llm(user_query, keywords, user_profile)
+    try:
+        relevant_keywords = keyword_finder_llm(user_query, keywords, user_profile)
+    except Exception as e:
+        print(f"Error calling OpenRouter API: {e}")
+        print("Keyword discovery failed. Please try again.")
+        return
     
     # Ensure we have between 2 and 5 keywords
     relevant_keywords = ensure_keyword_count(relevant_keywords, keywords)
@@ -536,8 +478,8 @@ def main():
     print(f"Found {len(matching_posts)} matching posts.")
     
     # Rank posts by relevance, ranking, and recency
-    print("Ranking posts by relevance, ranking, and recency...")
-    ranked_posts = rank_posts(matching_posts)
+    print("Ranking posts by relevance, ranking, preferences, and recency...")
+    ranked_posts = rank_posts(matching_posts, feedback_preferences.load_preference_vector())
     
     # Save ranked posts to database
     print(f"Saving top {len(ranked_posts)} posts to database...")
@@ -551,8 +493,17 @@ def main():
         print(format_post(post))
         print()
 
-def main_with_query(user_query: str):
-    """Run the main function with a predefined query (non-interactive mode)."""
+def main_with_query(user_query: str, use_cache: bool = True, user_profile: Optional[str] = None):
+    """
+    Run the main function with a predefined query (non-interactive mode).
+    
+    A user_profile passed in (e.g. the one the website sent with the search) is used instead of
+    the profile files.
+    
+    The keywords and ranked posts of a search are cached for the same normalized query and profile
+    until the TTL passes or posts, keywords or rankings change; a repeated search skips the keyword
+    LLM call and the scan of the posts table.
+    """
     # Load keywords from keywords.txt
     keywords = load_keywords()
     
@@ -563,38 +514,60 @@ def main_with_query(user_query: str):
     print(f"Loaded {len(keywords)} keywords from keywords.txt.")
     
     # Load user profile
-    user_profile = load_user_profile()
+    if user_profile is None:
+        user_profile = load_user_profile()
     if user_profile:
         print("User profile loaded successfully.")
     else:
         print("No user profile found. Proceeding without user profile.")
+    preferences = feedback_preferences.load_preference_vector()
     
     print(f"Using query: {user_query}")
     
-    # Call keyword_finder_llm to find relevant keywords
-    print("Calling keyword_finder_llm to find relevant keywords...")
-    relevant_keywords = keyword_finder_llm(user_query, keywords, user_profile)
-    
-    # Ensure we have between 2 and 5 keywords
-    relevant_keywords = ensure_keyword_count(relevant_keywords, keywords)
-    
-    print(f"Found {len(relevant_keywords)} relevant keywords:")
-    for keyword in relevant_keywords:
-        print(f"- {keyword}")
-    
-    # Get posts by keywords
-    print("\nFinding posts with related keywords...")
-    matching_posts = get_posts_by_keywords(relevant_keywords)
-    
-    if not matching_posts:
-        print("No matching posts found.")
-        return
-    
-    print(f"Found {len(matching_posts)} matching posts.")
+    use_cache = use_cache and query_cache.cache_enabled()
+    watermark = query_cache.current_watermark() if use_cache else None
+    cached = query_cache.get_cached_query(user_query, user_profile, watermark) if use_cache else None
     
-    # Rank posts by relevance, ranking, and recency
-    print("Ranking posts by relevance, ranking, and recency...")
-    ranked_posts = rank_posts(matching_posts)
+    if cached:
+        relevant_keywords = cached["keywords"]
+        print(f"Using cached search results for this query ({len(cached['post_ids'])} posts).")
+        
+        # Refresh the cached posts' metrics and scores
+        ranked_posts = rank_posts(get_posts_by_ids(cached["post_ids"], relevant_keywords), preferences)
+        if not ranked_posts:
+            print("No matching posts found.")
+            return
+    else:
+        # Call keyword_finder_llm to find relevant keywords
+        print("Calling keyword_finder_llm to find relevant keywords...")
+        relevant_keywords = keyword_finder_llm(user_query, keywords, user_profile)
+        
+        # Ensure we have between 2 and 5 keywords
+        relevant_keywords = ensure_keyword_count(relevant_keywords, keywords)
+        
+        print(f"Found {len(relevant_keywords)} relevant keywords:")
+        for keyword in relevant_keywords:
+            print(f"- {keyword}")
+        
+        # Get posts by keywords
+        print("\nFinding posts with related keywords...")
+        matching_posts = get_posts_by_keywords(relevant_keywords)
+        
+        if not matching_posts:
+            if use_cache:
+                query_cache.save_cached_query(user_query, user_profile, watermark, relevant_keywords, [])
+            print("No matching posts found.")
+            return
+        
+        print(f"Found {len(matching_posts)} matching posts.")
+        
+        # Rank posts by relevance, ranking, and recency
+        print("Ranking posts by relevance, ranking, preferences, and recency...")
+        ranked_posts = rank_posts(matching_posts, preferences)
+        
+        if use_cache:
+            query_cache.save_cached_query(user_query, user_profile, watermark, relevant_keywords,
+                                          [post['id'] for post in ranked_posts])
     
     # Save ranked posts to database
     print(f"Saving top {len(ranked_posts)} posts to database...")
@@ -608,15 +581,17 @@ def main_with_query(user_query: str):
         print(format_post(post))
         print()
 
-if __name__ == "__main__":
+def run_cli(argv: Optional[List[str]] = None):
+    """Parse command-line arguments and run content discovery."""
     import argparse
     
     parser = argparse.ArgumentParser(description="Find and select posts based on user query.")
     parser.add_argument("--dynamic", action="store_true", help="Force regeneration of dynamic profile before searching")
     parser.add_argument("--query", help="Query for content discovery (non-interactive mode)")
     parser.add_argument("--query-file", help="File containing the query for content discovery")
+    parser.add_argument("--no-cache", action="store_true", help="Search again even if the same query was searched recently")
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     # Generate dynamic profile if requested
     if args.dynamic and os.path.exists("dynamic_user_profile.py"):
@@ -644,6 +619,9 @@ if __name__ == "__main__":
     
     # Run in non-interactive mode if query is provided
     if query:
-        main_with_query(query)
+        main_with_query(query, use_cache=not args.no_cache)
     else:
         main()
+
+if __name__ == "__main__":
+    run_cli()
@@ -2,6 +2,7 @@ import sqlite3
 import sys
 import json
 from datetime import datetime
+from jsonl_export import view_posts_jsonl
 
 def format_timestamp(timestamp_str):
     """Format a timestamp string to a more readable format."""
@@ -95,16 +96,21 @@ def view_posts(db_file='x_com_posts.db', limit=None):
         print(f"Error: {e}")
 
 if __name__ == "__main__":
-    # Get optional command line arguments
-    db_file = 'x_com_posts.db'
-    limit = None
+    import argparse
     
-    if len(sys.argv) > 1:
-        db_file = sys.argv[1]
-    if len(sys.argv) > 2:
-        try:
-            limit = int(sys.argv[2])
-        except ValueError:
-            print(f"Invalid limit value: {sys.argv[2]}. Using default.")
+    # The database file and limit are positional, as before
+    parser = argparse.ArgumentParser(description="View posts from the database.")
+    parser.add_argument("db", nargs="?", default="x_com_posts.db", help="Database file path")
+    parser.add_argument("limit", nargs="?", type=int, help="Limit the number of posts to display")
+    parser.add_argument("--format", choices=["text", "jsonl"], default="text", help="Output format (jsonl prints one JSON object per row)")
+    parser.add_argument("--offset", type=int, default=0, help="Skip this many rows (jsonl only)")
+    parser.add_argument("--cursor", help="Continue after the next_cursor printed by the previous page (jsonl only)")
+    parser.add_argument("--columns", help="Comma-separated columns to include (jsonl only)")
     
-    view_posts(db_file, limit)
+    args = parser.parse_args()
+    
+    if args.format == "jsonl":
+        if not view_posts_jsonl(args.db, args.limit, args.offset, args.cursor, args.columns):
+            sys.exit(1)
+    else:
+        view_posts(args.db, args.limit)
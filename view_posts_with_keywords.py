@@ -2,6 +2,7 @@ import sqlite3
 import sys
 import json
 from datetime import datetime
+from jsonl_export import view_posts_jsonl
 
 def format_timestamp(timestamp_str):
     """Format a timestamp string to a more readable format."""
@@ -181,10 +182,17 @@ if __name__ == "__main__":
     parser.add_argument("--limit", type=int, help="Limit the number of posts/keywords to display")
     parser.add_argument("--keywords-only", action="store_true", help="Show only keywords statistics")
     parser.add_argument("--no-keywords", action="store_true", help="Don't show keywords with posts")
+    parser.add_argument("--format", choices=["text", "jsonl"], default="text", help="Output format (jsonl prints one JSON object per row)")
+    parser.add_argument("--offset", type=int, default=0, help="Skip this many rows (jsonl only)")
+    parser.add_argument("--cursor", help="Continue after the next_cursor printed by the previous page (jsonl only)")
+    parser.add_argument("--columns", help="Comma-separated columns to include (jsonl only)")
     
     args = parser.parse_args()
     
     if args.keywords_only:
         view_keywords(args.db, args.limit)
+    elif args.format == "jsonl":
+        if not view_posts_jsonl(args.db, args.limit, args.offset, args.cursor, args.columns):
+            sys.exit(1)
     else:
         view_posts(args.db, args.limit, not args.no_keywords)
@@ -2,6 +2,7 @@ import sqlite3
 import sys
 import json
 from datetime import datetime
+from jsonl_export import get_table_columns, select_columns, stream_rows_jsonl
 
 def format_timestamp(timestamp_str):
     """Format a timestamp string to a more readable format."""
@@ -30,7 +31,7 @@ def view_selected_posts(db_file='posts_selected.db', limit=None, show_queries=Fa
         cursor = conn.cursor()
         
         # Get table info
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view');")
         tables = cursor.fetchall()
         print(f"Tables in database: {', '.join([t[0] for t in tables])}\n")
         
@@ -158,17 +159,40 @@ def view_selected_posts(db_file='posts_selected.db', limit=None, show_queries=Fa
     except Exception as e:
         print(f"Error: {e}")
 
-if __name__ == "__main__":
+def view_selected_posts_jsonl(db_file='posts_selected.db', limit=None, offset=0, cursor_token=None, columns=None, validation_filter=""):
+    """Stream selected posts as JSON lines (one row per line) for other programs to read."""
+    try:
+        conn = sqlite3.connect(db_file)
+        conn.row_factory = sqlite3.Row
+        
+        selected = select_columns(columns, get_table_columns(conn, 'selected_posts'))
+        stream_rows_jsonl(conn, 'selected_posts', selected, 'selected_at', where=f"1=1{validation_filter}", limit=limit, offset=offset, cursor_token=cursor_token)
+        
+        conn.close()
+        return True
+        
+    except sqlite3.Error as e:
+        print(f"SQLite error: {e}", file=sys.stderr)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+    return False
+
+def run_cli(argv=None):
+    """Parse command-line arguments and display selected posts."""
     import argparse
     
     parser = argparse.ArgumentParser(description="View selected posts from the database.")
     parser.add_argument("--db", default="posts_selected.db", help="Database file path")
     parser.add_argument("--limit", type=int, help="Limit the number of posts to display")
     parser.add_argument("--queries", action="store_true", help="Show queries and allow filtering by query")
-    parser.add_argument("--validated", choices=["all", "like", "pass", "none"], default="all", 
-                        help="Filter by validation status (all, like, pass, or none for unvalidated)")
+    parser.add_argument("--validated", choices=["all", "like", "pass", "none", "failed"], default="all", 
+                        help="Filter by validation status (all, like, pass, none for unvalidated, or failed LLM calls)")
+    parser.add_argument("--format", choices=["text", "jsonl"], default="text", help="Output format (jsonl prints one JSON object per row)")
+    parser.add_argument("--offset", type=int, default=0, help="Skip this many rows (jsonl only)")
+    parser.add_argument("--cursor", help="Continue after the next_cursor printed by the previous page (jsonl only)")
+    parser.add_argument("--columns", help="Comma-separated columns to include (jsonl only)")
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     # Add validation filter if specified
     validation_filter = ""
@@ -176,7 +200,16 @@ if __name__ == "__main__":
         validation_filter = " AND llm_clone_validated = 'like'"
     elif args.validated == "pass":
         validation_filter = " AND llm_clone_validated = 'pass'"
+    elif args.validated == "failed":
+        validation_filter = " AND llm_clone_validated = 'failed'"
     elif args.validated == "none":
         validation_filter = " AND (llm_clone_validated IS NULL OR llm_clone_validated = '')"
     
-    view_selected_posts(args.db, args.limit, args.queries, validation_filter)
+    if args.format == "jsonl":
+        if not view_selected_posts_jsonl(args.db, args.limit, args.offset, args.cursor, args.columns, validation_filter):
+            sys.exit(1)
+    else:
+        view_selected_posts(args.db, args.limit, args.queries, validation_filter)
+
+if __name__ == "__main__":
+    run_cli()
@@ -241,7 +241,9 @@ ${profile.dislikes.map(dislike => `- ${dislike}`).join('\n')}
                 throw new Error('Failed to generate keywords');
             }
             
-            return await response.json();
+            // Keyword generation runs as a background job on the server
+            const result = await response.json();
+            return await this.waitForJob(result.jobId);
         } catch (error) {
             console.error('Error generating keywords:', error);
             
@@ -286,7 +288,9 @@ ${profile.dislikes.map(dislike => `- ${dislike}`).join('\n')}
                 throw new Error('Failed to rank posts');
             }
             
-            return await response.json();
+            // Ranking runs as a background job on the server
+            const result = await response.json();
+            return await this.waitForJob(result.jobId);
         } catch (error) {
             console.error('Error ranking posts:', error);
             
@@ -312,6 +316,42 @@ ${profile.dislikes.map(dislike => `- ${dislike}`).join('\n')}
         }
     },
     
+    /**
+     * Wait for a background job to finish, following its progress events
+     * 
+     * @param {string} jobId - The job ID returned when the job was started
+     * @param {Function} progressCallback - Optional callback called with each progress event
+     * @returns {Promise} - A promise that resolves with the final job event
+     */
+    waitForJob: function(jobId, progressCallback) {
+        return new Promise((resolve, reject) => {
+            const events = new EventSource(`/api/jobs/${jobId}/events`);
+            
+            events.addEventListener('progress', (message) => {
+                const event = JSON.parse(message.data);
+                console.log(`${event.stage}: ${event.done}/${event.total} done, ${event.failed} failed`);
+                if (progressCallback) {
+                    progressCallback(event);
+                }
+            });
+            
+            events.addEventListener('job_finished', (message) => {
+                events.close();
+                const event = JSON.parse(message.data);
+                if (event.status === 'ok') {
+                    resolve({ success: true, ...event });
+                } else {
+                    reject(new Error(event.error || 'Job failed'));
+                }
+            });
+            
+            events.addEventListener('job_error', (message) => {
+                events.close();
+                reject(new Error(JSON.parse(message.data).error));
+            });
+        });
+    },
+    
     /**
      * Prepare the feed
      * 
@@ -358,14 +398,19 @@ ${profile.dislikes.map(dislike => `- ${dislike}`).join('\n')}
     },
     
     /**
-     * Fetch posts for the feed
+     * Fetch a page of posts for the feed
      * 
-     * @returns {Promise} - A promise that resolves with the posts
+     * @param {string} cursor - The nextCursor of the previous page, or null for the first page
+     * @returns {Promise} - A promise that resolves with the posts and the nextCursor of the following page
      */
-    fetchPosts: async function() {
+    fetchPosts: async function(cursor = null) {
         try {
             // Fetch posts from the server
-            const response = await fetch('/api/fetch-posts');
+            const params = new URLSearchParams({ limit: 20 });
+            if (cursor) {
+                params.set('cursor', cursor);
+            }
+            const response = await fetch(`/api/fetch-posts?${params}`);
             
             if (!response.ok) {
                 throw new Error('Failed to fetch posts');
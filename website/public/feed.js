@@ -16,6 +16,9 @@ const feedState = {
     currentSort: 'rank',
     currentPlatformFilter: 'all',
     recentSearches: new Set(),
+    nextCursor: null,
+    loadingMore: false,
+    showingSearchResults: false,
     defaultSuggestions: ['politics', 'health', 'technology', 'sports'],
     progressState: {
         postsAnalyzed: 0,
@@ -360,6 +363,13 @@ function setupEventListeners() {
     // Submit feedback button
     document.getElementById('submit-feedback').addEventListener('click', submitFeedback);
     
+    // Load the next page of the feed when scrolling near the bottom
+    window.addEventListener('scroll', () => {
+        if (window.innerHeight + window.scrollY >= document.body.offsetHeight - 500) {
+            loadMorePosts();
+        }
+    });
+    
     // Enable keyboard navigation
     initKeyboardNavigation();
 }
@@ -376,6 +386,8 @@ async function loadPosts() {
         if (result && result.posts) {
             feedState.posts = result.posts;
             feedState.filteredPosts = [...feedState.posts];
+            feedState.nextCursor = result.nextCursor || null;
+            feedState.showingSearchResults = false;
             
             // Sort posts
             sortPosts();
@@ -391,6 +403,33 @@ async function loadPosts() {
     }
 }
 
+// Load the next page of posts when the user scrolls near the end of the feed
+async function loadMorePosts() {
+    if (!feedState.nextCursor || feedState.loadingMore || feedState.showingSearchResults) {
+        return;
+    }
+    
+    feedState.loadingMore = true;
+    try {
+        const result = await BackendConnector.fetchPosts(feedState.nextCursor);
+        
+        if (result && result.posts) {
+            feedState.posts.push(...result.posts);
+            
+            const { currentPlatformFilter } = feedState;
+            feedState.filteredPosts.push(...result.posts.filter(post => currentPlatformFilter === 'all' || post.platform === currentPlatformFilter));
+            feedState.nextCursor = result.nextCursor || null;
+            
+            sortPosts();
+            renderPosts();
+        }
+    } catch (error) {
+        console.error('Error loading more posts:', error);
+    } finally {
+        feedState.loadingMore = false;
+    }
+}
+
 // Sort posts based on the current sort option
 function sortPosts() {
     const { currentSort } = feedState;
@@ -486,6 +525,7 @@ async function applyFilter(filterValue) {
         if (result && result.success && result.posts && result.posts.length > 0) {
             // Update the feed state with the search results
             feedState.filteredPosts = result.posts;
+            feedState.showingSearchResults = true;
             
             // If we have posts, start sentiment analysis inference animation
             if (result.posts.length > 0) {
@@ -1,5 +1,6 @@
 const express = require('express');
-const { exec } = require('child_process');
+const { exec, spawn } = require('child_process');
+const http = require('http');
 const path = require('path');
 const fs = require('fs');
 const bodyParser = require('body-parser');
@@ -8,6 +9,99 @@ const sqlite3 = require('sqlite3').verbose();
 // Create Express app
 const app = express();
 const PORT = process.env.PORT || 3001;
+const PYTHON_SERVICE_PORT = process.env.PYTHON_SERVICE_PORT || 5001;
+
+// Start the long-running Python service that serves search, ranking, keyword and profile calls.
+// It keeps the Python components imported between requests, so requests don't pay interpreter startup.
+function startPythonService() {
+    const servicePath = path.join(__dirname, '..', 'python_service.py');
+    const env = { ...process.env, PYTHONUNBUFFERED: '1' };
+    
+    global.pythonService = spawn('python', [servicePath, `--port=${PYTHON_SERVICE_PORT}`], {
+        cwd: path.join(__dirname, '..'),
+        env,
+        stdio: 'inherit'
+    });
+    
+    global.pythonService.on('exit', (code) => {
+        console.error(`Python service exited with code ${code}, restarting in 2 seconds...`);
+        setTimeout(startPythonService, 2000);
+    });
+}
+
+// Call a method of the Python service and resolve with its JSON result.
+// Calls made while the service is still starting are retried for a few seconds.
+function callPythonService(method, params = {}, retries = 10) {
+    return new Promise((resolve, reject) => {
+        const body = JSON.stringify({ method, params });
+        
+        const request = http.request({
+            host: '127.0.0.1',
+            port: PYTHON_SERVICE_PORT,
+            path: '/rpc',
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Content-Length': Buffer.byteLength(body)
+            }
+        }, (response) => {
+            let data = '';
+            response.on('data', chunk => { data += chunk; });
+            response.on('end', () => {
+                try {
+                    const reply = JSON.parse(data);
+                    if (reply.error) {
+                        return reject(new Error(reply.error));
+                    }
+                    resolve(reply.result);
+                } catch (e) {
+                    reject(new Error(`Invalid response from Python service: ${e.message}`));
+                }
+            });
+        });
+        
+        request.on('error', (error) => {
+            if (error.code === 'ECONNREFUSED' && retries > 0) {
+                return setTimeout(() => callPythonService(method, params, retries - 1).then(resolve, reject), 500);
+            }
+            reject(error);
+        });
+        request.write(body);
+        request.end();
+    });
+}
+
+// Convert a post row returned by the Python service into the shape the feed expects
+function toFeedPost(row, rank) {
+    // Determine platform from URL
+    let platform = 'unknown';
+    if (row.post_url && (row.post_url.includes('twitter.com') || row.post_url.includes('x.com'))) {
+        platform = 'twitter';
+    } else if (row.post_url && row.post_url.includes('instagram.com')) {
+        platform = 'instagram';
+    } else if (row.post_url && row.post_url.includes('facebook.com')) {
+        platform = 'facebook';
+    }
+    
+    return {
+        id: row.id,
+        username: row.username,
+        post_url: row.post_url,
+        posted_at: row.post_time,
+        scraped_at: row.scraped_at,
+        keywords: row.keywords || [],
+        post_text: row.post_text,
+        views: row.views,
+        comments: row.comments,
+        retweets: row.retweets,
+        likes: row.likes,
+        saves: row.saves,
+        image_url: row.image_url,
+        platform: platform,
+        userInteraction: 0, // Default to neutral
+        rank: rank || 50
+    };
+}
 
 // Middleware
 app.use(express.static(path.join(__dirname, 'public')));
@@ -150,22 +244,13 @@ app.post('/api/start-scraping', (req, res) => {
     try {
         const { accounts, postCount } = req.body;
         
-        // Execute the social_media_scraper.py script
-        const command = `cd "${path.join(__dirname, '..')}" && python ${path.join(__dirname, '..', 'core', 'social_media_scraper.py')} --count=${postCount || 10}`;
-        
-        exec(command, (error, stdout, stderr) => {
-            if (error) {
-                console.error(`Error executing script: ${error.message}`);
-                return res.status(500).json({ error: 'Failed to execute scraping script' });
-            }
-            
-            if (stderr) {
-                console.error(`Script stderr: ${stderr}`);
-            }
-            
-            console.log(`Script output: ${stdout}`);
-            res.json({ success: true, message: 'Scraping completed', output: stdout });
-        });
+        // Scraping runs as a background job; progress is streamed from /api/jobs/:id/events
+        callPythonService('start_job', { kind: 'scrape', params: { count: postCount || 10 } })
+            .then(result => res.status(202).json({ success: true, message: 'Scraping started', jobId: result.job_id }))
+            .catch(error => {
+                console.error(`Error scraping posts: ${error.message}`);
+                res.status(500).json({ error: 'Failed to execute scraping script' });
+            });
     } catch (error) {
         console.error('Error starting scraping:', error);
         res.status(500).json({ error: 'Failed to start scraping' });
@@ -175,22 +260,13 @@ app.post('/api/start-scraping', (req, res) => {
 // API endpoint to generate keywords
 app.post('/api/generate-keywords', (req, res) => {
     try {
-        // Execute the generate_keywords.py script
-        const command = `cd "${path.join(__dirname, '..')}" && python ${path.join(__dirname, '..', 'core', 'generate_keywords.py')}`;
-        
-        exec(command, (error, stdout, stderr) => {
-            if (error) {
-                console.error(`Error executing script: ${error.message}`);
-                return res.status(500).json({ error: 'Failed to execute keyword generation script' });
-            }
-            
-            if (stderr) {
-                console.error(`Script stderr: ${stderr}`);
-            }
-            
-            console.log(`Script output: ${stdout}`);
-            res.json({ success: true, message: 'Keywords generated', output: stdout });
-        });
+        // Keyword generation runs as a background job; progress is streamed from /api/jobs/:id/events
+        callPythonService('start_job', { kind: 'keywords' })
+            .then(result => res.status(202).json({ success: true, message: 'Keyword generation started', jobId: result.job_id }))
+            .catch(error => {
+                console.error(`Error generating keywords: ${error.message}`);
+                res.status(500).json({ error: 'Failed to execute keyword generation script' });
+            });
     } catch (error) {
         console.error('Error generating keywords:', error);
         res.status(500).json({ error: 'Failed to generate keywords' });
@@ -224,53 +300,110 @@ app.post('/api/save-settings', (req, res) => {
 // API endpoint to rank posts
 app.post('/api/rank-posts', (req, res) => {
     try {
-        // Execute the ranking_llm.py script
-        const command = `cd "${path.join(__dirname, '..')}" && python ${path.join(__dirname, '..', 'core', 'ranking_llm.py')}`;
-        
-        // Set environment variables to pass the user profile
-        const env = { ...process.env };
-        if (global.userProfile) {
-            env.USER_PROFILE_CONTENT = global.userProfile;
-        }
-        
-        exec(command, { env }, (error, stdout, stderr) => {
-            if (error) {
-                console.error(`Error executing script: ${error.message}`);
-                return res.status(500).json({ error: 'Failed to execute ranking script' });
-            }
-            
-            if (stderr) {
-                console.error(`Script stderr: ${stderr}`);
-            }
-            
-            console.log(`Script output: ${stdout}`);
-            res.json({ success: true, message: 'Posts ranked', output: stdout });
-        });
+        // Ranking runs as a background job with the user profile; progress is streamed from /api/jobs/:id/events
+        callPythonService('start_job', { kind: 'rank', params: { profile: global.userProfile } })
+            .then(result => res.status(202).json({ success: true, message: 'Ranking started', jobId: result.job_id }))
+            .catch(error => {
+                console.error(`Error ranking posts: ${error.message}`);
+                res.status(500).json({ error: 'Failed to execute ranking script' });
+            });
     } catch (error) {
         console.error('Error ranking posts:', error);
         res.status(500).json({ error: 'Failed to rank posts' });
     }
 });
 
+// API endpoint to list recent background jobs
+app.get('/api/jobs', (req, res) => {
+    callPythonService('list_jobs', { limit: req.query.limit })
+        .then(result => res.json({ success: true, jobs: result.jobs }))
+        .catch(error => {
+            console.error(`Error listing jobs: ${error.message}`);
+            res.status(500).json({ error: 'Failed to list jobs' });
+        });
+});
+
+// API endpoint to look up a background job, including finished ones
+app.get('/api/jobs/:id', (req, res) => {
+    callPythonService('job_status', { job_id: req.params.id })
+        .then(job => res.json({ success: true, job }))
+        .catch(error => res.status(404).json({ error: error.message }));
+});
+
+// API endpoint streaming the progress events of a background job as server-sent events
+app.get('/api/jobs/:id/events', (req, res) => {
+    const jobId = req.params.id;
+    
+    // Resume after the last event the client received if it reconnects
+    let lastSeq = parseInt(req.get('Last-Event-ID') || req.query.after || '0', 10) || 0;
+    let closed = false;
+    
+    res.set({
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'Connection': 'keep-alive'
+    });
+    res.flushHeaders();
+    
+    req.on('close', () => { closed = true; });
+    
+    const poll = () => {
+        if (closed) {
+            return;
+        }
+        
+        callPythonService('job_events', { job_id: jobId, after: lastSeq })
+            .then(result => {
+                for (const event of result.events) {
+                    lastSeq = event.seq;
+                    res.write(`id: ${event.seq}\nevent: ${event.type}\ndata: ${JSON.stringify(event)}\n\n`);
+                    
+                    if (event.type === 'job_finished') {
+                        return res.end();
+                    }
+                }
+                setTimeout(poll, 500);
+            })
+            .catch(error => {
+                res.write(`event: job_error\ndata: ${JSON.stringify({ error: error.message })}\n\n`);
+                res.end();
+            });
+    };
+    
+    poll();
+});
+
+// Wait for a background job to finish and resolve with its final status
+function waitForPythonJob(jobId) {
+    return new Promise((resolve, reject) => {
+        const check = () => {
+            callPythonService('job_status', { job_id: jobId })
+                .then(job => {
+                    if (job.status === 'running') {
+                        return setTimeout(check, 1000);
+                    }
+                    resolve(job);
+                })
+                .catch(reject);
+        };
+        check();
+    });
+}
+
+// Start a background job and wait for it to finish
+function runPythonJob(kind, params = {}) {
+    return callPythonService('start_job', { kind, params }).then(result => waitForPythonJob(result.job_id));
+}
+
 // API endpoint to prepare feed
 app.post('/api/prepare-feed', (req, res) => {
     try {
-        // Execute the export_keywords.py script
-        const command = `python ${path.join(__dirname, '..', 'core', 'export_keywords.py')}`;
-        
-        exec(command, (error, stdout, stderr) => {
-            if (error) {
-                console.error(`Error executing script: ${error.message}`);
-                return res.status(500).json({ error: 'Failed to execute export script' });
-            }
-            
-            if (stderr) {
-                console.error(`Script stderr: ${stderr}`);
-            }
-            
-            console.log(`Script output: ${stdout}`);
-            res.json({ success: true, message: 'Feed prepared', output: stdout });
-        });
+        callPythonService('export')
+            .then(result => res.json({ success: true, message: result.message }))
+            .catch(error => {
+                console.error(`Error preparing feed: ${error.message}`);
+                res.status(500).json({ error: 'Failed to execute export script' });
+            });
     } catch (error) {
         console.error('Error preparing feed:', error);
         res.status(500).json({ error: 'Failed to prepare feed' });
@@ -280,32 +413,18 @@ app.post('/api/prepare-feed', (req, res) => {
 // API endpoint to fetch posts
 app.get('/api/fetch-posts', (req, res) => {
     try {
-        // Execute the view_posts_with_keywords.py script
-        const command = `python ${path.join(__dirname, '..', 'utils', 'view_posts_with_keywords.py')} --db=${path.join(__dirname, '..', 'db', 'x_com_posts.db')}`;
-        
-        // Set environment variables to pass the user profile
-        const env = { ...process.env };
-        if (global.userProfile) {
-            env.USER_PROFILE_CONTENT = global.userProfile;
-        }
-        
-        exec(command, { env }, (error, stdout, stderr) => {
-            if (error) {
-                console.error(`Error executing script: ${error.message}`);
-                return res.status(500).json({ error: 'Failed to fetch posts' });
-            }
-            
-            if (stderr) {
-                console.error(`Script stderr: ${stderr}`);
-            }
-            
-            console.log(`Script output: ${stdout}`);
-            
-            // Parse the output to extract posts
-            const posts = parsePostsFromOutput(stdout);
-            
-            res.json({ success: true, posts });
-        });
+        // One page of the feed; pass nextCursor back as ?cursor= to get the next page
+        const { limit, cursor, minRanking, keyword, username } = req.query;
+        
+        callPythonService('fetch_posts', { limit, cursor, min_ranking: minRanking, keyword, username })
+            .then(result => {
+                const posts = result.posts.map(row => toFeedPost(row, row.user_ranking));
+                res.json({ success: true, posts, nextCursor: result.next_cursor });
+            })
+            .catch(error => {
+                console.error(`Error fetching posts: ${error.message}`);
+                res.status(500).json({ error: 'Failed to fetch posts' });
+            });
     } catch (error) {
         console.error('Error fetching posts:', error);
         res.status(500).json({ error: 'Failed to fetch posts' });
@@ -353,21 +472,19 @@ app.post('/api/submit-feedback', (req, res) => {
                 
                 feedbackDb.close();
                 
-                // After saving feedback, update the dynamic user profile
-                console.log('Updating dynamic user profile based on new feedback...');
-                const dynamicProfileCommand = `python ${path.join(__dirname, '..', 'core', 'dynamic_user_profile.py')} --force`;
-                
-                exec(dynamicProfileCommand, (error, stdout, stderr) => {
-                    if (error) {
+                // After saving feedback, queue a profile update; bursts of feedback are coalesced into one
+                // update, and the profile is only edited once preferences have drifted enough
+                console.log('Queueing dynamic user profile update based on new feedback...');
+                callPythonService('profile', { incremental: true, queue: true })
+                    .then(result => console.log(result.message))
+                    .catch(error => {
                         console.error(`Error updating dynamic user profile: ${error.message}`);
                         // Still return success for the feedback submission
-                    } else {
-                        console.log(`Dynamic user profile updated: ${stdout}`);
-                    }
-                    
-                    // Return success response for the feedback submission
-                    res.json({ success: true, message: 'Feedback submitted and saved to database' });
-                });
+                    })
+                    .then(() => {
+                        // Return success response for the feedback submission
+                        res.json({ success: true, message: 'Feedback submitted and saved to database' });
+                    });
             }
         );
     } catch (error) {
@@ -416,7 +533,7 @@ app.post('/api/run-script', (req, res) => {
 // API endpoint to search posts using the user_posts_output.py script
 app.post('/api/search-posts', (req, res) => {
     try {
-        const { query } = req.body;
+        const { query, validate, sentimentMode } = req.body;
         
         if (!query) {
             return res.status(400).json({ error: 'Search query is required' });
@@ -424,143 +541,28 @@ app.post('/api/search-posts', (req, res) => {
         
         console.log(`Searching posts with query: ${query}`);
         
-        // Create a temporary file with the query to avoid command line escaping issues
-        const tempQueryFile = path.join(__dirname, '..', 'config', 'temp_query.txt');
-        fs.writeFileSync(tempQueryFile, query);
-        
-        // Build the command to run user_posts_output.py with the query file
-        // Use the absolute path to the script and specify the current working directory
-        const scriptPath = path.join(__dirname, '..', 'core', 'user_posts_output.py');
-        const workingDir = path.join(__dirname, '..');
-        const command = `cd "${workingDir}" && python "${scriptPath}" --query-file="${tempQueryFile}" --db=${path.join(__dirname, '..', 'db', 'x_com_posts.db')}`;
-        
-        // Set environment variables to pass the user profile
-        const env = { ...process.env };
-        if (global.userProfile) {
-            env.USER_PROFILE_CONTENT = global.userProfile;
-        }
-        
-        exec(command, { env }, (error, stdout, stderr) => {
-            if (error) {
-                console.error(`Error executing search script: ${error.message}`);
-                return res.status(500).json({ error: 'Failed to execute search script' });
-            }
-            
-            if (stderr) {
-                console.error(`Search script stderr: ${stderr}`);
-            }
-            
-            console.log(`Search script output: ${stdout}`);
-            
-            // After running the script, fetch the posts from the posts_selected.db
-            const dbPath = path.join(__dirname, '..', 'posts_selected.db');
-            
-            // Check if the database file exists
-            if (!fs.existsSync(dbPath)) {
-                return res.status(404).json({ error: 'Selected posts database not found' });
-            }
-            
-            // Connect to the database
-            const db = new sqlite3.Database(dbPath);
-            
-            // Get the selected posts
-            db.all(
-                `SELECT * FROM selected_posts WHERE query = ? ORDER BY relevance_score DESC`,
-                [query],
-                (err, rows) => {
-                    if (err) {
-                        console.error(`Error fetching selected posts: ${err.message}`);
-                        return res.status(500).json({ error: 'Failed to fetch selected posts' });
-                    }
-                    
-                    // Close the database connection
-                    db.close();
-                    
-                    // Process the posts
-                    const posts = rows.map(row => {
-                        // Parse keywords if they exist
-                        let keywords = [];
-                        if (row.keywords) {
-                            try {
-                                keywords = JSON.parse(row.keywords);
-                            } catch (e) {
-                                console.error(`Error parsing keywords: ${e}`);
-                            }
-                        }
-                        
-                        // Determine platform from URL
-                        let platform = 'unknown';
-                        if (row.post_url && (row.post_url.includes('twitter.com') || row.post_url.includes('x.com'))) {
-                            platform = 'twitter';
-                        } else if (row.post_url && row.post_url.includes('instagram.com')) {
-                            platform = 'instagram';
-                        } else if (row.post_url && row.post_url.includes('facebook.com')) {
-                            platform = 'facebook';
-                        }
-                        
-                        return {
-                            id: row.original_post_id,
-                            username: row.username,
-                            post_url: row.post_url,
-                            posted_at: row.post_time,
-                            scraped_at: row.scraped_at,
-                            keywords: keywords,
-                            post_text: row.post_text,
-                            views: row.views,
-                            comments: row.comments,
-                            retweets: row.retweets,
-                            likes: row.likes,
-                            image_url: row.image_url,
-                            platform: platform,
-                            userInteraction: 0, // Default to neutral
-                            rank: row.relevance_score || 50, // Use relevance score as rank
-                            matching_keyword_count: row.matching_keyword_count,
-                            relevance_score: row.relevance_score
-                        };
-                    });
-                    
-                    // Run sentiment analysis on the posts
-                    console.log('Running sentiment analysis on the posts...');
-                    const sentimentCommand = `python ${path.join(__dirname, '..', 'core', 'sentiment_analysis.py')} "${query}"`;
-                    
-                    exec(sentimentCommand, (sentimentError, sentimentStdout, sentimentStderr) => {
-                        let sentimentAnalysis = {
-                            summary: "Sentiment analysis not available.",
-                            sentiment: "neutral",
-                            sentiment_score: 50,
-                            key_points: []
-                        };
-                        
-                        if (sentimentError) {
-                            console.error(`Error executing sentiment analysis: ${sentimentError.message}`);
-                        } else {
-                            if (sentimentStderr) {
-                                console.error(`Sentiment analysis stderr: ${sentimentStderr}`);
-                            }
-                            
-                            console.log(`Sentiment analysis output: ${sentimentStdout}`);
-                            
-                            // Try to extract the JSON result from the output
-                            try {
-                                const jsonMatch = sentimentStdout.match(/\{[\s\S]*\}/);
-                                if (jsonMatch) {
-                                    sentimentAnalysis = JSON.parse(jsonMatch[0]);
-                                }
-                            } catch (e) {
-                                console.error(`Error parsing sentiment analysis output: ${e}`);
-                            }
-                        }
-                        
-                        // Return both the posts and the sentiment analysis
-                        res.json({ 
-                            success: true, 
-                            posts: posts,
-                            sentimentAnalysis: sentimentAnalysis
-                        });
-                    });
-                }
-            );
-        });
+        // The service selects the posts, saves them to posts_selected.db, optionally validates them and analyzes their sentiment
+        // The selection is scored with the local lexicon unless sentimentMode 'llm' asks for an LLM summary
+        callPythonService('search', { query, profile: global.userProfile, validate: Boolean(validate), sentiment_mode: sentimentMode })
+            .then(result => {
+                const posts = result.posts.map(row => ({
+                    ...toFeedPost({ ...row, id: row.original_post_id }, row.relevance_score), // Use relevance score as rank
+                    matching_keyword_count: row.matching_keyword_count,
+                    relevance_score: row.relevance_score,
+                    llm_clone_validated: row.llm_clone_validated
+                }));
+                
+                // Return both the posts and the sentiment analysis
+                res.json({ 
+                    success: true, 
+                    posts: posts,
+                    sentimentAnalysis: result.sentiment_analysis
+                });
+            })
+            .catch(error => {
+                console.error(`Error searching posts: ${error.message}`);
+                res.status(500).json({ error: 'Failed to execute search script' });
+            });
     } catch (error) {
         console.error('Error searching posts:', error);
         res.status(500).json({ error: 'Failed to search posts' });
@@ -586,230 +588,6 @@ app.post('/api/write-file', (req, res) => {
     }
 });
 
-// Helper function to parse posts from the output of view_posts_with_keywords.py
-function parsePostsFromOutput(output) {
-    const posts = [];
-    
-    // First try to match posts with the standard format including keywords
-    const postRegexWithKeywords = /Post #(\d+):\s+Username: (.+)\s+URL: (.+)\s+Posted at: (.+)\s+Scraped at: (.+)\s+Keywords: (.+)\s+Metrics:\s+Views: (.+)\s+Comments: (.+)\s+Retweets: (.+)\s+Likes: (.+)\s+Saves: (.+)\s+(?:Image URL: (.+)\s+)?Text: (.+)/g;
-    
-    // Also try to match posts that might not have keywords
-    const postRegexNoKeywords = /Post #(\d+):\s+Username: (.+)\s+URL: (.+)\s+Posted at: (.+)\s+Scraped at: (.+)\s+Metrics:\s+Views: (.+)\s+Comments: (.+)\s+Retweets: (.+)\s+Likes: (.+)\s+Saves: (.+)\s+(?:Image URL: (.+)\s+)?Text: (.+)/g;
-    
-    // Try to match posts with the standard format including keywords
-    let match;
-    while ((match = postRegexWithKeywords.exec(output)) !== null) {
-        const [
-            ,
-            id,
-            username,
-            post_url,
-            posted_at,
-            scraped_at,
-            keywords_str,
-            views,
-            comments,
-            retweets,
-            likes,
-            saves,
-            image_url,
-            post_text
-        ] = match;
-        
-        // Parse keywords
-        let keywords = [];
-        if (keywords_str && keywords_str !== 'None') {
-            try {
-                // Try to parse JSON if it's in JSON format
-                if (keywords_str.startsWith('```json') && keywords_str.endsWith('```')) {
-                    const jsonStr = keywords_str.replace(/```json\n|\n```/g, '');
-                    keywords = JSON.parse(jsonStr);
-                } else {
-                    // Otherwise split by commas
-                    keywords = keywords_str.split(',').map(k => k.trim());
-                }
-            } catch (e) {
-                console.error('Error parsing keywords:', e);
-            }
-        }
-        
-        // Determine platform from URL
-        let platform = 'unknown';
-        if (post_url.includes('twitter.com') || post_url.includes('x.com')) {
-            platform = 'twitter';
-        } else if (post_url.includes('instagram.com')) {
-            platform = 'instagram';
-        } else if (post_url.includes('facebook.com')) {
-            platform = 'facebook';
-        }
-        
-        posts.push({
-            id: parseInt(id),
-            username,
-            post_url,
-            posted_at: posted_at !== 'None' ? posted_at : null,
-            scraped_at,
-            keywords,
-            post_text,
-            views: views !== 'None' ? parseInt(views.replace(/,/g, '')) : null,
-            comments: comments !== 'None' ? parseInt(comments.replace(/,/g, '')) : null,
-            retweets: retweets !== 'None' ? parseInt(retweets.replace(/,/g, '')) : null,
-            likes: likes !== 'None' ? parseInt(likes.replace(/,/g, '')) : null,
-            saves: saves !== 'None' ? parseInt(saves.replace(/,/g, '')) : null,
-            image_url: image_url !== 'None' ? image_url : null,
-            platform,
-            userInteraction: 0, // Default to neutral
-            rank: 50 // Default rank
-        });
-    }
-    
-    // Try to match posts without keywords
-    while ((match = postRegexNoKeywords.exec(output)) !== null) {
-        const [
-            ,
-            id,
-            username,
-            post_url,
-            posted_at,
-            scraped_at,
-            views,
-            comments,
-            retweets,
-            likes,
-            saves,
-            image_url,
-            post_text
-        ] = match;
-        
-        // Skip if we already added this post (from the first regex)
-        if (posts.some(p => p.id === parseInt(id))) {
-            continue;
-        }
-        
-        // Determine platform from URL
-        let platform = 'unknown';
-        if (post_url.includes('twitter.com') || post_url.includes('x.com')) {
-            platform = 'twitter';
-        } else if (post_url.includes('instagram.com')) {
-            platform = 'instagram';
-        } else if (post_url.includes('facebook.com')) {
-            platform = 'facebook';
-        }
-        
-        posts.push({
-            id: parseInt(id),
-            username,
-            post_url,
-            posted_at: posted_at !== 'None' ? posted_at : null,
-            scraped_at,
-            keywords: [], // Empty keywords array for posts without keywords
-            post_text,
-            views: views !== 'None' ? parseInt(views.replace(/,/g, '')) : null,
-            comments: comments !== 'None' ? parseInt(comments.replace(/,/g, '')) : null,
-            retweets: retweets !== 'None' ? parseInt(retweets.replace(/,/g, '')) : null,
-            likes: likes !== 'None' ? parseInt(likes.replace(/,/g, '')) : null,
-            saves: saves !== 'None' ? parseInt(saves.replace(/,/g, '')) : null,
-            image_url: image_url !== 'None' ? image_url : null,
-            platform,
-            userInteraction: 0, // Default to neutral
-            rank: 50 // Default rank
-        });
-    }
-    
-    // If we didn't find any posts with the regex patterns, try a more general approach
-    if (posts.length === 0) {
-        // Split the output by "Post #" to get individual post blocks
-        const postBlocks = output.split(/Post #/).filter(block => block.trim());
-        
-        for (const block of postBlocks) {
-            try {
-                // Extract post ID
-                const idMatch = block.match(/^(\d+):/);
-                if (!idMatch) continue;
-                const id = parseInt(idMatch[1]);
-                
-                // Extract other fields
-                const usernameMatch = block.match(/Username: ([^\n]+)/);
-                const urlMatch = block.match(/URL: ([^\n]+)/);
-                const postedAtMatch = block.match(/Posted at: ([^\n]+)/);
-                const scrapedAtMatch = block.match(/Scraped at: ([^\n]+)/);
-                const viewsMatch = block.match(/Views: ([^\n]+)/);
-                const commentsMatch = block.match(/Comments: ([^\n]+)/);
-                const retweetsMatch = block.match(/Retweets: ([^\n]+)/);
-                const likesMatch = block.match(/Likes: ([^\n]+)/);
-                const savesMatch = block.match(/Saves: ([^\n]+)/);
-                const imageUrlMatch = block.match(/Image URL: ([^\n]+)/);
-                const textMatch = block.match(/Text: ([\s\S]+)$/);
-                
-                // Extract values or use defaults
-                const username = usernameMatch ? usernameMatch[1] : 'Unknown';
-                const post_url = urlMatch ? urlMatch[1] : '';
-                const posted_at = postedAtMatch ? (postedAtMatch[1] !== 'None' ? postedAtMatch[1] : null) : null;
-                const scraped_at = scrapedAtMatch ? scrapedAtMatch[1] : '';
-                const views = viewsMatch && viewsMatch[1] !== 'None' ? parseInt(viewsMatch[1].replace(/,/g, '')) : null;
-                const comments = commentsMatch && commentsMatch[1] !== 'None' ? parseInt(commentsMatch[1].replace(/,/g, '')) : null;
-                const retweets = retweetsMatch && retweetsMatch[1] !== 'None' ? parseInt(retweetsMatch[1].replace(/,/g, '')) : null;
-                const likes = likesMatch && likesMatch[1] !== 'None' ? parseInt(likesMatch[1].replace(/,/g, '')) : null;
-                const saves = savesMatch && savesMatch[1] !== 'None' ? parseInt(savesMatch[1].replace(/,/g, '')) : null;
-                const image_url = imageUrlMatch && imageUrlMatch[1] !== 'None' ? imageUrlMatch[1] : null;
-                const post_text = textMatch ? textMatch[1].trim() : '';
-                
-                // Check for keywords
-                let keywords = [];
-                const keywordsMatch = block.match(/Keywords: ([^\n]+)/);
-                if (keywordsMatch && keywordsMatch[1] !== 'None') {
-                    try {
-                        // Try to parse JSON if it's in JSON format
-                        if (keywordsMatch[1].startsWith('```json') && keywordsMatch[1].endsWith('```')) {
-                            const jsonStr = keywordsMatch[1].replace(/```json\n|\n```/g, '');
-                            keywords = JSON.parse(jsonStr);
-                        } else {
-                            // Otherwise split by commas
-                            keywords = keywordsMatch[1].split(',').map(k => k.trim());
-                        }
-                    } catch (e) {
-                        console.error('Error parsing keywords:', e);
-                    }
-                }
-                
-                // Determine platform from URL
-                let platform = 'unknown';
-                if (post_url.includes('twitter.com') || post_url.includes('x.com')) {
-                    platform = 'twitter';
-                } else if (post_url.includes('instagram.com')) {
-                    platform = 'instagram';
-                } else if (post_url.includes('facebook.com')) {
-                    platform = 'facebook';
-                }
-                
-                // Add the post to the array
-                posts.push({
-                    id,
-                    username,
-                    post_url,
-                    posted_at,
-                    scraped_at,
-                    keywords,
-                    post_text,
-                    views,
-                    comments,
-                    retweets,
-                    likes,
-                    saves,
-                    image_url,
-                    platform,
-                    userInteraction: 0,
-                    rank: 50
-                });
-            } catch (error) {
-                console.error('Error parsing post block:', error);
-            }
-        }
-    }
-    
-    return posts;
-}
-
 // Schedule automatic scraping based on user settings
 function scheduleAutomaticScraping() {
     // Check if we have user settings
@@ -855,70 +633,33 @@ function scheduleAutomaticScraping() {
     global.scrapingInterval = setInterval(() => {
         console.log(`Running scheduled scraping (${scrapingFrequency})`);
         
-        // Build the command
-        const command = `cd "${path.join(__dirname, '..')}" && python ${path.join(__dirname, '..', 'core', 'social_media_scraper.py')} --count=${postCount || 10}`;
-        
-        // Execute the command
-        exec(command, (error, stdout, stderr) => {
-            if (error) {
-                console.error(`Error executing scheduled scraping: ${error.message}`);
-                return;
-            }
-            
-            if (stderr) {
-                console.error(`Scheduled scraping stderr: ${stderr}`);
-            }
-            
-            console.log(`Scheduled scraping completed: ${stdout}`);
-            
-            // Generate keywords after scraping
-            if (global.userSettings.autoKeywords) {
-                const keywordsCommand = `cd "${path.join(__dirname, '..')}" && python ${path.join(__dirname, '..', 'core', 'generate_keywords.py')}`;
+        runPythonJob('scrape', { count: postCount || 10 })
+            .then(job => {
+                console.log(`Scheduled scraping finished: ${job.status} (job ${job.id})`);
                 
-                exec(keywordsCommand, (error, stdout, stderr) => {
-                    if (error) {
-                        console.error(`Error generating keywords: ${error.message}`);
-                        return;
-                    }
-                    
-                    console.log(`Keywords generated: ${stdout}`);
+                // Generate keywords after scraping
+                if (!global.userSettings.autoKeywords) {
+                    return;
+                }
+                
+                return runPythonJob('keywords').then(job => {
+                    console.log(`Keyword generation finished: ${job.status} (job ${job.id})`);
                     
                     // Rank posts after generating keywords
                     if (global.userSettings.autoRanking) {
-                        const rankCommand = `python ${path.join(__dirname, '..', 'core', 'ranking_llm.py')}`;
-                        
-                        // Set environment variables to pass the user profile
-                        const env = { ...process.env };
-                        if (global.userProfile) {
-                            env.USER_PROFILE_CONTENT = global.userProfile;
-                        }
-                        
-                        exec(rankCommand, { env }, (error, stdout, stderr) => {
-                            if (error) {
-                                console.error(`Error ranking posts: ${error.message}`);
-                                return;
-                            }
-                            
-                            console.log(`Posts ranked: ${stdout}`);
-                        });
+                        return runPythonJob('rank', { profile: global.userProfile })
+                            .then(job => console.log(`Ranking finished: ${job.status} (job ${job.id})`));
                     }
                 });
-            }
-        });
+            })
+            .catch(error => console.error(`Error in scheduled scraping: ${error.message}`));
     }, intervalMs);
     
     // Also run once immediately
     console.log('Running initial scraping...');
-    const command = `cd "${path.join(__dirname, '..')}" && python ${path.join(__dirname, '..', 'core', 'social_media_scraper.py')} --count=${postCount || 10}`;
-    
-    exec(command, (error, stdout, stderr) => {
-        if (error) {
-            console.error(`Error executing initial scraping: ${error.message}`);
-            return;
-        }
-        
-        console.log(`Initial scraping completed: ${stdout}`);
-    });
+    runPythonJob('scrape', { count: postCount || 10 })
+        .then(job => console.log(`Initial scraping finished: ${job.status} (job ${job.id})`))
+        .catch(error => console.error(`Error executing initial scraping: ${error.message}`));
 }
 
 // Load saved settings on startup
@@ -973,6 +714,9 @@ app.listen(PORT, () => {
     console.log(`Server running on http://localhost:${PORT}`);
     console.log(`Open your browser and navigate to http://localhost:${PORT}/index.html`);
     
+    // Start the Python service before anything calls it
+    startPythonService();
+    
     // Load saved profile, settings, and credentials
     loadSavedProfile();
     loadSavedSettings();